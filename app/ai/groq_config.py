@@ -1,11 +1,34 @@
+"""
+app/ai/groq_config.py
+
+Асинхронный клиент Groq (AsyncGroq) поверх общего httpx-пула с HTTP/2.
+
+Запросы к модели не занимают потоков: сотни ответов генерируются
+одновременно, ожидая сеть в event loop. У каждого запроса — таймаут
+GROQ_TIMEOUT_SEC; отмена корутины (пользователь ушёл, остановка сервиса)
+обрывает запрос.
+Как и клиент Google API, клиент привязан к event loop, поэтому создаётся
+лениво по одному на loop; закрывает их lifespan. Лимит GROQ_MAX_IN_FLIGHT
+тоже свой у каждого loop: в prod (веб-хук) loop один, а в режиме polling
+чаты идут через loop бота, и на него приходится почти вся нагрузка.
+"""
+
 from __future__ import annotations
 
-from typing import Dict, List
+import asyncio
+import threading
+from typing import AsyncIterator, Dict, List, Tuple
 
-import tiktoken
-from groq import Groq
+import httpx
+from groq import AsyncGroq
 
-from app.core.config import GROQ_API_KEY, GROQ_MODEL
+from app.core.config import (
+    GROQ_API_KEY,
+    GROQ_MAX_IN_FLIGHT,
+    GROQ_MODEL,
+    GROQ_RETRIES,
+    GROQ_TIMEOUT_SEC,
+)
 from app.core.logging_config import get_logger
 
 logger = get_logger(__name__)
@@ -14,29 +37,47 @@ logger = get_logger(__name__)
 MAX_MODEL_TOKENS = 131_072
 MAX_OUTPUT_TOKENS = 32_768
 
-client = Groq(api_key=GROQ_API_KEY)
+# HTTP/2 мультиплексирует запросы: сотни ответов идут по паре десятков соединений
+LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=32)
+TIMEOUT = httpx.Timeout(GROQ_TIMEOUT_SEC, connect=10.0)
 
-# fallback-кодировщик (tiktoken ещё не знает про llama-3.3, но cl100k_base даёт точную оценку)
-try:
-    _enc = tiktoken.encoding_for_model(GROQ_MODEL)
-except KeyError:
-    _enc = tiktoken.get_encoding("cl100k_base")
+_clients: Dict[asyncio.AbstractEventLoop, Tuple[AsyncGroq, asyncio.Semaphore]] = {}
+_lock = threading.Lock()
 
-client = Groq(api_key=GROQ_API_KEY)
 
+def _client() -> Tuple[AsyncGroq, asyncio.Semaphore]:
+    """Клиент Groq и лимит одновременных запросов для текущего event loop."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        entry = _clients.get(loop)
+        if entry is None:
+            http = httpx.AsyncClient(http2=True, limits=LIMITS, timeout=TIMEOUT)
+            client = AsyncGroq(
+                api_key=GROQ_API_KEY,
+                http_client=http,
+                timeout=TIMEOUT,
+                max_retries=GROQ_RETRIES,
+            )
+            entry = _clients[loop] = (client, asyncio.Semaphore(GROQ_MAX_IN_FLIGHT))
+            logger.info("🤖 Groq-клиент создан (клиентов: %d)", len(_clients))
+        return entry
 
-def _count_tokens(text: str | List[Dict[str, str]]) -> int:
-    """
-    Быстрая оценка количества токенов (≈ точность ±1 %).
-    • Принимает как строку, так и список messages.
-    """
-    if isinstance(text, str):
-        return len(_enc.encode(text))
-    return sum(_count_tokens(m["content"]) + 4 for m in text) + 2  # роль-токены
+
+async def close_groq_clients() -> None:
+    """Закрывает клиенты всех loop (вызывается при shutdown)."""
+    current = asyncio.get_running_loop()
+    with _lock:
+        clients = list(_clients.items())
+        _clients.clear()
+    for loop, (client, _) in clients:
+        if loop is current:
+            await client.close()
+        elif loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.close(), loop)
 
 
 # ──────────────────────────────────────────────────────────────────────────
-def chat_completion(
+async def chat_completion(
     messages: List[Dict[str, str]],
     max_tokens: int = 1024,
     temperature: float = 0.7,
@@ -49,13 +90,47 @@ def chat_completion(
     и возвращает текст ответа ассистента.
     Поддерживаются только параметры, разрешённые Groq API.
     """
-    resp = client.chat.completions.create(
-        model=GROQ_MODEL,
-        messages=messages,
-        max_tokens=max_tokens,
-        temperature=temperature,
-        top_p=top_p,
-        frequency_penalty=frequency_penalty,
-        presence_penalty=presence_penalty,
-    )
+    client, in_flight = _client()
+    async with in_flight:
+        resp = await client.chat.completions.create(
+            model=GROQ_MODEL,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            frequency_penalty=frequency_penalty,
+            presence_penalty=presence_penalty,
+        )
     return resp.choices[0].message.content.strip()
+
+
+async def chat_completion_stream(
+    messages: List[Dict[str, str]],
+    max_tokens: int = 1024,
+    temperature: float = 0.7,
+    top_p: float = 0.9,
+    frequency_penalty: float = 0.25,
+    presence_penalty: float = 0.0,
+) -> AsyncIterator[str]:
+    """
+    То же, что chat_completion, но отдаёт текст ответа по мере генерации
+    (stream=True). Если генератор закрыть раньше — поток ответа обрывается.
+    """
+    client, in_flight = _client()
+    async with in_flight:
+        stream = await client.chat.completions.create(
+            model=GROQ_MODEL,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            frequency_penalty=frequency_penalty,
+            presence_penalty=presence_penalty,
+            stream=True,
+        )
+        try:
+            async for chunk in stream:
+                if chunk.choices and (delta := chunk.choices[0].delta.content):
+                    yield delta
+        finally:
+            await stream.close()
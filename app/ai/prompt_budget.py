@@ -0,0 +1,125 @@
+"""
+app/ai/prompt_budget.py
+
+Планировщик бюджета токенов промпта.
+
+За один проход решает, какие чанки контекста и какие сообщения истории
+влезут в окно модели: у каждого кандидата есть ценность (релевантность
+чанка, свежесть сообщения) и цена в токенах; берём жадно по ценности на
+токен, пока есть место. Токены чанков приходят из метаданных (посчитаны
+при индексации), сообщения считаются через кэш app/core/tokenizer —
+весь промпт заново не кодируется ни разу.
+
+Системная часть и последнее сообщение пользователя входят всегда;
+выбранные чанки идут в порядке ранга, история — в хронологическом.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import List, NamedTuple, Sequence
+
+from app.core import tokenizer
+from app.core.tokenizer import count_tokens
+
+MSG_OVERHEAD = 4  # служебные токены роли на каждое сообщение
+PRIMING = 2  # токены начала ответа ассистента
+CHUNK_SEP = 2  # «\n\n» между чанками контекста
+CONTEXT_HEADER = "Контекст:\n"
+HISTORY_DECAY = 0.7  # ценность сообщения истории падает с каждым шагом назад
+
+
+class Candidate(NamedTuple):
+    """Чанк контекста: текст, оценка ранжирования, токены из метаданных и id."""
+
+    text: str
+    score: float
+    tokens: int | None = None  # нет у чанков, записанных до подсчёта токенов
+    id: str = ""  # id чанка в базе (хэш текста) — для кэша ответов
+
+
+@dataclass
+class BudgetPlan:
+    chunks: List[str]  # выбранные чанки, в порядке ранга
+    history: List[dict]  # выбранные сообщения, по времени; последнее — вопрос
+    max_tokens: int  # лимит ответа
+    prompt_tokens: int
+    system_tokens: int
+    chunk_tokens: int
+    history_tokens: int
+    chunks_total: int
+    history_total: int
+
+    def describe(self, window: int) -> str:
+        return (
+            f"окно {window}, промпт {self.prompt_tokens} (system {self.system_tokens}, "
+            f"контекст {len(self.chunks)}/{self.chunks_total} чанков "
+            f"{self.chunk_tokens}, история {len(self.history)}/{self.history_total} "
+            f"сообщ. {self.history_tokens}), ответ до {self.max_tokens}, "
+            f"токенизатор {tokenizer.name}"
+        )
+
+
+def plan_prompt(
+    system: str,
+    chunks: Sequence[Candidate],
+    history: Sequence[dict],
+    *,
+    window: int,
+    reserved_out: int,
+    max_output: int,
+) -> BudgetPlan:
+    """
+    Выбирает чанки и историю под окно window, оставляя reserved_out
+    токенов на ответ. history — [{"role", "text"}], последний элемент —
+    текущий вопрос пользователя.
+    """
+    budget = window - reserved_out
+    history = [dict(m, text=m["text"].strip()) for m in history]
+    *older, latest = history or [{"role": "user", "text": ""}]
+
+    # ── обязательная часть: system, заголовок контекста, вопрос ──────────
+    system_tokens = count_tokens(system) + MSG_OVERHEAD
+    if chunks:
+        system_tokens += count_tokens(CONTEXT_HEADER) + CHUNK_SEP
+    latest_tokens = count_tokens(latest["text"]) + MSG_OVERHEAD
+    used = PRIMING + system_tokens + latest_tokens
+    if used > budget:  # край: вопрос сам по себе не влезает — режем его
+        room = max(budget - (used - latest_tokens) - MSG_OVERHEAD, 1)
+        keep = len(latest["text"]) * room // max(latest_tokens, 1)
+        latest = dict(latest, text=latest["text"][:keep] + "…")
+        used -= latest_tokens
+        latest_tokens = count_tokens(latest["text"]) + MSG_OVERHEAD
+        used += latest_tokens
+
+    # ── кандидаты: (ценность на токен, токены, вид, индекс) ─────────────
+    items = []
+    top = max((c.score for c in chunks), default=0.0) or 1.0
+    for i, c in enumerate(chunks):
+        cost = (c.tokens if c.tokens is not None else count_tokens(c.text)) + CHUNK_SEP
+        items.append((c.score / top / cost, cost, "chunk", i))
+    for age, i in enumerate(reversed(range(len(older)))):
+        cost = count_tokens(older[i]["text"]) + MSG_OVERHEAD
+        items.append((HISTORY_DECAY**age / cost, cost, "history", i))
+
+    # ── один жадный проход ───────────────────────────────────────────────
+    chosen = {"chunk": set(), "history": set()}
+    spent = {"chunk": 0, "history": 0}
+    for _, cost, kind, i in sorted(items, key=lambda it: it[0], reverse=True):
+        if used + cost <= budget:
+            used += cost
+            chosen[kind].add(i)
+            spent[kind] += cost
+
+    free = window - used
+    return BudgetPlan(
+        chunks=[c.text for i, c in enumerate(chunks) if i in chosen["chunk"]],
+        history=[m for i, m in enumerate(older) if i in chosen["history"]] + [latest],
+        max_tokens=min(reserved_out, free - 1, max_output),
+        prompt_tokens=used,
+        system_tokens=system_tokens,
+        chunk_tokens=spent["chunk"],
+        history_tokens=spent["history"] + latest_tokens,
+        chunks_total=len(chunks),
+        history_total=len(history),
+    )
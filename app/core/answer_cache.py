@@ -0,0 +1,166 @@
+"""
+app/core/answer_cache.py
+
+Семантический кэш ответов модели.
+
+Ключ — пользователь, отпечаток контекста и вектор вопроса. Отпечаток
+покрывает всё, от чего зависит ответ, кроме самого вопроса: id найденных
+чанков и предыдущие сообщения диалога, попавшие в промпт. Ответ отдаётся
+из кэша, если для того же контекста уже был вопрос с косинусом
+≥ min_similarity («сколько стоит подписка?» ≈ «сколько стоит подписка»).
+Так одинаковые FAQ-вопросы по одним и тем же документам не гоняют
+70B-модель заново, а уточнение вроде «а подробнее?» в другом диалоге
+не получит чужой ответ.
+
+Записи живут ttl секунд, при переполнении вытесняется давно не
+использованная (LRU); при изменении базы пользователя его записи
+сбрасываются (vector_store.invalidate_user).
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Sequence
+
+import numpy as np
+
+from app.core.config import (
+    ANSWER_CACHE_MIN_SIM,
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_TTL_SEC,
+)
+from app.core.embedding_cache import text_digest
+
+
+def context_fingerprint(chunk_ids: Iterable[str], history: Sequence[dict] = ()) -> str:
+    """
+    Отпечаток контекста: id найденных чанков (id — хэш текста, порядок не
+    важен) и предыдущие сообщения промпта {"role", "text"} (порядок важен).
+    """
+    chunks = "\n".join(sorted(chunk_ids))
+    turns = "\n".join(f"{m['role']}:{text_digest(m['text'])}" for m in history)
+    return text_digest(f"{chunks}\0{turns}")
+
+
+@dataclass
+class _Entry:
+    user_id: int
+    context: str
+    vector: np.ndarray
+    answer: str
+    tokens: int  # промпт + ответ — столько экономит каждое попадание
+    expires: float
+
+
+class AnswerCache:
+    """LRU с TTL; поиск — ближайший вопрос среди записей того же контекста."""
+
+    def __init__(self, maxsize: int, ttl: float, min_similarity: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.min_similarity = min_similarity
+        self._data: OrderedDict[int, _Entry] = OrderedDict()
+        self._by_user: Dict[int, Dict[int, _Entry]] = defaultdict(dict)
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.saved_tokens = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    @staticmethod
+    def _unit(vector: Sequence[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        return v / max(float(np.linalg.norm(v)), 1e-12)
+
+    def _best(self, user_id: int, context: str, v: np.ndarray) -> tuple[int, float]:
+        """Ближайшая живая запись пользователя с тем же контекстом: (id, косинус)."""
+        now = time.monotonic()
+        best_id, best_sim = -1, -1.0
+        for entry_id, e in list(self._by_user.get(user_id, {}).items()):
+            if e.expires < now:
+                self._remove(entry_id)
+                continue
+            if e.context != context:
+                continue
+            sim = float(e.vector @ v)
+            if sim > best_sim:
+                best_id, best_sim = entry_id, sim
+        return best_id, best_sim
+
+    def _remove(self, entry_id: int) -> None:
+        e = self._data.pop(entry_id, None)
+        if e is not None:
+            user = self._by_user.get(e.user_id)
+            if user is not None:
+                user.pop(entry_id, None)
+                if not user:
+                    del self._by_user[e.user_id]
+
+    def get(self, user_id: int, context: str, vector: Sequence[float]) -> str | None:
+        if not self.enabled:
+            return None
+        v = self._unit(vector)
+        with self._lock:
+            entry_id, sim = self._best(user_id, context, v)
+            if entry_id < 0 or sim < self.min_similarity:
+                self.misses += 1
+                return None
+            self._data.move_to_end(entry_id)
+            entry = self._data[entry_id]
+            self.hits += 1
+            self.saved_tokens += entry.tokens
+            return entry.answer
+
+    def put(
+        self,
+        user_id: int,
+        context: str,
+        vector: Sequence[float],
+        answer: str,
+        tokens: int,
+    ) -> None:
+        if not self.enabled:
+            return
+        v = self._unit(vector)
+        with self._lock:
+            entry_id, sim = self._best(user_id, context, v)
+            if entry_id >= 0 and sim >= self.min_similarity:
+                self._remove(entry_id)  # тот же вопрос — заменяем ответ
+            entry_id, self._next_id = self._next_id, self._next_id + 1
+            entry = _Entry(
+                user_id, context, v, answer, tokens, time.monotonic() + self.ttl
+            )
+            self._data[entry_id] = entry
+            self._by_user[user_id][entry_id] = entry
+            while len(self._data) > self.maxsize:
+                self._remove(next(iter(self._data)))
+
+    def drop_user(self, user_id: int) -> None:
+        """База пользователя изменилась — его ответы больше не верны."""
+        with self._lock:
+            for entry_id in list(self._by_user.get(user_id, {})):
+                self._remove(entry_id)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "saved_tokens": self.saved_tokens,
+        }
+
+
+answer_cache = AnswerCache(
+    ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL_SEC, ANSWER_CACHE_MIN_SIM
+)
@@ -0,0 +1,46 @@
+"""
+app/core/chunking.py
+
+Нарезка текста файлов на чанки. Модуль лёгкий (без Chroma и модели),
+поэтому его импортируют и процессы разбора документов (extraction).
+"""
+
+from dataclasses import dataclass
+from typing import Iterable, List, Tuple
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+
+
+@dataclass
+class FileChunks:
+    """Нарезанный на чанки файл, готовый к записи в базу."""
+
+    file_id: str
+    file_name: str
+    user_id: int
+    chunks: List[Tuple[str, str]]  # (текст, источник: страница, лист, абзацы)
+    text_bytes: int  # объём извлечённого текста
+
+
+def split_segments(
+    file_id: str,
+    file_name: str,
+    user_id: int,
+    segments: Iterable[Tuple[str, str]],
+) -> FileChunks:
+    """
+    Режет файл на чанки по мере чтения: segments — (текст, источник) от
+    читателя (страница PDF, лист таблицы, блок абзацев). Весь текст файла
+    в одну строку не склеивается, в памяти — текущий сегмент и чанки.
+    Заголовок с именем файла идёт перед первым сегментом.
+    """
+    header = f"=== FILE: {file_name.lower()} ===\n"
+    chunks: List[Tuple[str, str]] = []
+    size = 0
+    for text, source in segments:
+        size += len(text.encode("utf-8"))
+        chunks.extend((c, source) for c in splitter.split_text(header + text))
+        header = ""
+    return FileChunks(file_id, file_name, user_id, chunks, size)
@@ -20,17 +20,114 @@ USE_POLLING = os.getenv("USE_POLLING", "1").lower() in ("1", "true")
 # Домен редиректа для OAuth
 REDIRECT_DOMAIN = os.getenv("REDIRECT_DOMAIN", "localhost:8000")
 
+# потоковый ответ: не чаще одной правки сообщения за столько секунд
+TG_EDIT_INTERVAL_SEC = float(os.getenv("TG_EDIT_INTERVAL_SEC", "1.0"))
+
 # ─── База данных ──────────────────────────────────────────────────────────────
 DATABASE_URL = os.getenv("DATABASE_URL_LOCAL")
 
 # ─── Groq Cloud ───────────────────────────────────────────────────────────────
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")  # берём ключ из .env
 GROQ_MODEL = "llama-3.3-70b-versatile"  # фиксируем модель
+# токенизатор Llama 3 (tokenizer.json с Hugging Face) для бюджета промпта;
+# недоступен (офлайн) — cl100k_base из tiktoken; грузится в фоне при старте
+LLAMA_TOKENIZER = os.getenv("LLAMA_TOKENIZER", "NousResearch/Meta-Llama-3-8B")
+GROQ_TIMEOUT_SEC = float(os.getenv("GROQ_TIMEOUT_SEC", "60"))  # на один ответ
+GROQ_RETRIES = int(os.getenv("GROQ_RETRIES", "2"))  # повторы SDK на 429/5xx
+# одновременных запросов к Groq на event loop (остальные ждут в очереди)
+GROQ_MAX_IN_FLIGHT = int(os.getenv("GROQ_MAX_IN_FLIGHT", "256"))
 
 # ─── Redis и локальные каталоги ───────────────────────────────────────────────
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
 CHROMA_DIR = BASE_DIR / "data" / "chroma"
 EMBEDDING_DIR = BASE_DIR / "models" / "embeding_model"
+# старые JSON-манифесты отпечатков Drive; переносятся в таблицу indexed_file
+SYNC_MANIFEST_DIR = CHROMA_DIR.parent / "sync_manifest"
+
+# ─── Google Drive ─────────────────────────────────────────────────────────────
+# одновременных скачиваний: всего по процессу и на одного пользователя
+DRIVE_GLOBAL_CONCURRENCY = int(os.getenv("DRIVE_GLOBAL_CONCURRENCY", "16"))
+DRIVE_USER_CONCURRENCY = int(os.getenv("DRIVE_USER_CONCURRENCY", "4"))
+DRIVE_FILE_TIMEOUT_SEC = float(os.getenv("DRIVE_FILE_TIMEOUT_SEC", "60"))
+DRIVE_RETRIES = int(os.getenv("DRIVE_RETRIES", "3"))  # повторы на 429/5xx и сбои сети
+# лимит размера файла по формату, КБ (MAX_FILE_SIZE_PDF_KB и т.д.): читатели
+# отдают текст по страницам/листам/блокам абзацев, весь файл строкой не собирается
+MAX_FILE_SIZE_KB = {
+    fmt: int(os.getenv(f"MAX_FILE_SIZE_{fmt.upper()}_KB", default))
+    for fmt, default in {
+        "txt": "2048",
+        "csv": "2048",
+        "docx": "10240",
+        "pdf": "20480",
+        "xlsx": "5120",
+    }.items()
+}
+
+# ─── Разбор документов ────────────────────────────────────────────────────────
+# парсинг PDF/DOCX/таблиц в пуле процессов (0 — в пуле потоков, как раньше)
+EXTRACT_IN_PROCESS = os.getenv("EXTRACT_IN_PROCESS", "1").lower() in ("1", "true")
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "0"))  # 0 — по числу ядер
+EXTRACT_CPU_LIMIT_SEC = int(os.getenv("EXTRACT_CPU_LIMIT_SEC", "30"))  # на файл
+# строк таблиц на файл (CSV, все листы XLSX вместе); 0 — без лимита
+MAX_TABLE_ROWS = int(os.getenv("MAX_TABLE_ROWS", "5000"))
+# задержка event loop, после которой пишем предупреждение в лог
+LOOP_LAG_WARN_MS = float(os.getenv("LOOP_LAG_WARN_MS", "200"))
+
+# ─── Векторное хранилище ──────────────────────────────────────────────────────
+# shared — одна коллекция на всех (фильтр по user_id);
+# user   — своя коллекция у каждого пользователя;
+# bucket — коллекция на группу пользователей (user_id % VECTOR_PARTITION_BUCKETS)
+VECTOR_PARTITION = os.getenv("VECTOR_PARTITION", "shared").lower()
+VECTOR_PARTITION_BUCKETS = int(os.getenv("VECTOR_PARTITION_BUCKETS", "64"))
+# chroma — Chroma (SQLite + HNSW); mmap — квантованные векторы в memory-mapped файлах
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+MMAP_DIR = CHROMA_DIR.parent / "mmap"
+MMAP_DTYPE = os.getenv("MMAP_DTYPE", "int8")  # int8 | float16
+MMAP_SEARCH = os.getenv("MMAP_SEARCH", "exact")  # exact | coarse (грубо → пересчёт)
+
+# ─── Эмбеддинги ───────────────────────────────────────────────────────────────
+EMBEDDING_MODEL = "intfloat/multilingual-e5-base"
+# реализация модели на CPU: torch (эталон) | int8 (динамическая квантизация) | onnx
+EMBEDDER_BACKEND = os.getenv("EMBEDDER_BACKEND", "torch")
+# потоков на инференс модели (0 — как решит torch/onnxruntime)
+EMBEDDER_THREADS = int(os.getenv("EMBEDDER_THREADS", "0"))
+# прогревать модель в фоне при старте (иначе — загрузка при первом запросе)
+EMBEDDER_WARMUP = os.getenv("EMBEDDER_WARMUP", "1").lower() in ("1", "true")
+# выгружать модель после стольких секунд простоя (0 — никогда)
+EMBEDDER_IDLE_UNLOAD_SEC = int(os.getenv("EMBEDDER_IDLE_UNLOAD_SEC", "0"))
+# размер батча для прогона модели при индексации (чанки всех файлов/пользователей)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# сколько ждать «попутчиков» из параллельных загрузок, прежде чем запускать неполный батч
+EMBED_BATCH_WAIT_MS = int(os.getenv("EMBED_BATCH_WAIT_MS", "50"))
+# микробатчи запросов чата: одновременные search_knowledge делят один прогон модели
+QUERY_BATCH_SIZE = int(os.getenv("QUERY_BATCH_SIZE", "16"))
+QUERY_BATCH_WAIT_MS = int(os.getenv("QUERY_BATCH_WAIT_MS", "5"))
+# кэш эмбеддингов чанков (ключ — хэш текста + имя модели), лежит рядом с Chroma
+EMBED_CACHE_PATH = CHROMA_DIR.parent / "embed_cache.sqlite3"
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "200000"))
+
+# ─── Кэши поиска ──────────────────────────────────────────────────────────────
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))  # эмбеддинги запросов
+QUERY_CACHE_TTL_SEC = int(os.getenv("QUERY_CACHE_TTL_SEC", "3600"))
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))  # выдача поиска
+RETRIEVAL_CACHE_TTL_SEC = int(os.getenv("RETRIEVAL_CACHE_TTL_SEC", "600"))
+# перевод русских запросов на английский для второго векторного поиска:
+#   off      — не переводим (e5 мультиязычная, вопрос и так находит en-тексты);
+#   parallel — перевод ждём не дольше TRANSLATION_WAIT_MS, иначе ищем без него;
+#              опоздавший перевод всё равно ляжет в кэш для повторного вопроса;
+#   blocking — сначала перевод, потом поиск (прежнее поведение, для сравнения)
+QUERY_TRANSLATION = os.getenv("QUERY_TRANSLATION", "parallel").lower()
+TRANSLATION_WAIT_MS = int(os.getenv("TRANSLATION_WAIT_MS", "250"))
+TRANSLATION_CACHE_SIZE = int(os.getenv("TRANSLATION_CACHE_SIZE", "2048"))
+TRANSLATION_CACHE_TTL_SEC = int(os.getenv("TRANSLATION_CACHE_TTL_SEC", "86400"))
+# ответы модели: тот же (почти) вопрос при том же найденном контексте;
+# ANSWER_CACHE_SIZE=0 — кэш выключен
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2048"))
+ANSWER_CACHE_TTL_SEC = int(os.getenv("ANSWER_CACHE_TTL_SEC", "21600"))
+ANSWER_CACHE_MIN_SIM = float(os.getenv("ANSWER_CACHE_MIN_SIM", "0.95"))  # косинус
+# BM25-индексы пользователей: каталог и сколько индексов держать в памяти
+LEXICAL_DIR = CHROMA_DIR.parent / "lexical"
+LEXICAL_CACHE_USERS = int(os.getenv("LEXICAL_CACHE_USERS", "256"))
 
 # ─── Валидация критичных переменных ───────────────────────────────────────────
 if not BOT_TOKEN:
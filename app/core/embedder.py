@@ -0,0 +1,322 @@
+"""
+app/core/embedder.py
+
+Движок эмбеддингов на CPU с выбором реализации при старте.
+
+Бэкенды (EMBEDDER_BACKEND) считают одну и ту же модель e5:
+  * torch — sentence-transformers как есть (эталон);
+  * int8  — та же модель с динамической int8-квантизацией Linear-слоёв
+            (torch.quantization), без дополнительных зависимостей;
+  * onnx  — модель, экспортированная в ONNX (optimum + onnxruntime);
+            экспорт выполняется один раз и кэшируется в EMBEDDING_DIR/onnx.
+Все бэкенды делают mean pooling + L2-нормировку, как пайплайн e5 в
+sentence-transformers, поэтому векторы совместимы с уже сохранёнными.
+Сверка с эталоном: python -m scripts.embedder_parity.
+
+LazyEmbedder откладывает загрузку модели до первого вызова или явного
+прогрева (warmup в lifespan) и может выгрузить её после простоя.
+"""
+
+from __future__ import annotations
+
+import gc
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, Protocol, Sequence
+
+import numpy as np
+
+from app.core.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+BACKENDS = ("torch", "int8", "onnx")
+
+
+class Embedder(Protocol):
+    """Минимальный интерфейс, который нужен vector_store и батчеру."""
+
+    name: str  # модель + бэкенд; входит в ключ кэша эмбеддингов
+
+    def embed_documents(self, texts: Sequence[str]) -> List[List[float]]: ...
+
+    def embed_query(self, text: str) -> List[float]: ...
+
+
+def embedder_name(model_name: str, backend: str) -> str:
+    """Имя эмбеддера (модель@бэкенд) — известно до загрузки модели."""
+    return f"{model_name}@{backend}"
+
+
+def _set_torch_threads(threads: int) -> None:
+    if threads > 0:
+        import torch
+
+        torch.set_num_threads(threads)
+
+
+# ─── PyTorch (sentence-transformers) ─────────────────────────────────────────
+class TorchEmbedder:
+    """sentence-transformers на CPU; quantize=True — динамический int8."""
+
+    def __init__(
+        self,
+        model_name: str,
+        cache_dir: Path,
+        *,
+        batch_size: int,
+        threads: int = 0,
+        quantize: bool = False,
+    ) -> None:
+        from sentence_transformers import SentenceTransformer
+
+        _set_torch_threads(threads)
+        self.model = SentenceTransformer(
+            model_name, cache_folder=str(cache_dir), device="cpu"
+        )
+        if quantize:
+            import torch
+
+            # квантуем только трансформер: Linear-слои → int8 с весами
+            # в int8 и динамическим масштабом активаций
+            self.model[0].auto_model = torch.quantization.quantize_dynamic(
+                self.model[0].auto_model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        self.batch_size = batch_size
+        self.name = embedder_name(model_name, "int8" if quantize else "torch")
+
+    def embed_documents(self, texts: Sequence[str]) -> List[List[float]]:
+        vecs = self.model.encode(
+            list(texts),
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        )
+        return vecs.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+# ─── ONNX Runtime ────────────────────────────────────────────────────────────
+class OnnxEmbedder:
+    """Экспортированная в ONNX модель + токенизатор HF, pooling в numpy."""
+
+    MAX_LENGTH = 512  # как max_seq_length у e5 в sentence-transformers
+
+    def __init__(
+        self, model_name: str, cache_dir: Path, *, batch_size: int, threads: int = 0
+    ) -> None:
+        try:
+            import onnxruntime as ort
+            from optimum.onnxruntime import ORTModelForFeatureExtraction
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise RuntimeError(
+                "EMBEDDER_BACKEND=onnx требует пакеты optimum[onnxruntime]"
+            ) from e
+
+        onnx_dir = cache_dir / "onnx" / model_name.replace("/", "__")
+        opts = ort.SessionOptions()
+        if threads > 0:
+            opts.intra_op_num_threads = threads
+            opts.inter_op_num_threads = 1
+
+        if (onnx_dir / "model.onnx").exists():
+            model = ORTModelForFeatureExtraction.from_pretrained(
+                onnx_dir, session_options=opts
+            )
+            tokenizer = AutoTokenizer.from_pretrained(onnx_dir)
+        else:
+            logger.info("📦 Экспорт %s в ONNX → %s", model_name, onnx_dir)
+            started = time.perf_counter()
+            model = ORTModelForFeatureExtraction.from_pretrained(
+                model_name, export=True, cache_dir=str(cache_dir), session_options=opts
+            )
+            tokenizer = AutoTokenizer.from_pretrained(
+                model_name, cache_dir=str(cache_dir)
+            )
+            model.save_pretrained(onnx_dir)
+            tokenizer.save_pretrained(onnx_dir)
+            logger.info(
+                "✅ ONNX-экспорт готов за %.1f с", time.perf_counter() - started
+            )
+
+        self.model = model
+        self.tokenizer = tokenizer
+        self.batch_size = batch_size
+        self.name = embedder_name(model_name, "onnx")
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        enc = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.MAX_LENGTH,
+            return_tensors="np",
+        )
+        hidden = self.model(**enc).last_hidden_state  # (batch, seq, dim)
+        hidden = np.asarray(hidden, dtype=np.float32)
+        mask = enc["attention_mask"][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.linalg.norm(pooled, axis=1, keepdims=True).clip(1e-12)
+
+    def embed_documents(self, texts: Sequence[str]) -> List[List[float]]:
+        texts = list(texts)
+        # сортировка по длине — меньше паддинга внутри батча
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        out: List[List[float]] = [[] for _ in texts]
+        for lo in range(0, len(order), self.batch_size):
+            idx = order[lo : lo + self.batch_size]
+            for i, vec in zip(idx, self._encode([texts[i] for i in idx])):
+                out[i] = vec.tolist()
+        return out
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+
+def build_embedder(
+    backend: str, model_name: str, cache_dir: Path, *, batch_size: int, threads: int
+) -> Embedder:
+    """Создаёт эмбеддер выбранного бэкенда."""
+    if backend not in BACKENDS:
+        raise ValueError(
+            f"Неизвестный EMBEDDER_BACKEND={backend!r}, ожидается {BACKENDS}"
+        )
+
+    started = time.perf_counter()
+    if backend == "onnx":
+        embedder: Embedder = OnnxEmbedder(
+            model_name, cache_dir, batch_size=batch_size, threads=threads
+        )
+    else:
+        embedder = TorchEmbedder(
+            model_name,
+            cache_dir,
+            batch_size=batch_size,
+            threads=threads,
+            quantize=backend == "int8",
+        )
+    logger.info(
+        "🧠 Эмбеддер %s загружен за %.1f с (потоков: %s)",
+        embedder.name,
+        time.perf_counter() - started,
+        threads or "по умолчанию",
+    )
+    return embedder
+
+
+# ─── ленивая загрузка и выгрузка ─────────────────────────────────────────────
+class LazyEmbedder:
+    """
+    Обёртка с тем же интерфейсом: модель создаётся factory() при первом
+    вызове или в warmup(); при idle_unload_sec > 0 фоновый поток выгружает
+    её после простоя, следующий вызов загрузит снова.
+    """
+
+    def __init__(
+        self, factory: Callable[[], Embedder], name: str, idle_unload_sec: float = 0
+    ) -> None:
+        self._factory = factory
+        self.name = name
+        self.idle_unload_sec = idle_unload_sec
+
+        self._model: Embedder | None = None
+        self._lock = threading.Lock()  # загрузка/выгрузка и счётчик вызовов
+        self._active = 0  # вызовов модели прямо сейчас — их не прерываем выгрузкой
+        self._last_used = time.monotonic()
+        self._watcher: threading.Thread | None = None
+
+        self.warm = False  # модель загружена и хотя бы раз отработала
+        self.loads = 0
+        self.unloads = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    # ── загрузка / выгрузка ──────────────────────────────────────────────
+    def _acquire(self) -> Embedder:
+        with self._lock:
+            if self._model is None:
+                self._model = self._factory()
+                self.loads += 1
+                self._start_watcher()
+            self._active += 1
+            return self._model
+
+    def _release(self) -> None:
+        with self._lock:
+            self._active -= 1
+            self._last_used = time.monotonic()
+
+    def warmup(self) -> None:
+        """Загружает модель и прогоняет пробный запрос (первый вызов самый медленный)."""
+        started = time.perf_counter()
+        model = self._acquire()
+        try:
+            model.embed_query("warmup")
+        finally:
+            self._release()
+        self.warm = True
+        logger.info(
+            "🔥 Эмбеддер %s прогрет за %.1f с", self.name, time.perf_counter() - started
+        )
+
+    def unload(self) -> bool:
+        """Выгружает модель, если она сейчас не занята. True — выгрузили."""
+        with self._lock:
+            if self._model is None or self._active:
+                return False
+            self._model = None
+            self.unloads += 1
+        gc.collect()  # веса держатся циклическими ссылками модели
+        return True
+
+    def _start_watcher(self) -> None:
+        if self.idle_unload_sec <= 0 or (self._watcher and self._watcher.is_alive()):
+            return
+        self._watcher = threading.Thread(
+            target=self._watch, name="embedder-idle", daemon=True
+        )
+        self._watcher.start()
+
+    def _watch(self) -> None:
+        period = min(60.0, self.idle_unload_sec / 4)
+        while self._model is not None:
+            time.sleep(period)
+            idle = time.monotonic() - self._last_used
+            if idle >= self.idle_unload_sec and self.unload():
+                logger.info(
+                    "💤 Эмбеддер %s выгружен после %.0f с простоя", self.name, idle
+                )
+
+    # ── интерфейс Embedder ───────────────────────────────────────────────
+    def embed_documents(self, texts: Sequence[str]) -> List[List[float]]:
+        model = self._acquire()
+        try:
+            vectors = model.embed_documents(texts)
+        finally:
+            self._release()
+        self.warm = True  # без EMBEDDER_WARMUP прогревом служит первый вызов
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        model = self._acquire()
+        try:
+            vector = model.embed_query(text)
+        finally:
+            self._release()
+        self.warm = True
+        return vector
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "loaded": self.loaded,
+            "warm": self.warm,
+            "loads": self.loads,
+            "unloads": self.unloads,
+        }
@@ -0,0 +1,190 @@
+"""
+app/core/embedding_batcher.py
+
+Сборщик батчей для эмбеддинг-модели.
+
+Вызывающие стороны (загрузки разных пользователей, разные файлы) сдают
+списки текстов через submit(), а единственный рабочий поток склеивает их
+в батчи фиксированного размера и прогоняет модель. Каждый вызов получает
+concurrent.futures.Future со своими векторами — его можно ждать как из
+обычного потока, так и из любого event loop (asyncio.wrap_future).
+
+Используется дважды: для индексации (большие батчи, ожидание десятки мс)
+и для запросов чата (маленькие батчи, ожидание единицы мс). Для каждого
+вызова замеряется время от submit() до результата — p50/p99 в stats().
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, List, Sequence
+
+from app.core.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+Vector = List[float]
+
+
+@dataclass
+class _Job:
+    texts: Sequence[str]
+    future: Future
+    vectors: List[Vector | None] = field(default_factory=list)
+    offset: int = 0  # сколько текстов уже отдано в батчи
+    done: int = 0  # сколько векторов уже получено
+    submitted: float = field(default_factory=time.monotonic)
+
+    def __post_init__(self) -> None:
+        self.vectors = [None] * len(self.texts)
+
+
+class EmbeddingBatcher:
+    """Очередь текстов → фиксированные батчи → один поток с моделью."""
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], List[Vector]],
+        *,
+        batch_size: int,
+        max_wait_ms: int,
+        name: str = "embed",
+    ) -> None:
+        self._embed_fn = embed_fn
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+
+        self._jobs: deque[_Job] = deque()
+        self._pending = 0  # текстов в очереди, ещё не отданных в батч
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+        # статистика: сколько текстов прогнано и сколько секунд работала модель
+        self.texts_total = 0
+        self.batches_total = 0
+        self.busy_seconds = 0.0
+        # время ожидания результата последних вызовов, секунды
+        self._latencies: deque[float] = deque(maxlen=2048)
+
+    # ── публичный API ────────────────────────────────────────────────────
+    def submit(self, texts: Sequence[str]) -> Future:
+        """Ставит тексты в очередь; Future вернёт векторы в том же порядке."""
+        fut: Future = Future()
+        if not texts:
+            fut.set_result([])
+            return fut
+
+        with self._cond:
+            self._ensure_worker()
+            self._jobs.append(_Job(texts=texts, future=fut))
+            self._pending += len(texts)
+            self._cond.notify()
+        return fut
+
+    def throughput(self) -> float:
+        """Средняя скорость модели за процесс, текстов/с."""
+        return self.texts_total / self.busy_seconds if self.busy_seconds else 0.0
+
+    def latency_ms(self, q: float) -> float:
+        """Перцентиль q (0..100) времени submit → результат по последним вызовам."""
+        data = sorted(self._latencies)
+        if not data:
+            return 0.0
+        return data[min(len(data) - 1, math.ceil(q / 100 * len(data)) - 1)] * 1000
+
+    def stats(self) -> dict:
+        return {
+            "texts": self.texts_total,
+            "batches": self.batches_total,
+            "avg_batch": (
+                round(self.texts_total / self.batches_total, 1)
+                if self.batches_total
+                else 0.0
+            ),
+            "texts_per_sec": round(self.throughput(), 1),
+            "p50_ms": round(self.latency_ms(50), 2),
+            "p99_ms": round(self.latency_ms(99), 2),
+        }
+
+    # ── рабочий поток ────────────────────────────────────────────────────
+    def _ensure_worker(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name=f"{self.name}-batcher", daemon=True
+            )
+            self._thread.start()
+
+    def _take_batch(self) -> list[tuple[_Job, int, int]]:
+        """Ждёт полный батч (или таймаут) и вырезает его из очереди."""
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+
+            # даём параллельным загрузкам «доложить» тексты до полного батча
+            deadline = time.monotonic() + self.max_wait
+            while self._pending < self.batch_size:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self._cond.wait(left)
+
+            slices: list[tuple[_Job, int, int]] = []
+            room = self.batch_size
+            for job in self._jobs:
+                if not room:
+                    break
+                if job.future.done():  # упал в прошлом батче — остаток не считаем
+                    self._pending -= len(job.texts) - job.offset
+                    job.offset = len(job.texts)
+                    continue
+                take = min(room, len(job.texts) - job.offset)
+                if take <= 0:
+                    continue
+                slices.append((job, job.offset, job.offset + take))
+                job.offset += take
+                room -= take
+
+            self._pending -= self.batch_size - room
+            while self._jobs and self._jobs[0].offset == len(self._jobs[0].texts):
+                self._jobs.popleft()
+            return slices
+
+    def _run(self) -> None:
+        while True:
+            slices = self._take_batch()
+            if not slices:
+                continue
+            batch = [t for job, lo, hi in slices for t in job.texts[lo:hi]]
+
+            started = time.perf_counter()
+            try:
+                vectors = self._embed_fn(batch)
+            except Exception as e:
+                logger.exception("❌ %s: ошибка эмбеддинга батча", self.name)
+                for job, _, _ in slices:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - started
+
+            self.texts_total += len(batch)
+            self.batches_total += 1
+            self.busy_seconds += elapsed
+
+            pos = 0
+            for job, lo, hi in slices:
+                if job.future.done():  # упал в одном из прошлых батчей
+                    pos += hi - lo
+                    continue
+                job.vectors[lo:hi] = vectors[pos : pos + hi - lo]
+                pos += hi - lo
+                job.done += hi - lo
+                if job.done == len(job.texts):
+                    self._latencies.append(time.monotonic() - job.submitted)
+                    job.future.set_result(job.vectors)
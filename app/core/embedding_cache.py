@@ -0,0 +1,133 @@
+"""
+app/core/embedding_cache.py
+
+Постоянный кэш эмбеддингов чанков.
+
+Ключ — sha256(имя модели + текст чанка), значение — вектор float32.
+Хранится в SQLite рядом с каталогом Chroma; при превышении лимита
+вытесняются записи, которые дольше всех не использовались.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from app.core.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+def text_digest(text: str) -> str:
+    """sha256 текста чанка (hex) — основа для ID чанков и ключей кэша."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite-кэш «хэш текста → вектор» с вытеснением по давности использования."""
+
+    def __init__(self, path: Path | str, model_name: str, max_entries: int) -> None:
+        self.path = Path(path)
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+
+        self.hits = 0
+        self.misses = 0
+
+    # ── подключение ──────────────────────────────────────────────────────
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY,"
+                " vector BLOB NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_embeddings_last_used"
+                " ON embeddings(last_used)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    # ── чтение / запись ──────────────────────────────────────────────────
+    def get_many(self, texts: Sequence[str]) -> Dict[str, List[float]]:
+        """Возвращает {текст: вектор} для тех текстов, что уже есть в кэше."""
+        if not texts:
+            return {}
+        by_key = {self.key(t): t for t in texts}
+        found: Dict[str, List[float]] = {}
+
+        with self._lock:
+            conn = self._db()
+            keys = list(by_key)
+            for lo in range(0, len(keys), 500):  # лимит параметров SQLite
+                part = keys[lo : lo + 500]
+                rows = conn.execute(
+                    f"SELECT key, vector FROM embeddings"
+                    f" WHERE key IN ({','.join('?' * len(part))})",
+                    part,
+                ).fetchall()
+                for key, blob in rows:
+                    vec = array("f")
+                    vec.frombytes(blob)
+                    found[by_key[key]] = vec.tolist()
+
+            if found:
+                now = time.time()
+                conn.executemany(
+                    "UPDATE embeddings SET last_used=? WHERE key=?",
+                    [(now, self.key(t)) for t in found],
+                )
+                conn.commit()
+
+        self.hits += len(found)
+        self.misses += len(by_key) - len(found)
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, Sequence[float]]]) -> None:
+        now = time.time()
+        rows = [(self.key(t), array("f", v).tobytes(), now) for t, v in items]
+        if not rows:
+            return
+        with self._lock:
+            conn = self._db()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings(key, vector, last_used)"
+                " VALUES (?, ?, ?)",
+                rows,
+            )
+            self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Удаляет самые давно использованные записи сверх лимита (с запасом 10 %)."""
+        (count,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if count <= self.max_entries:
+            return
+        drop = count - int(self.max_entries * 0.9)
+        conn.execute(
+            "DELETE FROM embeddings WHERE key IN ("
+            " SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (drop,),
+        )
+        logger.info("🧹 Кэш эмбеддингов: вытеснено %d записей", drop)
@@ -0,0 +1,101 @@
+"""
+app/core/file_catalog.py
+
+Каталог проиндексированных файлов пользователя (таблица indexed_file).
+
+Отвечает на вопросы «какие файлы у пользователя», «сколько их» и «что
+удалять» одним запросом по числу файлов, а не сканом метаданных всех
+чанков в векторной базе. Обновляется путями записи и удаления
+(store_documents_async, /clear_knowledge).
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import delete
+from sqlmodel import select
+
+from app.core.db import get_session
+from app.models.indexed_file import IndexedFile
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+async def user_files(user_id: int) -> List[IndexedFile]:
+    """Файлы пользователя, отсортированные по имени."""
+    async with get_session() as session:
+        rows = await session.scalars(
+            select(IndexedFile)
+            .where(IndexedFile.telegram_id == user_id)
+            .order_by(IndexedFile.file_name)
+        )
+        return list(rows)
+
+
+async def save_files(
+    user_id: int, files: Iterable[Tuple[str, str, int, int, bool]]
+) -> None:
+    """
+    Записывает (file_id, имя, чанков, байт, изменён) после индексации.
+    Отпечаток сохраняется; indexed_at обновляется только у изменённых файлов.
+    """
+    files = list(files)
+    if not files:
+        return
+    async with get_session() as session:
+        existing = {
+            f.file_id: f
+            for f in await session.scalars(
+                select(IndexedFile).where(
+                    IndexedFile.telegram_id == user_id,
+                    IndexedFile.file_id.in_([f[0] for f in files]),
+                )
+            )
+        }
+        for file_id, file_name, chunks, size, changed in files:
+            row = existing.get(file_id)
+            if row is None:
+                session.add(
+                    IndexedFile(
+                        telegram_id=user_id,
+                        file_id=file_id,
+                        file_name=file_name,
+                        chunk_count=chunks,
+                        size_bytes=size,
+                    )
+                )
+                continue
+            row.file_name, row.chunk_count, row.size_bytes = file_name, chunks, size
+            if changed:
+                row.indexed_at = _now()
+        await session.commit()
+
+
+async def set_fingerprints(user_id: int, fingerprints: Dict[str, str]) -> None:
+    """Проставляет отпечатки Drive уже записанным файлам."""
+    if not fingerprints:
+        return
+    async with get_session() as session:
+        rows = await session.scalars(
+            select(IndexedFile).where(
+                IndexedFile.telegram_id == user_id,
+                IndexedFile.file_id.in_(list(fingerprints)),
+            )
+        )
+        for row in rows:
+            row.fingerprint = fingerprints[row.file_id]
+        await session.commit()
+
+
+async def clear_user(user_id: int) -> int:
+    """Удаляет каталог пользователя; возвращает число удалённых файлов."""
+    async with get_session() as session:
+        res = await session.execute(
+            delete(IndexedFile).where(IndexedFile.telegram_id == user_id)
+        )
+        await session.commit()
+        return res.rowcount or 0
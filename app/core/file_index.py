@@ -0,0 +1,108 @@
+"""
+app/core/file_index.py
+
+Индекс имён файлов пользователя.
+
+Превращает подсказку «файлы по …» из запроса в набор file_id ещё до
+векторного поиска: имена нормализуются (регистр, ё → е, без расширения,
+по словам), совпадение ищется по подстроке, префиксу слова и нечётко
+(difflib) — так «отчёта за март» находит «Отчёт_Март.xlsx».
+Тот же индекс отдаёт автодополнение имени по префиксу.
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+from difflib import SequenceMatcher
+from typing import Callable, Dict, Iterable, List, Set, Tuple
+
+FUZZY_RATIO = 0.8  # порог схожести слов для нечёткого совпадения
+MIN_PREFIX = 4  # минимальная длина общего префикса слова
+
+
+def normalize_name(name: str) -> str:
+    stem = re.sub(r"\.[A-Za-z0-9]{1,5}$", "", name.strip())  # без расширения
+    return " ".join(re.findall(r"[^\W_]+", stem.lower().replace("ё", "е")))
+
+
+def _word_match(a: str, b: str) -> bool:
+    if a == b:
+        return True
+    if min(len(a), len(b)) >= MIN_PREFIX and (a.startswith(b) or b.startswith(a)):
+        return True
+    return SequenceMatcher(None, a, b).ratio() >= FUZZY_RATIO
+
+
+class FileNameIndex:
+    """
+    file_id → нормализованное имя для каждого пользователя.
+    bootstrap(user_id) → [(file_id, file_name)] заполняет индекс
+    при первом обращении (например, после рестарта процесса).
+    """
+
+    def __init__(self, bootstrap: Callable[[int], Iterable[Tuple[str, str]]]) -> None:
+        self._bootstrap = bootstrap
+        # user_id → file_id → (имя, нормализованное имя)
+        self._names: Dict[int, Dict[str, Tuple[str, str]]] = {}
+        self._lock = threading.Lock()
+
+    def _user(self, user_id: int) -> Dict[str, Tuple[str, str]]:
+        names = self._names.get(user_id)
+        if names is None:
+            names = {
+                fid: (fname, normalize_name(fname))
+                for fid, fname in self._bootstrap(user_id)
+            }
+            self._names[user_id] = names
+        return names
+
+    def add(self, user_id: int, file_id: str, file_name: str) -> None:
+        with self._lock:
+            self._user(user_id)[file_id] = (file_name, normalize_name(file_name))
+
+    def drop(self, user_id: int) -> None:
+        with self._lock:
+            self._names[user_id] = {}
+
+    def match(self, user_id: int, hint: str) -> Set[str]:
+        """
+        file_id файлов, чьё имя лучше всего совпадает с подсказкой.
+        Пустое множество — ни один файл не подошёл.
+        """
+        norm_hint = normalize_name(hint)
+        hint_words = norm_hint.split()
+        if not hint_words:
+            return set()
+
+        with self._lock:
+            names = dict(self._user(user_id))
+
+        scores: Dict[str, float] = {}
+        for fid, (_, norm) in names.items():
+            if norm_hint in norm or (norm and norm in norm_hint):
+                scores[fid] = 1.0
+                continue
+            words = [w for w in norm.split() if len(w) >= 3] or norm.split()
+            if not words:
+                continue
+            hit = sum(any(_word_match(w, h) for h in hint_words) for w in words)
+            if hit / len(words) >= 0.5:
+                scores[fid] = hit / len(words)
+
+        if not scores:
+            return set()
+        best = max(scores.values())
+        return {fid for fid, s in scores.items() if s == best}
+
+    def complete(self, user_id: int, prefix: str, limit: int = 10) -> List[str]:
+        """Имена файлов, нормализованное имя или слово которых начинается с prefix."""
+        p = normalize_name(prefix)
+        with self._lock:
+            names = list(self._user(user_id).values())
+        found = [
+            fname
+            for fname, norm in names
+            if norm.startswith(p) or any(w.startswith(p) for w in norm.split())
+        ]
+        return sorted(found)[:limit]
@@ -0,0 +1,57 @@
+"""
+app/core/http_client.py
+
+Общий HTTP-клиент процесса для обращений к Google API.
+
+Один keep-alive клиент с HTTP/2 и пулом соединений вместо нового
+httpx.AsyncClient (и нового TLS-рукопожатия) на каждый запрос.
+Клиент httpx привязан к event loop, а бот в режиме polling живёт в своём
+потоке со своим loop, поэтому клиент создаётся лениво — по одному на
+loop; закрывает их lifespan при остановке. Запись о loop держится слабой
+ссылкой и исчезает вместе с ним — короткоживущие loop не копятся.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import weakref
+
+import httpx
+
+from app.core.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16)
+
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+_lock = threading.Lock()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Общий клиент для текущего event loop (создаётся при первом вызове)."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(http2=True, timeout=TIMEOUT, limits=LIMITS)
+            _clients[loop] = client
+            logger.info("🌐 HTTP/2-клиент создан (клиентов: %d)", len(_clients))
+        return client
+
+
+async def close_http_clients() -> None:
+    """Закрывает клиенты всех loop (вызывается при shutdown)."""
+    current = asyncio.get_running_loop()
+    with _lock:
+        clients = list(_clients.items())
+        _clients.clear()
+    for loop, client in clients:
+        if loop is current:
+            await client.aclose()
+        elif loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
@@ -0,0 +1,247 @@
+"""
+app/core/lexical_index.py
+
+Лексический (BM25) индекс чанков по каждому пользователю.
+
+Дополняет векторный поиск точными совпадениями: артикулы, коды, имена,
+числа из таблиц — то, что плотные эмбеддинги часто «размывают».
+Индекс обновляется инкрементально при записи чанков, хранится как JSON
+на пользователя (LEXICAL_DIR/<user_id>.json) и держится в памяти для
+недавно активных пользователей, поэтому поиск занимает доли миллисекунды.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import re
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from app.core.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+K1 = 1.5
+B = 0.75
+
+# слова и «составные» токены вида AB-1234, 10.5, v2/3
+_TOKEN_RE = re.compile(r"\w+(?:[-./]\w+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Токены для BM25: составной токен целиком плюс его части."""
+    tokens: List[str] = []
+    for tok in _TOKEN_RE.findall(text.lower()):
+        tokens.append(tok)
+        if not tok.isalnum():
+            tokens.extend(p for p in re.split(r"[-./]", tok) if p)
+    return tokens
+
+
+class BM25Index:
+    """Инвертированный индекс одного пользователя."""
+
+    def __init__(self) -> None:
+        self.postings: Dict[str, Dict[str, int]] = {}  # терм → {chunk_id: tf}
+        self.docs: Dict[str, Tuple[str, int]] = {}  # chunk_id → (file_id, длина)
+        self.terms: Dict[str, List[str]] = {}  # chunk_id → его термы (для remove)
+        self.total_len = 0
+
+    # ── изменения ────────────────────────────────────────────────────────
+    def add(self, chunk_id: str, file_id: str, text: str) -> None:
+        if chunk_id in self.docs:
+            return
+        tokens = tokenize(text)
+        counts = Counter(tokens)
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[chunk_id] = tf
+        self.docs[chunk_id] = (file_id, len(tokens))
+        self.terms[chunk_id] = list(counts)
+        self.total_len += len(tokens)
+
+    def remove(self, chunk_ids: Iterable[str]) -> None:
+        for c in chunk_ids:
+            if c not in self.docs:
+                continue
+            self.total_len -= self.docs.pop(c)[1]
+            for term in self.terms.pop(c):
+                plist = self.postings[term]
+                del plist[c]
+                if not plist:
+                    del self.postings[term]
+
+    # ── поиск ────────────────────────────────────────────────────────────
+    def search(
+        self, query: str, k: int = 8, file_ids: Iterable[str] | None = None
+    ) -> List[Tuple[str, float]]:
+        """Top-k (chunk_id, bm25) по запросу; file_ids ограничивает набор файлов."""
+        n = len(self.docs)
+        if not n:
+            return []
+        allowed = set(file_ids) if file_ids is not None else None
+        avg_len = self.total_len / n
+
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for chunk_id, tf in plist.items():
+                file_id, length = self.docs[chunk_id]
+                if allowed is not None and file_id not in allowed:
+                    continue
+                norm = tf + K1 * (1 - B + B * length / avg_len)
+                scores[chunk_id] = (
+                    scores.get(chunk_id, 0.0) + idf * tf * (K1 + 1) / norm
+                )
+
+        return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:k]
+
+    # ── сериализация ─────────────────────────────────────────────────────
+    def snapshot(self) -> dict:
+        """Копия для записи на диск: сериализуется уже без блокировки."""
+        return {
+            "docs": dict(self.docs),
+            "postings": {t: dict(plist) for t, plist in self.postings.items()},
+        }
+
+    @classmethod
+    def from_json(cls, raw: str) -> "BM25Index":
+        data = json.loads(raw)
+        idx = cls()
+        idx.docs = {c: (f, n) for c, (f, n) in data["docs"].items()}
+        idx.postings = data["postings"]
+        idx.total_len = sum(n for _, n in idx.docs.values())
+        terms: Dict[str, List[str]] = {c: [] for c in idx.docs}
+        for term, plist in idx.postings.items():
+            for c in plist:
+                terms[c].append(term)
+        idx.terms = terms
+        return idx
+
+
+class LexicalStore:
+    """
+    Индексы пользователей: ленивая загрузка с диска, LRU в памяти.
+    bootstrap(user_id) → [(chunk_id, file_id, text)] строит индекс для
+    пользователей, чьи чанки были записаны до появления BM25.
+
+    Блокировка — на пользователя: загрузка большого файла одним
+    пользователем не задерживает поиск остальных. Снимок индекса
+    сериализуется и пишется на диск уже вне неё; версия не даёт более
+    старому снимку перезаписать свежий.
+    """
+
+    def __init__(
+        self,
+        path: Path | str,
+        max_users: int,
+        bootstrap: Callable[[int], Iterable[Tuple[str, str, str]]],
+    ) -> None:
+        self.path = Path(path)
+        self.max_users = max_users
+        self._bootstrap = bootstrap
+        self._loaded: OrderedDict[int, BM25Index] = OrderedDict()
+        self._lock = threading.Lock()  # только _loaded и словари ниже
+        self._user_locks: Dict[int, threading.RLock] = {}  # индекс пользователя
+        self._file_locks: Dict[int, threading.Lock] = {}  # его файл на диске
+        self._versions: Dict[int, int] = defaultdict(int)  # версия индекса
+        self._saved: Dict[int, int] = defaultdict(int)  # версия файла на диске
+
+    def _file(self, user_id: int) -> Path:
+        return self.path / f"{user_id}.json"
+
+    def _user_lock(self, user_id: int) -> threading.RLock:
+        with self._lock:
+            return self._user_locks.setdefault(user_id, threading.RLock())
+
+    def _file_lock(self, user_id: int) -> threading.Lock:
+        with self._lock:
+            return self._file_locks.setdefault(user_id, threading.Lock())
+
+    def get(self, user_id: int) -> BM25Index:
+        with self._user_lock(user_id):
+            with self._lock:
+                if (idx := self._loaded.get(user_id)) is not None:
+                    self._loaded.move_to_end(user_id)
+                    return idx
+
+            f = self._file(user_id)
+            snapshot = None
+            if f.exists():
+                idx = BM25Index.from_json(f.read_text(encoding="utf-8"))
+            else:
+                idx = BM25Index()
+                for chunk_id, file_id, text in self._bootstrap(user_id):
+                    idx.add(chunk_id, file_id, text)
+                if idx.docs:
+                    logger.info(
+                        "🔤 BM25 user %s: построен из базы (%d чанков)",
+                        user_id,
+                        len(idx.docs),
+                    )
+                    snapshot = self._snapshot(user_id, idx)
+
+            with self._lock:
+                self._loaded[user_id] = idx
+                while len(self._loaded) > self.max_users:
+                    self._loaded.popitem(last=False)
+        if snapshot is not None:
+            self._save(user_id, *snapshot)
+        return idx
+
+    def search(
+        self,
+        user_id: int,
+        query: str,
+        k: int = 8,
+        file_ids: Iterable[str] | None = None,
+    ) -> List[Tuple[str, float]]:
+        with self._user_lock(user_id):  # индекс может обновляться загрузкой
+            return self.get(user_id).search(query, k=k, file_ids=file_ids)
+
+    def update(
+        self,
+        user_id: int,
+        added: Iterable[Tuple[str, str, str]],
+        removed: Iterable[str],
+    ) -> None:
+        """Добавляет (chunk_id, file_id, text) и удаляет chunk_id, сохраняет на диск."""
+        with self._user_lock(user_id):
+            idx = self.get(user_id)
+            idx.remove(removed)
+            for chunk_id, file_id, text in added:
+                idx.add(chunk_id, file_id, text)
+            snapshot = self._snapshot(user_id, idx)
+        self._save(user_id, *snapshot)
+
+    def drop(self, user_id: int) -> None:
+        with self._user_lock(user_id), self._file_lock(user_id):
+            with self._lock:
+                self._loaded.pop(user_id, None)
+                self._versions[user_id] += 1
+                self._saved[user_id] = self._versions[user_id]  # старые снимки — мимо
+            self._file(user_id).unlink(missing_ok=True)
+
+    def _snapshot(self, user_id: int, idx: BM25Index) -> Tuple[int, dict]:
+        """Новая версия и копия индекса; вызывается под блокировкой пользователя."""
+        with self._lock:
+            self._versions[user_id] += 1
+            version = self._versions[user_id]
+        return version, idx.snapshot()
+
+    def _save(self, user_id: int, version: int, snapshot: dict) -> None:
+        raw = json.dumps(snapshot, ensure_ascii=False)
+        with self._file_lock(user_id):
+            if self._saved[user_id] >= version:
+                return  # на диске уже более свежий снимок
+            self.path.mkdir(parents=True, exist_ok=True)
+            f = self._file(user_id)
+            tmp = f.with_suffix(".tmp")
+            tmp.write_text(raw, encoding="utf-8")
+            tmp.replace(f)
+            self._saved[user_id] = version
@@ -5,9 +5,15 @@ from contextlib import asynccontextmanager
 import httpx
 from fastapi import FastAPI
 
-from app.core.config import USE_POLLING
+from app.ai.groq_config import close_groq_clients
+from app.core import readiness, tokenizer
+from app.core.config import EMBEDDER_WARMUP, USE_POLLING
 from app.core.db import init_db
+from app.core.http_client import close_http_clients
 from app.core.logging_config import get_logger
+from app.core.loop_monitor import watch_loop
+from app.core.vector_store import close_vector_db, embedder, open_vector_db
+from app.services import extraction
 from app.telegram.bot import app_tg
 from app.telegram.handlers import register_handlers
 
@@ -32,17 +38,37 @@ async def wait_for_webhook_ready(url: str, timeout: int = 30) -> bool:
     return False
 
 
+def _log_warmup_error(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("❌ Прогрев эмбеддера не удался: %s", task.exception())
+
+
+def _log_tokenizer_error(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("❌ Загрузка токенизатора не удалась: %s", task.exception())
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # ── инициализация БД и Telegram-бота ───────────────────────────────────
     await init_db()
+    await asyncio.to_thread(open_vector_db)  # единый хэндл Chroma на процесс
+    warmup: asyncio.Task | None = None  # ссылка держит задачу до shutdown
+    if EMBEDDER_WARMUP:  # модель грузится в фоне, /ready отдаёт 503 до конца
+        warmup = asyncio.create_task(asyncio.to_thread(embedder.warmup))
+        warmup.add_done_callback(_log_warmup_error)
+    # tokenizer.json качается с Hugging Face — в фоне, а не в первом ответе
+    tok_load = asyncio.create_task(asyncio.to_thread(tokenizer.warmup))
+    tok_load.add_done_callback(_log_tokenizer_error)
     register_handlers()
+    lag_watch = asyncio.create_task(watch_loop("main"))
 
     if USE_POLLING:  # локальная разработка
 
         def _run():
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
+            loop.create_task(watch_loop("telegram"))  # чаты крутятся на этом loop
             loop.run_until_complete(app_tg.run_polling(stop_signals=None))
 
         threading.Thread(target=_run, daemon=True).start()
@@ -53,7 +79,17 @@ async def lifespan(app: FastAPI):
         logger.info("Установка webhook: %s", WEBHOOK_URL)
         await app_tg.bot.set_webhook(url=WEBHOOK_URL)
 
+    logger.info("🚀 Сервис запущен за %.1f с", readiness.uptime())
     yield  # ← здесь запускается FastAPI
 
     if not USE_POLLING:
         await app_tg.shutdown()
+
+    lag_watch.cancel()
+    if warmup is not None:
+        warmup.cancel()  # поток прогрева дорабатывает сам, ждать его не нужно
+    tok_load.cancel()
+    extraction.shutdown()
+    await close_groq_clients()
+    await close_http_clients()
+    close_vector_db()
@@ -0,0 +1,66 @@
+"""
+app/core/loop_monitor.py
+
+Задержка event loop: фоновая задача спит INTERVAL_SEC и меряет, насколько
+позже срока проснулась. Всё, что дольше, — время, когда loop был занят
+синхронной работой и не обслуживал остальные чаты. p50/p99/max — в /metrics.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+
+import numpy as np
+
+from app.core.config import LOOP_LAG_WARN_MS
+from app.core.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+INTERVAL_SEC = 0.1
+WINDOW = 3000  # последних замеров (≈5 минут)
+
+
+class LoopLag:
+    """Замеры задержки одного event loop."""
+
+    def __init__(self) -> None:
+        self.samples: deque[float] = deque(maxlen=WINDOW)  # мс
+        self.max_ms = 0.0
+        self.stalls = 0  # задержек больше LOOP_LAG_WARN_MS
+
+    def add(self, lag_ms: float) -> None:
+        self.samples.append(lag_ms)
+        self.max_ms = max(self.max_ms, lag_ms)
+        if lag_ms >= LOOP_LAG_WARN_MS:
+            self.stalls += 1
+
+    def stats(self) -> dict:
+        lags = np.fromiter(self.samples, dtype=np.float64)
+        return {
+            "p50_ms": round(float(np.percentile(lags, 50)), 1) if lags.size else 0.0,
+            "p99_ms": round(float(np.percentile(lags, 99)), 1) if lags.size else 0.0,
+            "max_ms": round(self.max_ms, 1),
+            "stalls": self.stalls,
+        }
+
+
+_loops: dict[str, LoopLag] = {}
+
+
+async def watch_loop(name: str) -> None:
+    """Меряет задержку текущего event loop, пока задачу не отменят."""
+    lag = _loops[name] = LoopLag()
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(INTERVAL_SEC)
+        lag_ms = (loop.time() - started - INTERVAL_SEC) * 1000
+        lag.add(lag_ms)
+        if lag_ms >= LOOP_LAG_WARN_MS:
+            logger.warning("🐢 Event loop %s был занят %.0f мс", name, lag_ms)
+
+
+def loop_lag_stats() -> dict:
+    return {name: lag.stats() for name, lag in _loops.items()}
@@ -0,0 +1,505 @@
+"""
+app/core/mmap_store.py
+
+Компактное векторное хранилище на memory-mapped NumPy-файлах.
+
+Векторы лежат в квантованном виде (int8 с масштабом на строку или float16)
+в файле, отображённом в память, метаданные и тексты чанков — в небольшой
+SQLite-таблице рядом. Поиск — точный (весь отфильтрованный набор) или
+двухступенчатый: грубый проход по первым COARSE_DIMS компонентам и
+пересчёт лучших кандидатов по полному вектору.
+
+Клиент и коллекции повторяют то подмножество API chromadb, которым
+пользуется бот (get_or_create_collection / add / upsert / get / delete /
+query / count), поэтому vector_store работает с обоими бэкендами одинаково.
+Расстояния возвращаются как квадрат L2 — как у Chroma по умолчанию.
+
+Раскладка коллекции <root>/<name>/:
+    info.json      — размерность и тип квантования
+    vectors.<dt>   — матрица capacity × dim (int8 или float16)
+    scales.f32     — масштаб строки (только для int8)
+    norms.f32      — квадрат нормы восстановленного вектора
+    rows.sqlite3   — row → id, текст, метаданные
+"""
+
+from __future__ import annotations
+
+import json
+import shutil
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+from app.core.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+DTYPES = {"int8": np.int8, "float16": np.float16}
+INITIAL_CAPACITY = 1024
+COARSE_DIMS = 128  # сколько первых компонент берём в грубом проходе
+RESCORE_FACTOR = 8  # кандидатов на пересчёт = k * RESCORE_FACTOR
+
+
+class CollectionNotFound(ValueError):
+    pass
+
+
+# ─── фильтр where (подмножество синтаксиса Chroma) ──────────────────────────
+def _match(meta: dict, where: dict | None) -> bool:
+    if not where:
+        return True
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(_match(meta, c) for c in cond):
+                return False
+        elif key == "$or":
+            if not any(_match(meta, c) for c in cond):
+                return False
+        else:
+            op, arg = (
+                next(iter(cond.items())) if isinstance(cond, dict) else ("$eq", cond)
+            )
+            val = meta.get(key)
+            if op == "$eq":
+                ok = val == arg
+            elif op == "$ne":
+                ok = val != arg
+            elif op == "$in":
+                ok = val in arg
+            elif op == "$nin":
+                ok = val not in arg
+            else:
+                raise ValueError(f"Оператор {op} не поддерживается")
+            if not ok:
+                return False
+    return True
+
+
+class MmapCollection:
+    """Одна коллекция: квантованные векторы в mmap + SQLite с метаданными."""
+
+    def __init__(self, path: Path, name: str, dtype: str, search: str) -> None:
+        self.path = path
+        self.name = name
+        self.search = search
+        self._lock = threading.RLock()
+
+        path.mkdir(parents=True, exist_ok=True)
+        info_path = path / "info.json"
+        info = json.loads(info_path.read_text()) if info_path.exists() else {}
+        self.dtype: str = info.get("dtype", dtype)  # тип задаётся при создании
+        self.dim: int | None = info.get("dim")
+
+        self._db = sqlite3.connect(str(path / "rows.sqlite3"), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            " row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL,"
+            " document TEXT, metadata TEXT)"
+        )
+
+        # колонки в памяти: только то, что нужно для фильтрации
+        self._capacity = 0
+        self._size = 0  # верхняя граница занятых строк
+        self._alive = np.zeros(0, dtype=bool)
+        self._user_ids = np.zeros(0, dtype=np.int64)
+        self._file_ids = np.empty(0, dtype=object)
+        self._metas: List[dict | None] = []
+        self._row_ids: List[str | None] = []
+        self._id2row: Dict[str, int] = {}
+        self._free: List[int] = []
+
+        self._vectors: np.memmap | None = None
+        self._scales: np.memmap | None = None
+        self._norms: np.memmap | None = None
+
+        if self.dim is not None:
+            self._open_arrays(self._capacity_on_disk())
+            self._load_rows()
+
+    # ── файлы ────────────────────────────────────────────────────────────
+    def _capacity_on_disk(self) -> int:
+        f = self.path / f"vectors.{self.dtype}"
+        itemsize = np.dtype(DTYPES[self.dtype]).itemsize
+        return f.stat().st_size // (self.dim * itemsize) if f.exists() else 0
+
+    def _open_arrays(self, capacity: int) -> None:
+        """(Пере)открывает mmap-файлы под нужную ёмкость, дописывая хвост нулями."""
+        capacity = max(capacity, INITIAL_CAPACITY)
+        files = [(f"vectors.{self.dtype}", DTYPES[self.dtype], (capacity, self.dim))]
+        files.append(("norms.f32", np.float32, (capacity,)))
+        if self.dtype == "int8":
+            files.append(("scales.f32", np.float32, (capacity,)))
+
+        arrays = []
+        for fname, dt, shape in files:
+            f = self.path / fname
+            nbytes = int(np.prod(shape)) * np.dtype(dt).itemsize
+            with open(f, "ab") as fh:
+                if fh.tell() < nbytes:
+                    fh.truncate(nbytes)
+            arrays.append(np.memmap(f, dtype=dt, mode="r+", shape=shape))
+
+        self._vectors, self._norms = arrays[0], arrays[1]
+        self._scales = arrays[2] if self.dtype == "int8" else None
+
+        grow = capacity - self._capacity
+        if grow > 0:
+            self._alive = np.concatenate([self._alive, np.zeros(grow, dtype=bool)])
+            self._user_ids = np.concatenate(
+                [self._user_ids, np.full(grow, -1, dtype=np.int64)]
+            )
+            self._file_ids = np.concatenate(
+                [self._file_ids, np.empty(grow, dtype=object)]
+            )
+            self._metas.extend([None] * grow)
+            self._row_ids.extend([None] * grow)
+        self._capacity = capacity
+
+    def _load_rows(self) -> None:
+        for row, id_, meta_json in self._db.execute(
+            "SELECT row, id, metadata FROM rows"
+        ):
+            if row >= self._capacity:
+                self._open_arrays(row + 1)
+            self._set_row_meta(row, id_, json.loads(meta_json or "{}"))
+        self._size = max(self._id2row.values(), default=-1) + 1
+        self._free = [r for r in range(self._size) if not self._alive[r]]
+
+    def _set_row_meta(self, row: int, id_: str, meta: dict) -> None:
+        self._alive[row] = True
+        self._metas[row] = meta
+        self._user_ids[row] = int(meta.get("user_id", -1))
+        self._file_ids[row] = meta.get("file_id")
+        self._row_ids[row] = id_
+        self._id2row[id_] = row
+
+    def _alloc_rows(self, n: int) -> List[int]:
+        rows = [self._free.pop() for _ in range(min(n, len(self._free)))]
+        need = n - len(rows)
+        if need:
+            if self._size + need > self._capacity:
+                self._flush()
+                self._open_arrays(max(self._capacity * 2, self._size + need))
+            rows.extend(range(self._size, self._size + need))
+            self._size += need
+        return rows
+
+    def _flush(self) -> None:
+        for arr in (self._vectors, self._scales, self._norms):
+            if arr is not None:
+                arr.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+            self._vectors = self._scales = self._norms = None
+            self._db.close()
+
+    # ── квантование ──────────────────────────────────────────────────────
+    def _quantize(self, vecs: np.ndarray) -> tuple[np.ndarray, np.ndarray | None]:
+        if self.dtype == "float16":
+            return vecs.astype(np.float16), None
+        scales = np.abs(vecs).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        q = np.clip(np.rint(vecs / scales[:, None]), -127, 127).astype(np.int8)
+        return q, scales.astype(np.float32)
+
+    def _dequantize(self, rows: np.ndarray) -> np.ndarray:
+        vecs = np.asarray(self._vectors[rows], dtype=np.float32)
+        if self._scales is not None:
+            vecs *= self._scales[rows][:, None]
+        return vecs
+
+    def _dots(
+        self, rows: np.ndarray, q: np.ndarray, dims: int | None = None
+    ) -> np.ndarray:
+        """Скалярные произведения строк с запросом без полного восстановления матрицы."""
+        block = self._vectors[rows] if dims is None else self._vectors[rows, :dims]
+        dots = np.asarray(block, dtype=np.float32) @ (q if dims is None else q[:dims])
+        if self._scales is not None:
+            dots *= self._scales[rows]
+        return dots
+
+    # ── фильтрация ───────────────────────────────────────────────────────
+    def _mask(self, where: dict | None) -> np.ndarray:
+        n = self._size
+        mask = self._alive[:n].copy()
+        if where:
+            mask &= self._where_mask(where, n)
+        return mask
+
+    def _where_mask(self, where: dict, n: int) -> np.ndarray:
+        mask = np.ones(n, dtype=bool)
+        for key, cond in where.items():
+            if key == "$and":
+                for c in cond:
+                    mask &= self._where_mask(c, n)
+            elif key == "$or":
+                any_mask = np.zeros(n, dtype=bool)
+                for c in cond:
+                    any_mask |= self._where_mask(c, n)
+                mask &= any_mask
+            elif key in ("user_id", "file_id"):
+                # колонки в памяти — векторизованное сравнение
+                col = self._user_ids[:n] if key == "user_id" else self._file_ids[:n]
+                op, arg = (
+                    next(iter(cond.items()))
+                    if isinstance(cond, dict)
+                    else ("$eq", cond)
+                )
+                if op in ("$eq", "$ne"):
+                    m = col == arg
+                elif op in ("$in", "$nin"):
+                    values = set(arg)
+                    m = np.fromiter((v in values for v in col), dtype=bool, count=n)
+                else:
+                    raise ValueError(f"Оператор {op} не поддерживается")
+                mask &= ~m if op in ("$ne", "$nin") else m
+            else:
+                mask &= np.fromiter(
+                    (m is not None and _match(m, {key: cond}) for m in self._metas[:n]),
+                    dtype=bool,
+                    count=n,
+                )
+        return mask
+
+    def _documents(self, rows: Sequence[int]) -> Dict[int, str]:
+        docs: Dict[int, str] = {}
+        rows = [int(r) for r in rows]
+        for lo in range(0, len(rows), 500):
+            part = rows[lo : lo + 500]
+            docs.update(
+                self._db.execute(
+                    f"SELECT row, document FROM rows"
+                    f" WHERE row IN ({','.join('?' * len(part))})",
+                    part,
+                ).fetchall()
+            )
+        return docs
+
+    # ── API в стиле chromadb ─────────────────────────────────────────────
+    def count(self) -> int:
+        return int(self._alive[: self._size].sum())
+
+    def add(self, **kwargs: Any) -> None:
+        self.upsert(**kwargs)
+
+    def upsert(
+        self,
+        ids: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+        documents: Sequence[str] | None = None,
+        metadatas: Sequence[dict] | None = None,
+    ) -> None:
+        if not ids:
+            return
+        documents = documents or [None] * len(ids)
+        metadatas = metadatas or [{} for _ in ids]
+        # повторный id в одном вызове: побеждает последний, иначе первая
+        # копия осталась бы строкой-сиротой, которая участвует в поиске
+        last = {id_: n for n, id_ in enumerate(ids)}
+        if len(last) < len(ids):
+            keep = sorted(last.values())
+            ids = [ids[n] for n in keep]
+            embeddings = [embeddings[n] for n in keep]
+            documents = [documents[n] for n in keep]
+            metadatas = [metadatas[n] for n in keep]
+        vecs = np.asarray(embeddings, dtype=np.float32)
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = vecs.shape[1]
+                (self.path / "info.json").write_text(
+                    json.dumps({"dim": self.dim, "dtype": self.dtype})
+                )
+                self._open_arrays(INITIAL_CAPACITY)
+
+            known = [self._id2row.get(i) for i in ids]
+            fresh = iter(self._alloc_rows(sum(r is None for r in known)))
+            rows = np.array([r if r is not None else next(fresh) for r in known])
+
+            q, scales = self._quantize(vecs)
+            self._vectors[rows] = q
+            if scales is not None:
+                self._scales[rows] = scales
+            self._norms[rows] = (self._dequantize(rows) ** 2).sum(axis=1)
+            self._flush()
+
+            for row, id_, meta in zip(rows, ids, metadatas):
+                self._set_row_meta(int(row), id_, dict(meta))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO rows(row, id, document, metadata)"
+                " VALUES (?, ?, ?, ?)",
+                [
+                    (int(r), i, d, json.dumps(m, ensure_ascii=False))
+                    for r, i, d, m in zip(rows, ids, documents, metadatas)
+                ],
+            )
+            self._db.commit()
+
+    def update(self, ids: Sequence[str], metadatas: Sequence[dict]) -> None:
+        """Меняет метаданные существующих строк (векторы не трогает)."""
+        with self._lock:
+            known = [
+                (self._id2row[i], i, dict(m))
+                for i, m in zip(ids, metadatas)
+                if i in self._id2row
+            ]
+            for row, id_, meta in known:
+                self._set_row_meta(row, id_, meta)
+            self._db.executemany(
+                "UPDATE rows SET metadata=? WHERE row=?",
+                [(json.dumps(m, ensure_ascii=False), r) for r, _, m in known],
+            )
+            self._db.commit()
+
+    def get(
+        self,
+        ids: Sequence[str] | None = None,
+        where: dict | None = None,
+        include: Sequence[str] = ("documents", "metadatas"),
+        limit: int | None = None,
+        offset: int | None = None,
+    ) -> Dict[str, Any]:
+        with self._lock:
+            if ids is not None:
+                rows = [self._id2row[i] for i in ids if i in self._id2row]
+                if where:
+                    rows = [r for r in rows if _match(self._metas[r], where)]
+            else:
+                rows = np.flatnonzero(self._mask(where)).tolist()
+            rows = rows[offset or 0 :]
+            if limit is not None:
+                rows = rows[:limit]
+            return self._rows_result(rows, include)
+
+    def _rows_result(self, rows: List[int], include: Sequence[str]) -> Dict[str, Any]:
+        res: Dict[str, Any] = {
+            "ids": [self._row_ids[r] for r in rows],
+            "documents": None,
+            "metadatas": None,
+            "embeddings": None,
+        }
+        if "documents" in include:
+            docs = self._documents(rows)
+            res["documents"] = [docs.get(r) for r in rows]
+        if "metadatas" in include:
+            res["metadatas"] = [self._metas[r] for r in rows]
+        if "embeddings" in include:
+            res["embeddings"] = (
+                self._dequantize(np.array(rows)).tolist() if rows else []
+            )
+        return res
+
+    def delete(
+        self, ids: Sequence[str] | None = None, where: dict | None = None
+    ) -> None:
+        with self._lock:
+            if ids is not None:
+                rows = [self._id2row[i] for i in ids if i in self._id2row]
+                if where:
+                    rows = [r for r in rows if _match(self._metas[r], where)]
+            else:
+                rows = np.flatnonzero(self._mask(where)).tolist()
+            if not rows:
+                return
+
+            for r in rows:
+                del self._id2row[self._row_ids[r]]
+                self._row_ids[r] = None
+                self._alive[r] = False
+                self._metas[r] = None
+                self._user_ids[r] = -1
+                self._file_ids[r] = None
+            self._free.extend(rows)
+            self._db.executemany("DELETE FROM rows WHERE row=?", [(r,) for r in rows])
+            self._db.commit()
+
+    def query(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        n_results: int = 10,
+        where: dict | None = None,
+        include: Sequence[str] = ("documents", "metadatas", "distances"),
+    ) -> Dict[str, Any]:
+        out: Dict[str, List[Any]] = {
+            "ids": [],
+            "documents": [],
+            "metadatas": [],
+            "distances": [],
+        }
+        with self._lock:
+            candidates = np.flatnonzero(self._mask(where))
+            for q in np.asarray(query_embeddings, dtype=np.float32):
+                rows, dists = self._search(candidates, q, n_results)
+                res = self._rows_result(rows.tolist(), include)
+                out["ids"].append(res["ids"])
+                out["documents"].append(res["documents"])
+                out["metadatas"].append(res["metadatas"])
+                out["distances"].append(dists.tolist())
+        return out
+
+    def _search(
+        self, rows: np.ndarray, q: np.ndarray, k: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        if not len(rows) or self.dim is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        # грубый проход по первым компонентам → пересчёт лучших кандидатов
+        shortlist = k * RESCORE_FACTOR
+        if self.search == "coarse" and len(rows) > shortlist and self.dim > COARSE_DIMS:
+            coarse = self._dots(rows, q, COARSE_DIMS)
+            rows = rows[np.argpartition(-coarse, shortlist)[:shortlist]]
+
+        dists = float(q @ q) + self._norms[rows] - 2 * self._dots(rows, q)
+        k = min(k, len(rows))
+        top = np.argpartition(dists, k - 1)[:k]
+        top = top[np.argsort(dists[top])]
+        return rows[top], np.asarray(dists[top], dtype=np.float32)
+
+
+class MmapClient:
+    """Набор коллекций в каталоге root — аналог chromadb.PersistentClient."""
+
+    def __init__(self, path: Path | str, dtype: str = "int8", search: str = "exact"):
+        if dtype not in DTYPES:
+            raise ValueError(f"Неизвестный тип квантования: {dtype}")
+        self.path = Path(path)
+        self.dtype = dtype
+        self.search = search
+        self._collections: Dict[str, MmapCollection] = {}
+        self._lock = threading.Lock()
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def get_or_create_collection(self, name: str) -> MmapCollection:
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = MmapCollection(
+                    self.path / name, name, self.dtype, self.search
+                )
+            return self._collections[name]
+
+    def get_collection(self, name: str) -> MmapCollection:
+        if name not in self._collections and not (self.path / name).is_dir():
+            raise CollectionNotFound(name)
+        return self.get_or_create_collection(name)
+
+    def delete_collection(self, name: str) -> None:
+        with self._lock:
+            if (col := self._collections.pop(name, None)) is not None:
+                col.close()
+            if not (self.path / name).is_dir():
+                raise CollectionNotFound(name)
+            shutil.rmtree(self.path / name)
+
+    def list_collections(self) -> List[str]:
+        return sorted(p.name for p in self.path.iterdir() if p.is_dir())
+
+    def close(self) -> None:
+        with self._lock:
+            for col in self._collections.values():
+                col.close()
+            self._collections.clear()
@@ -0,0 +1,32 @@
+"""
+app/core/readiness.py
+
+Время старта процесса и готовность сервиса.
+
+STARTED_AT фиксируется при первом импорте (lifespan импортирует модуль
+одним из первых), поэтому «старт → первый запрос» включает импорты,
+открытие базы и прогрев эмбеддера, если запрос его дождался.
+"""
+
+import time
+
+from app.core.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+STARTED_AT = time.monotonic()
+_first_request_seen = False
+
+
+def uptime() -> float:
+    """Секунды с момента старта процесса."""
+    return time.monotonic() - STARTED_AT
+
+
+def note_request(path: str) -> None:
+    """Логирует время от старта до первого HTTP-запроса (один раз)."""
+    global _first_request_seen
+    if _first_request_seen:
+        return
+    _first_request_seen = True
+    logger.info("⏱️ Первый запрос (%s) через %.1f с после старта", path, uptime())
@@ -0,0 +1,103 @@
+"""
+app/core/tokenizer.py
+
+Подсчёт токенов для бюджета промпта.
+
+Считаем токенизатором Llama 3 (LLAMA_TOKENIZER — tokenizer.json с
+Hugging Face, библиотека tokenizers): у 70B-модели Groq словарь Llama,
+и cl100k_base из tiktoken заметно расходится с ним, особенно на русском.
+Если токенизатор не скачать (офлайн, нет пакета) — fallback
+на cl100k_base, а без tiktoken — грубая оценка по длине текста.
+Загружается в фоне при старте (warmup в lifespan), чтобы скачивание
+tokenizer.json не задерживало первый ответ; без прогрева — при первом
+подсчёте.
+
+Число токенов чанка считается один раз при индексации и хранится в его
+метаданных (tokens); сообщения истории повторяются из хода в ход, их
+счётчики кэшируются.
+"""
+
+from __future__ import annotations
+
+import threading
+from functools import lru_cache
+from typing import Callable, List, Sequence
+
+from app.core.config import EMBEDDING_DIR, LLAMA_TOKENIZER
+from app.core.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+_count_batch: Callable[[Sequence[str]], List[int]] | None = None
+_lock = threading.Lock()
+name = ""  # каким токенизатором считаем (для логов бюджета)
+
+
+def _load() -> Callable[[Sequence[str]], List[int]]:
+    global _count_batch, name
+    with _lock:
+        if _count_batch is not None:
+            return _count_batch
+        try:
+            from huggingface_hub import hf_hub_download
+            from tokenizers import Tokenizer
+
+            path = hf_hub_download(
+                LLAMA_TOKENIZER,
+                "tokenizer.json",
+                cache_dir=str(EMBEDDING_DIR.parent / "tokenizer"),
+            )
+            tok = Tokenizer.from_file(path)
+
+            def count(texts: Sequence[str]) -> List[int]:
+                enc = tok.encode_batch(list(texts), add_special_tokens=False)
+                return [len(e.ids) for e in enc]
+
+            name = LLAMA_TOKENIZER
+        except Exception as e:
+            logger.warning(
+                "⚠️ Токенизатор %s недоступен (%s), считаю cl100k_base",
+                LLAMA_TOKENIZER,
+                e,
+            )
+            count, name = _fallback()
+        _count_batch = count
+        logger.info("🔤 Токенизатор для бюджета промпта: %s", name)
+        return count
+
+
+def _fallback() -> tuple[Callable[[Sequence[str]], List[int]], str]:
+    """cl100k_base из tiktoken; нет и его (пакет, офлайн) — оценка по символам."""
+    try:
+        import tiktoken
+
+        enc = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(
+            "⚠️ cl100k_base недоступен (%s), оцениваю ~3 символа на токен", e
+        )
+        # с запасом: на русском у Llama выходит 3–4 символа на токен
+        return (lambda texts: [len(t) // 3 + 1 for t in texts]), "chars/3"
+
+    def count(texts: Sequence[str]) -> List[int]:
+        return [len(ids) for ids in enc.encode_ordinary_batch(list(texts))]
+
+    return count, "cl100k_base"
+
+
+def warmup() -> None:
+    """Загружает токенизатор заранее (из lifespan, в потоке)."""
+    _load()
+
+
+def count_tokens_many(texts: Sequence[str]) -> List[int]:
+    """Токены каждого текста одним батчем (индексация чанков)."""
+    if not texts:
+        return []
+    return (_count_batch or _load())(texts)
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """Токены одного текста; повторяющиеся тексты (история) — из кэша."""
+    return count_tokens_many([text])[0]
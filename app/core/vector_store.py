@@ -1,93 +1,643 @@
+import asyncio
+import math
+import threading
+import time
+import weakref
 from collections import defaultdict
+from contextlib import AsyncExitStack
+from functools import partial
 from pathlib import Path
-from typing import Dict, Iterable, List, Set, Tuple
-from uuid import uuid4
+from typing import Dict, Iterable, List, Sequence, Set, Tuple, Union
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
+import chromadb
+from chromadb.api import ClientAPI
+from chromadb.api.models.Collection import Collection
+from langchain_core.documents import Document
 
-from app.core.config import CHROMA_DIR, EMBEDDING_DIR
+from app.core import file_catalog
+from app.core.answer_cache import answer_cache
+from app.core.cache import TTLCache
+from app.core.chunking import FileChunks
+from app.core.config import (
+    CHROMA_DIR,
+    EMBED_BATCH_SIZE,
+    EMBED_BATCH_WAIT_MS,
+    EMBED_CACHE_MAX_ENTRIES,
+    EMBED_CACHE_PATH,
+    EMBEDDER_BACKEND,
+    EMBEDDER_IDLE_UNLOAD_SEC,
+    EMBEDDER_THREADS,
+    EMBEDDING_DIR,
+    EMBEDDING_MODEL,
+    LEXICAL_CACHE_USERS,
+    LEXICAL_DIR,
+    MMAP_DIR,
+    MMAP_DTYPE,
+    MMAP_SEARCH,
+    QUERY_BATCH_SIZE,
+    QUERY_BATCH_WAIT_MS,
+    QUERY_CACHE_SIZE,
+    QUERY_CACHE_TTL_SEC,
+    RETRIEVAL_CACHE_SIZE,
+    RETRIEVAL_CACHE_TTL_SEC,
+    VECTOR_BACKEND,
+    VECTOR_PARTITION,
+    VECTOR_PARTITION_BUCKETS,
+)
+from app.core.embedder import LazyEmbedder, build_embedder, embedder_name
+from app.core.embedding_batcher import EmbeddingBatcher
+from app.core.embedding_cache import EmbeddingCache, text_digest
+from app.core.file_index import FileNameIndex
+from app.core.lexical_index import LexicalStore
 from app.core.logging_config import get_logger
+from app.core.mmap_store import MmapClient, MmapCollection
+from app.core.tokenizer import count_tokens_many
+from app.models.indexed_file import IndexedFile
 
 logger = get_logger(__name__)
 
 # ── параметры ────────────────────────────────────────────────────────────────
 MAX_FILES_PER_USER = 10
-embedder = HuggingFaceEmbeddings(
-    model_name="intfloat/multilingual-e5-base",
-    cache_folder=str(EMBEDDING_DIR),
+UPSERT_BATCH_SIZE = 1000  # сколько чанков отдаём в Chroma за один add
+SHARED_COLLECTION = "langchain"  # имя общей коллекции (так её назвал langchain)
+# модель не грузится при импорте: первый вызов или warmup() в lifespan
+embedder = LazyEmbedder(
+    partial(
+        build_embedder,
+        EMBEDDER_BACKEND,
+        EMBEDDING_MODEL,
+        EMBEDDING_DIR,
+        batch_size=EMBED_BATCH_SIZE,
+        threads=EMBEDDER_THREADS,
+    ),
+    embedder_name(EMBEDDING_MODEL, EMBEDDER_BACKEND),
+    idle_unload_sec=EMBEDDER_IDLE_UNLOAD_SEC,
 )
-splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
 
+# общий сборщик батчей для индексации: чанки всех файлов и всех параллельных
+# загрузок идут в модель батчами фиксированного размера
+ingest_batcher = EmbeddingBatcher(
+    embedder.embed_documents,
+    batch_size=EMBED_BATCH_SIZE,
+    max_wait_ms=EMBED_BATCH_WAIT_MS,
+    name="ingest",
+)
+# запросы чата из параллельных потоков msg_ai собираются в маленькие батчи:
+# один прогон модели вместо N одиночных, без борьбы потоков внутри torch
+query_batcher = EmbeddingBatcher(
+    embedder.embed_documents,
+    batch_size=QUERY_BATCH_SIZE,
+    max_wait_ms=QUERY_BATCH_WAIT_MS,
+    name="query",
+)
+# кэш эмбеддингов: неизменённые чанки при повторной загрузке не пересчитываются;
+# ключ включает бэкенд — векторы int8/onnx чуть отличаются от эталонных
+embedding_cache = EmbeddingCache(
+    EMBED_CACHE_PATH, embedder.name, EMBED_CACHE_MAX_ENTRIES
+)
 
-# ─── публичный загрузчик базы (для импорта из ai_reply и др.) ────────────────
-def load_vector_db(persist_dir: Path | str = CHROMA_DIR) -> Chroma:
+
+# ─── общий (process-wide) хэндл базы ─────────────────────────────────────────
+# Хранилище открывается один раз (в lifespan) и переиспользуется всеми
+# вызовами — как из event loop, так и из executor-потоков msg_ai.
+# Бэкенд (VECTOR_BACKEND): Chroma или компактный mmap-индекс с тем же API.
+VectorClient = Union[ClientAPI, MmapClient]
+VectorCollection = Union[Collection, MmapCollection]
+
+_client: VectorClient | None = None
+_collections: Dict[str, VectorCollection] = {}  # уже открытые коллекции по имени
+_db_lock = threading.Lock()  # защищает открытие/закрытие хэндла и коллекций
+write_lock = threading.RLock()  # сериализует изменения коллекций (get → delete → add)
+_open_count = 0  # сколько раз хранилище реально открывалось за жизнь процесса
+
+
+def open_vector_db(
+    persist_dir: Path | str | None = None, backend: str = VECTOR_BACKEND
+) -> VectorClient:
     """
-    Возвращает Chroma-базу: если каталог уже существует — загружает,
-    иначе создаёт новый.
+    Открывает хранилище (если каталог существует — загружает, иначе создаёт)
+    и сохраняет клиента как общий хэндл процесса. Повторный вызов
+    возвращает уже открытый клиент.
     """
-    p_dir = Path(persist_dir)
-    if p_dir.exists():
-        db = Chroma(persist_directory=str(p_dir), embedding_function=embedder)
+    global _client, _open_count
+    with _db_lock:
+        if _client is not None:
+            return _client
+
+        if backend == "mmap":
+            p_dir = Path(persist_dir or MMAP_DIR)
+            _client = MmapClient(p_dir, dtype=MMAP_DTYPE, search=MMAP_SEARCH)
+        else:
+            p_dir = Path(persist_dir or CHROMA_DIR)
+            if not p_dir.exists():
+                logger.info("Chroma не найдена — создаю новую (%s)", p_dir)
+            _client = chromadb.PersistentClient(path=str(p_dir))
+        _open_count += 1
         logger.info(
-            "Chroma загружена (%s), документов: %d", p_dir, db._collection.count()
+            "📂 Векторная база открыта (%s: %s, разбиение: %s, открытий за процесс: %d)",
+            backend,
+            p_dir,
+            VECTOR_PARTITION,
+            _open_count,
         )
-        return db
+        return _client
 
-    logger.info("Chroma не найдена — создаю новую (%s)", p_dir)
-    return Chroma(embedding_function=embedder, persist_directory=str(p_dir))
 
+def close_vector_db() -> None:
+    """Освобождает общий хэндл (вызывается при shutdown)."""
+    global _client
+    with _db_lock:
+        if _client is None:
+            return
+        _collections.clear()
+        if isinstance(_client, MmapClient):
+            _client.close()  # сбрасываем mmap-файлы на диск
+        _client = None
+        embedding_cache.close()
+        logger.info("📕 Векторная база закрыта")
 
-# ─── внутренний утилити ──────────────────────────────────────────────────────
-def _user_file_set(db: Chroma, user_id: int) -> Set[str]:
-    """Отдаёт все file_id, сохранённые для указанного пользователя."""
+
+# ─── публичный загрузчик базы (для импорта из ai_reply и др.) ────────────────
+def load_vector_db() -> VectorClient:
+    """
+    Возвращает общий клиент векторной базы. Обычно база уже открыта в lifespan;
+    если нет (скрипты, тесты) — открывает её лениво.
+    """
+    client = _client
+    if client is not None:
+        return client
+    return open_vector_db()
+
+
+def vector_db_open_count() -> int:
+    """Сколько раз хранилище фактически открывалось (для метрик и логов)."""
+    return _open_count
+
+
+# ─── разбиение по коллекциям ─────────────────────────────────────────────────
+def collection_name(user_id: int) -> str:
+    """Имя коллекции, в которой лежат чанки пользователя (по VECTOR_PARTITION)."""
+    if VECTOR_PARTITION == "user":
+        return f"kb_user_{user_id}"
+    if VECTOR_PARTITION == "bucket":
+        return f"kb_bucket_{user_id % VECTOR_PARTITION_BUCKETS:04d}"
+    return SHARED_COLLECTION
+
+
+def user_collection(user_id: int, *, create: bool = True) -> VectorCollection | None:
+    """
+    Коллекция пользователя; создаётся лениво при первой записи.
+    С create=False возвращает None, если коллекции ещё нет.
+    """
+    name = collection_name(user_id)
+    if (col := _collections.get(name)) is not None:
+        return col
+
+    client = load_vector_db()
+    with _db_lock:
+        if (col := _collections.get(name)) is not None:
+            return col
+        if create:
+            col = client.get_or_create_collection(name)
+        else:
+            try:
+                col = client.get_collection(name)
+            except Exception:  # коллекции нет
+                return None
+        _collections[name] = col
+        return col
+
+
+def user_where(user_id: int, *conds: dict) -> dict | None:
+    """
+    Фильтр where для чанков пользователя. В режиме «user» коллекция уже
+    принадлежит одному пользователю, и фильтр по user_id не нужен.
+    """
+    parts = list(conds)
+    if VECTOR_PARTITION != "user":
+        parts.insert(0, {"user_id": {"$eq": user_id}})
+    if not parts:
+        return None
+    return parts[0] if len(parts) == 1 else {"$and": parts}
+
+
+def delete_user_documents(user_id: int) -> None:
+    """Удаляет все чанки пользователя; в режиме «user» — одним drop коллекции."""
+    with write_lock:
+        if VECTOR_PARTITION == "user":
+            name = collection_name(user_id)
+            with _db_lock:
+                _collections.pop(name, None)
+            try:
+                load_vector_db().delete_collection(name)
+            except Exception:  # коллекции не было
+                pass
+        elif (col := user_collection(user_id, create=False)) is not None:
+            col.delete(where=user_where(user_id))
+        lexical_store.drop(user_id)
+        file_index.drop(user_id)
+    invalidate_user(user_id)
+
+
+# ─── каталог файлов ──────────────────────────────────────────────────────────
+def _catalog_bootstrap(user_id: int) -> List[Tuple[str, str, int, int, bool]]:
+    """Файлы пользователя из метаданных чанков — для первого заполнения каталога."""
+    col = user_collection(user_id, create=False)
+    if col is None:
+        return []
+    res = col.get(where=user_where(user_id), include=["metadatas"])
+    names: Dict[str, str] = {}
+    chunks: Dict[str, int] = defaultdict(int)
+    for meta in res["metadatas"]:
+        names[meta["file_id"]] = meta.get("file_name") or meta["file_id"]
+        chunks[meta["file_id"]] += 1
+    return [(fid, name, chunks[fid], 0, True) for fid, name in names.items()]
+
+
+_catalog_checked: Set[int] = set()  # пользователи, для которых скан уже был
+
+
+async def known_files(user_id: int) -> List[IndexedFile]:
+    """
+    Файлы пользователя из каталога (indexed_file). Пользователи, чьи файлы
+    записаны до появления каталога, переносятся в него при первом обращении;
+    скан метаданных идёт один раз за процесс, в том числе для пользователей
+    без файлов.
+    """
+    files = await file_catalog.user_files(user_id)
+    if files or user_id in _catalog_checked:
+        return files
+    _catalog_checked.add(user_id)
     try:
-        res = db.get(where={"user_id": user_id}, include=["metadatas"])
-        return {meta["file_id"] for meta in res["metadatas"]}
+        found = await asyncio.to_thread(_catalog_bootstrap, user_id)
     except Exception:
-        return set()
+        _catalog_checked.discard(user_id)  # попробуем при следующем обращении
+        raise
+    if not found:
+        return []
+    await file_catalog.save_files(user_id, found)
+    logger.info("🗂 user %s: каталог заполнен из базы (%d файлов)", user_id, len(found))
+    return await file_catalog.user_files(user_id)
+
+
+async def list_user_file_names(user_id: int) -> List[str]:
+    """Отсортированные имена файлов пользователя в базе знаний."""
+    return [f.file_name for f in await known_files(user_id)]
+
+
+# ─── поиск с кэшами ──────────────────────────────────────────────────────────
+# эмбеддинги запросов (ключ — нормализованный текст) и результаты поиска
+# по пользователю; результаты пользователя сбрасываются при изменении его файлов
+query_cache: TTLCache[List[float]] = TTLCache(
+    QUERY_CACHE_SIZE, QUERY_CACHE_TTL_SEC, name="query_embeddings"
+)
+retrieval_cache: TTLCache[List[Tuple[Document, float]]] = TTLCache(
+    RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL_SEC, name="retrieval"
+)
+_user_generation: Dict[int, int] = defaultdict(int)  # версия базы пользователя
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def embed_query(text: str) -> List[float]:
+    """Эмбеддинг запроса через LRU+TTL-кэш; промахи считаются микробатчами."""
+    return embed_queries([text])[0]
+
+
+def embed_queries(texts: Sequence[str]) -> List[List[float]]:
+    """Эмбеддинги нескольких запросов: промахи кэша уходят в модель одним батчем."""
+    keys = [normalize_query(t) for t in texts]
+    vecs = {k: v for k in keys if (v := query_cache.get(k)) is not None}
+    missing = list(dict.fromkeys(k for k in keys if k not in vecs))
+    if missing:
+        for k, v in zip(missing, query_batcher.submit(missing).result()):
+            query_cache.put(k, v)
+            vecs[k] = v
+    return [vecs[k] for k in keys]
+
+
+def invalidate_user(user_id: int) -> None:
+    """Помечает базу пользователя изменённой — его закэшированные результаты устаревают."""
+    _user_generation[user_id] += 1
+    answer_cache.drop_user(user_id)
+
+
+def _relevance(distance: float) -> float:
+    """Квадрат L2 (метрика Chroma по умолчанию) → релевантность 0..1, как в langchain."""
+    return 1.0 - distance / math.sqrt(2)
+
+
+def _file_cond(file_ids: Set[str] | None) -> Tuple[dict, ...]:
+    """Условие where на набор файлов (пусто — без ограничения)."""
+    if not file_ids:
+        return ()
+    return ({"file_id": {"$in": sorted(file_ids)}},)
+
+
+def similarity_search(
+    query: str, user_id: int, k: int = 8, file_ids: Set[str] | None = None
+) -> List[Tuple[Document, float]]:
+    """
+    Семантический поиск по файлам пользователя: (документ, релевантность 0..1).
+    file_ids ограничивает поиск этими файлами прямо в индексе.
+    Эмбеддинг запроса и сам результат берутся из кэшей, если есть.
+    """
+    return similarity_search_many([query], user_id, k=k, file_ids=file_ids)[0]
+
+
+def similarity_search_many(
+    queries: Sequence[str],
+    user_id: int,
+    k: int = 8,
+    file_ids: Set[str] | None = None,
+) -> List[List[Tuple[Document, float]]]:
+    """
+    То же для нескольких вариантов запроса (оригинал, перевод): эмбеддинги
+    промахов — одним батчем, поиск — одним вызовом query с несколькими
+    векторами. Результаты по каждому запросу, в том же порядке.
+    """
+    scope = tuple(sorted(file_ids)) if file_ids else None
+    gen = _user_generation[user_id]
+    keys = [(user_id, gen, normalize_query(q), k, scope) for q in queries]
+    results = [retrieval_cache.get(key) for key in keys]
+    todo = [i for i, r in enumerate(results) if r is None]
+    if not todo:
+        return results
+
+    col = user_collection(user_id, create=False)
+    if col is None:
+        return [r if r is not None else [] for r in results]
+    res = col.query(
+        query_embeddings=embed_queries([queries[i] for i in todo]),
+        n_results=k,
+        where=user_where(user_id, *_file_cond(file_ids)),
+        include=["documents", "metadatas", "distances"],
+    )
+    for n, i in enumerate(todo):
+        results[i] = [
+            (Document(id=id_, page_content=text, metadata=meta), _relevance(dist))
+            for id_, text, meta, dist in zip(
+                res["ids"][n],
+                res["documents"][n],
+                res["metadatas"][n],
+                res["distances"][n],
+            )
+        ]
+        retrieval_cache.put(keys[i], results[i])
+    return results
+
+
+# ─── лексический поиск (BM25) ────────────────────────────────────────────────
+def _lexical_bootstrap(user_id: int) -> List[Tuple[str, str, str]]:
+    """Чанки пользователя из векторной базы — для первой сборки BM25-индекса."""
+    col = user_collection(user_id, create=False)
+    if col is None:
+        return []
+    res = col.get(where=user_where(user_id), include=["documents", "metadatas"])
+    return [
+        (i, meta["file_id"], doc)
+        for i, doc, meta in zip(res["ids"], res["documents"], res["metadatas"])
+    ]
+
+
+lexical_store = LexicalStore(LEXICAL_DIR, LEXICAL_CACHE_USERS, _lexical_bootstrap)
+
+
+def lexical_search(
+    query: str, user_id: int, k: int = 8, file_ids: Set[str] | None = None
+) -> List[Tuple[Document, float]]:
+    """BM25-поиск по чанкам пользователя: (документ, bm25-оценка)."""
+    hits = lexical_store.search(user_id, query, k=k, file_ids=file_ids)
+    if not hits:
+        return []
+
+    key = ("bm25", user_id, _user_generation[user_id], tuple(c for c, _ in hits))
+    if (cached := retrieval_cache.get(key)) is not None:
+        return cached
+
+    col = user_collection(user_id, create=False)
+    if col is None:
+        return []
+    res = col.get(ids=[c for c, _ in hits], include=["documents", "metadatas"])
+    by_id = {
+        i: Document(id=i, page_content=doc, metadata=meta)
+        for i, doc, meta in zip(res["ids"], res["documents"], res["metadatas"])
+    }
+    result = [(by_id[c], score) for c, score in hits if c in by_id]
+    retrieval_cache.put(key, result)
+    return result
+
+
+# ─── имена файлов ────────────────────────────────────────────────────────────
+def _file_names_bootstrap(user_id: int) -> List[Tuple[str, str]]:
+    """(file_id, file_name) пользователя из метаданных — для первой сборки индекса."""
+    col = user_collection(user_id, create=False)
+    if col is None:
+        return []
+    res = col.get(where=user_where(user_id), include=["metadatas"])
+    return list(
+        {
+            m["file_id"]: m.get("file_name") or m["file_id"] for m in res["metadatas"]
+        }.items()
+    )
+
+
+file_index = FileNameIndex(_file_names_bootstrap)
+
+
+def match_files(user_id: int, hint: str) -> Set[str]:
+    """file_id пользователя, подходящие под подсказку имени файла."""
+    return file_index.match(user_id, hint)
+
+
+def search_stats() -> dict:
+    """Счётчики кэшей поиска и хранилища (для /metrics)."""
+    return {
+        "vector_db_opens": _open_count,
+        "backend": VECTOR_BACKEND,
+        "partition": VECTOR_PARTITION,
+        "query_embeddings": query_cache.stats(),
+        "retrieval": retrieval_cache.stats(),
+        "answers": answer_cache.stats(),
+        "chunk_embeddings": {
+            "hits": embedding_cache.hits,
+            "misses": embedding_cache.misses,
+        },
+        "embedder": embedder.stats(),
+        "query_batcher": query_batcher.stats(),
+        "ingest_batcher": ingest_batcher.stats(),
+    }
+
+
+# ─── внутренний утилити ──────────────────────────────────────────────────────
+def chunk_id(user_id: int, file_id: str, chunk: str) -> str:
+    """Детерминированный ID чанка: одинаковый текст → тот же ID при перезагрузке."""
+    return f"{user_id}_{file_id}_{text_digest(chunk)[:16]}"
+
+
+async def _embed_with_cache(chunks: List[str]) -> Tuple[List[List[float]], int]:
+    """
+    Берёт векторы из кэша, недостающие считает батчами и докладывает в кэш.
+    Возвращает векторы и число реально посчитанных моделью чанков.
+    """
+    cached = await asyncio.to_thread(embedding_cache.get_many, chunks)
+    missing = [c for c in chunks if c not in cached]
+    if missing:
+        vectors = await asyncio.wrap_future(ingest_batcher.submit(missing))
+        fresh = dict(zip(missing, vectors))
+        await asyncio.to_thread(embedding_cache.put_many, list(fresh.items()))
+        cached.update(fresh)
+    return [cached[c] for c in chunks], len(missing)
+
+
+def _diff_file(
+    user_id: int, file_id: str, chunks: List[Tuple[str, str]], is_update: bool
+) -> Tuple[int, Dict[str, Tuple[str, str, int]], List[str]]:
+    """
+    Сравнивает чанки файла с тем, что уже лежит в базе.
+    Возвращает число чанков, {id: (текст, источник, токенов)} новых чанков
+    и устаревшие id. Токены считаются один раз здесь и хранятся в метаданных
+    чанка — бюджет промпта потом их не пересчитывает.
+    """
+    wanted = {chunk_id(user_id, file_id, c): (c, src) for c, src in chunks}
+    old_ids: Set[str] = set()
+    if is_update:
+        where = user_where(user_id, {"file_id": {"$eq": file_id}})
+        old_ids = set(user_collection(user_id).get(where=where, include=[])["ids"])
+
+    fresh = [i for i in wanted if i not in old_ids]
+    tokens = count_tokens_many([wanted[i][0] for i in fresh])
+    new = {i: (*wanted[i], n) for i, n in zip(fresh, tokens)}
+    stale = [i for i in old_ids if i not in wanted]
+    return len(wanted), new, stale
+
+
+def _write_rows(
+    user_id: int,
+    new_rows: List[Tuple[str, str, List[float], dict]],
+    stale: List[str],
+    files: List[Tuple[str, str]],
+) -> None:
+    """Удаляет устаревшие чанки пользователя и пишет новые пачками."""
+    with write_lock:
+        col = user_collection(user_id)
+        for lo in range(0, len(stale), UPSERT_BATCH_SIZE):
+            col.delete(ids=stale[lo : lo + UPSERT_BATCH_SIZE])
+        for lo in range(0, len(new_rows), UPSERT_BATCH_SIZE):
+            ids, docs, vecs, metas = zip(*new_rows[lo : lo + UPSERT_BATCH_SIZE])
+            col.upsert(
+                ids=list(ids),
+                documents=list(docs),
+                embeddings=list(vecs),
+                metadatas=list(metas),
+            )
+        for file_id, file_name in files:
+            file_index.add(user_id, file_id, file_name)
+        lexical_store.update(
+            user_id,
+            added=[(i, meta["file_id"], c) for i, c, _, meta in new_rows],
+            removed=stale,
+        )
+        invalidate_user(user_id)
+
+
+def _rename_file(user_id: int, file_id: str, file_name: str) -> None:
+    """Новое имя файла — в метаданные всех его чанков и в индекс имён."""
+    with write_lock:
+        col = user_collection(user_id)
+        where = user_where(user_id, {"file_id": {"$eq": file_id}})
+        res = col.get(where=where, include=["metadatas"])
+        for lo in range(0, len(res["ids"]), UPSERT_BATCH_SIZE):
+            col.update(
+                ids=res["ids"][lo : lo + UPSERT_BATCH_SIZE],
+                metadatas=[
+                    {**meta, "file_name": file_name}
+                    for meta in res["metadatas"][lo : lo + UPSERT_BATCH_SIZE]
+                ],
+            )
+        file_index.add(user_id, file_id, file_name)
+    invalidate_user(user_id)
 
 
 # ─── основная функция записи документов ──────────────────────────────────────
-async def store_documents_async(
-    file_text_data: Iterable[Tuple[str, str, str, int]],
-    persist_dir: Path | str = CHROMA_DIR,
-) -> Chroma | None:
+# блокировки записи по пользователям — свои у каждого event loop
+# (loop → user_id → Lock; неиспользуемые блокировки и закрытые loop уходят сами)
+_store_locks: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def _store_lock(user_id: int) -> asyncio.Lock:
+    per_loop = _store_locks.setdefault(
+        asyncio.get_running_loop(), weakref.WeakValueDictionary()
+    )
+    lock = per_loop.get(user_id)
+    if lock is None:
+        lock = per_loop[user_id] = asyncio.Lock()
+    return lock
+
+
+async def store_documents_async(files_data: Iterable[FileChunks]) -> List[str]:
     """
     Обновляет Chroma:
       • максимум 10 файлов на пользователя;
-      • повторный file_id → полный перезапис векторов;
-      • «лишние» новые файлы (когда лимит достигнут) пропускаются.
+      • повторный file_id → инкрементальное обновление: ID чанка — хэш его
+        текста, поэтому неизменённые чанки остаются, новые добавляются,
+        исчезнувшие удаляются;
+      • у переименованного файла новое имя проставляется и оставшимся
+        чанкам, даже если текст не изменился;
+      • «лишние» новые файлы (когда лимит достигнут) пропускаются;
+      • лимит считается по каталогу файлов (indexed_file), после записи
+        каталог обновляется.
+
+    Векторы новых чанков берутся из кэша эмбеддингов, а недостающие
+    считаются общими батчами (EMBED_BATCH_SIZE) вместе с параллельными
+    загрузками других пользователей. Нарезка и запись в базу идут в пуле
+    потоков — event loop бота не блокируется. Файлы приходят уже нарезанными
+    (split_segments), у каждого чанка в метаданных — его источник (source).
+
+    Возвращает file_id, которые теперь актуальны в базе (записанные
+    и неизменённые); пропущенные по лимиту в список не попадают.
     """
-    data = list(file_text_data)
+    data = list(files_data)
     if not data:
         logger.warning("store_documents_async: пустой вход")
-        return None
-
-    db = load_vector_db(persist_dir)
+        return []
 
     # --- группировка входных файлов по пользователям -------------------------
-    per_user: Dict[int, List[Tuple[str, str, str]]] = defaultdict(list)
-    for file_id, file_name, text, user_id in file_text_data:
-        per_user[user_id].append((file_id, file_name, text))
+    per_user: Dict[int, List[FileChunks]] = defaultdict(list)
+    for f in data:
+        per_user[f.user_id].append(f)
+
+    # лимит → дифф → запись → каталог под блокировкой пользователя: иначе два
+    # параллельных /load_drive увидят старое число файлов и превысят лимит.
+    # Порядок захвата — по user_id, чтобы пачки не ждали друг друга по кругу.
+    async with AsyncExitStack() as stack:
+        for user_id in sorted(per_user):
+            await stack.enter_async_context(_store_lock(user_id))
+        return await _store_users(per_user)
+
 
-    # --- обработка каждого пользователя --------------------------------------
+async def _store_users(per_user: Dict[int, List[FileChunks]]) -> List[str]:
+    """Тело store_documents_async; вызывается под блокировками пользователей."""
+    # --- план: для каждого файла — какие чанки добавить и какие удалить ------
+    # user, file_id, name, {id: (chunk, источник, токенов)} новых, устаревшие id,
+    # всего чанков
+    plan: List[
+        Tuple[int, str, str, Dict[str, Tuple[str, str, int]], List[str], int]
+    ] = []
+    indexed: List[str] = []
+    # user → (file_id, имя, чанков, байт, изменён) для каталога файлов
+    catalog: Dict[int, List[Tuple[str, str, int, int, bool]]] = defaultdict(list)
     for user_id, files in per_user.items():
-        existing = _user_file_set(db, user_id)
-
-        for file_id, file_name, text in files:
-            # перезапись, если такой file_id уже был
-            if file_id in existing:
-                db._collection.delete(
-                    where={
-                        "$and": [
-                            {"file_id": {"$eq": file_id}},
-                            {"user_id": {"$eq": user_id}},
-                        ]
-                    }
-                )
-                existing.remove(file_id)
+        known = {f.file_id: f.file_name for f in await known_files(user_id)}
+        existing = set(known)
+
+        for f in files:
+            file_id, file_name = f.file_id, f.file_name
+            # повторный file_id не занимает новое место в лимите
+            is_update = file_id in existing
+            existing.discard(file_id)
 
             # проверка лимита
             if len(existing) >= MAX_FILES_PER_USER:
@@ -98,28 +648,85 @@ async def store_documents_async(
                     file_id,
                 )
                 continue
-
-            # добавление новых чанков
-            header = f"=== FILE: {file_name.lower()} ===\n"
-            text_with_header = header + text
-            chunks = splitter.split_text(text_with_header)
-
-            ids = [f"{file_id}_{uuid4().hex[:8]}_{i}" for i in range(len(chunks))]
-            metadatas = [
-                {"file_id": file_id, "file_name": file_name, "user_id": user_id}
-            ] * len(chunks)
-
-            db._collection.add(
-                ids=ids,
-                documents=chunks,
-                embeddings=embedder.embed_documents(chunks),
-                metadatas=metadatas,
-            )
             existing.add(file_id)
-            logger.info(
-                "✅ user %s: сохранён %s (%d чанков)", user_id, file_id, len(chunks)
+            indexed.append(file_id)
+
+            if is_update and known[file_id] != file_name:
+                await asyncio.to_thread(_rename_file, user_id, file_id, file_name)
+                logger.info(
+                    "✏️ user %s: %s переименован: %s → %s",
+                    user_id,
+                    file_id,
+                    known[file_id],
+                    file_name,
+                )
+
+            total, new, stale = await asyncio.to_thread(
+                _diff_file, user_id, file_id, f.chunks, is_update
             )
+            changed = bool(new or stale)
+            catalog[user_id].append((file_id, file_name, total, f.text_bytes, changed))
+            if not changed:
+                logger.info(
+                    "♻️ user %s: %s не изменился (%d чанков)", user_id, file_id, total
+                )
+                continue
+            plan.append((user_id, file_id, file_name, new, stale, total))
+
+    if not plan:
+        for user_id, files in catalog.items():
+            await file_catalog.save_files(user_id, files)
+        return indexed
 
-    db.persist()
-    logger.info("📦 Chroma сохранена")
-    return db
+    # --- эмбеддинг новых чанков (кэш + общие батчи) ---------------------------
+    chunks = [c for _, _, _, new, _, _ in plan for c, _, _ in new.values()]
+    started = time.perf_counter()
+    vectors, embedded = await _embed_with_cache(chunks)
+    elapsed = time.perf_counter() - started
+    rate = embedded / elapsed if elapsed and embedded else 0.0
+
+    # --- раскладываем по коллекциям пользователей -----------------------------
+    # user → (id, текст, вектор, метаданные) новых чанков и устаревшие id
+    rows: Dict[int, List[Tuple[str, str, List[float], dict]]] = defaultdict(list)
+    stale_ids: Dict[int, List[str]] = defaultdict(list)
+    vec_iter = iter(vectors)
+    for user_id, file_id, file_name, new, stale, _ in plan:
+        meta = {"file_id": file_id, "file_name": file_name, "user_id": user_id}
+        rows[user_id].extend(
+            (i, c, next(vec_iter), {**meta, "source": src, "tokens": n})
+            for i, (c, src, n) in new.items()
+        )
+        stale_ids[user_id].extend(stale)
+
+    # --- запись: удаляем устаревшие чанки и пишем новые пачками ---------------
+    for user_id in {p[0] for p in plan}:
+        files = [(p[1], p[2]) for p in plan if p[0] == user_id]
+        await asyncio.to_thread(
+            _write_rows, user_id, rows[user_id], stale_ids[user_id], files
+        )
+
+    for user_id, files in catalog.items():
+        await file_catalog.save_files(user_id, files)
+
+    for user_id, file_id, _, new, stale, total in plan:
+        logger.info(
+            "✅ user %s: сохранён %s (%d чанков, новых %d, удалено %d, %.1f чанков/с)",
+            user_id,
+            file_id,
+            total,
+            len(new),
+            len(stale),
+            rate,
+        )
+    logger.info(
+        "📦 Chroma сохранена: новых чанков %d, из кэша %d, посчитано %d за %.2f с "
+        "(%.1f чанков/с, батч %d, среднее за процесс %.1f чанков/с)",
+        len(chunks),
+        len(chunks) - embedded,
+        embedded,
+        elapsed,
+        rate,
+        ingest_batcher.batch_size,
+        ingest_batcher.throughput(),
+    )
+    return indexed
@@ -0,0 +1,22 @@
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlmodel import Field, SQLModel
+
+
+class IndexedFile(SQLModel, table=True):
+    """Файл пользователя, проиндексированный в базе знаний."""
+
+    __tablename__ = "indexed_file"
+
+    telegram_id: int = Field(primary_key=True)
+    file_id: str = Field(primary_key=True)
+
+    file_name: str
+    chunk_count: int = 0
+    size_bytes: int = 0  # размер извлечённого текста, UTF-8
+    indexed_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc).replace(tzinfo=None)
+    )
+    # отпечаток метаданных Drive (JSON) — для пропуска неизменённых файлов
+    fingerprint: Optional[str] = None
@@ -1,5 +1,7 @@
 from fastapi import FastAPI
 
+from app.routes.health import router as health_router
+from app.routes.metrics import router as metrics_router
 from app.routes.oauth import router as oauth_router
 from app.routes.telegram_webhook import router as telegram_router
 
@@ -7,3 +9,5 @@ from app.routes.telegram_webhook import router as telegram_router
 def setup_routes(app: FastAPI):
     app.include_router(telegram_router)
     app.include_router(oauth_router)
+    app.include_router(metrics_router)
+    app.include_router(health_router)
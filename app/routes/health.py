@@ -0,0 +1,23 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.core.config import EMBEDDER_WARMUP
+from app.core.readiness import uptime
+from app.core.vector_store import embedder
+
+router = APIRouter()
+
+
+@router.get("/ready")
+async def ready():
+    """
+    Готовность: 503, пока эмбеддер не прогрет после старта. Без
+    EMBEDDER_WARMUP модель грузится первым запросом — сервис готов сразу.
+    """
+    is_ready = embedder.warm or not EMBEDDER_WARMUP
+    body = {
+        "ready": is_ready,
+        "uptime_sec": round(uptime(), 1),
+        **embedder.stats(),
+    }
+    return JSONResponse(body, status_code=200 if is_ready else 503)
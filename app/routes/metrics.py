@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+
+from app.core.loop_monitor import loop_lag_stats
+from app.core.vector_store import search_stats
+from app.services import extraction
+from app.telegram.ai_reply import translation_cache
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def metrics():
+    """Счётчики кэшей и хранилища, задержка event loop и пул разбора в JSON."""
+    return {
+        "search": search_stats(),
+        "translations": translation_cache.stats(),
+        "event_loop": loop_lag_stats(),
+        "extraction": extraction.stats(),
+    }
@@ -0,0 +1,196 @@
+"""
+app/services/extraction.py
+
+Разбор документов (PDF, DOCX, таблицы) и нарезка на чанки вне event loop.
+
+Парсеры — CPU-работа под GIL: в пуле потоков они всё равно тормозят
+event loop, на котором висят чаты остальных пользователей. Поэтому файл
+уходит байтами в пул процессов (EXTRACT_WORKERS, по умолчанию по числу
+ядер), обратно приходят готовые чанки (FileChunks).
+
+  • лимит CPU на файл — RLIMIT_CPU процесса-разборщика: на превышении ядро
+    присылает SIGXCPU и процесс завершается, даже если он застрял в C-коде;
+  • падение процесса (лимит CPU, segfault парсера на битом файле) ломает
+    пул целиком — он пересоздаётся. Файлы, попавшие под падение, повторяются
+    каждый в своём одноразовом процессе: виновник падает ещё раз и
+    пропускается, остальные файлы разбираются как обычно.
+
+Процессы стартуют через spawn и импортируют только этот модуль, читатели
+и нарезку — без Chroma и модели эмбеддингов.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Iterator
+
+from app.core.chunking import FileChunks, split_segments
+from app.core.config import EXTRACT_CPU_LIMIT_SEC, EXTRACT_IN_PROCESS, EXTRACT_WORKERS
+from app.core.logging_config import get_logger
+from app.services.reader.base_reader import BaseReader
+from app.services.reader.csv_reader import CsvReader
+from app.services.reader.docx_reader import DocxReader
+from app.services.reader.excel_reader import ExcelReader
+from app.services.reader.pdf_reader import PdfReader
+from app.services.reader.txt_reader import TxtReader
+
+try:  # RLIMIT_CPU есть только на Unix
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+logger = get_logger(__name__)
+
+READERS: dict[str, type[BaseReader]] = {
+    "text/plain": TxtReader,
+    "application/pdf": PdfReader,
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": DocxReader,
+    "text/csv": CsvReader,
+    "application/vnd.ms-excel": CsvReader,
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": ExcelReader,
+}
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+_crashes = 0  # сколько раз пул пересоздавался
+
+
+# ─── код процесса-разборщика ─────────────────────────────────────────────────
+@contextmanager
+def _cpu_limit(seconds: int) -> Iterator[None]:
+    """Даёт текущему файлу не больше seconds процессорного времени."""
+    if resource is None or seconds <= 0:
+        yield
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # RLIMIT_CPU считает всё время процесса — сдвигаем мягкий лимит от
+    # уже потраченного; жёсткий не трогаем, иначе его не вернуть назад
+    limit = math.ceil(usage.ru_utime + usage.ru_stime) + seconds
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (limit, hard))
+    try:
+        yield
+    finally:
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _extract(
+    mime_type: str,
+    file_id: str,
+    file_name: str,
+    user_id: int,
+    content: bytes,
+    cpu_limit: int,
+) -> FileChunks:
+    """Парсит файл и режет на чанки (выполняется в процессе пула)."""
+    reader = READERS[mime_type]()
+    with _cpu_limit(cpu_limit):
+        return split_segments(file_id, file_name, user_id, reader.segments(content))
+
+
+# ─── пул процессов ───────────────────────────────────────────────────────────
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = EXTRACT_WORKERS or os.cpu_count() or 1
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info("🧩 Пул разбора документов: %d процессов", workers)
+        return _pool
+
+
+def _drop_pool(broken: ProcessPoolExecutor) -> None:
+    """Выбрасывает упавший пул; следующий вызов создаст новый."""
+    global _pool, _crashes
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+            _crashes += 1
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+async def _extract_isolated(
+    loop: asyncio.AbstractEventLoop, args: tuple
+) -> FileChunks | None:
+    """Разбор в отдельном процессе: его падение не заденет чужие файлы."""
+    solo = ProcessPoolExecutor(
+        max_workers=1, mp_context=multiprocessing.get_context("spawn")
+    )
+    try:
+        return await loop.run_in_executor(solo, _extract, *args)
+    except BrokenProcessPool:
+        return None
+    finally:
+        solo.shutdown(wait=False)
+
+
+async def extract_chunks(
+    mime_type: str, file_id: str, file_name: str, user_id: int, content: bytes
+) -> FileChunks | None:
+    """
+    Разбирает файл в пуле процессов и возвращает его чанки.
+    None — процесс разбора упал (битый файл или превышен лимит CPU).
+    Ошибки парсера (исключения) пробрасываются вызывающему.
+    """
+    if not EXTRACT_IN_PROCESS:
+        return await asyncio.to_thread(
+            _extract, mime_type, file_id, file_name, user_id, content, 0
+        )
+
+    loop = asyncio.get_running_loop()
+    args = (
+        mime_type,
+        file_id,
+        file_name,
+        user_id,
+        bytes(content),
+        EXTRACT_CPU_LIMIT_SEC,
+    )
+    pool = _get_pool()
+    try:
+        return await loop.run_in_executor(pool, _extract, *args)
+    except BrokenProcessPool:
+        _drop_pool(pool)
+
+    # пул падает целиком: виновник — этот файл или любой соседний
+    logger.info(
+        "🔁 Пул разбора упал во время %s — повтор в отдельном процессе", file_name
+    )
+    chunks = await _extract_isolated(loop, args)
+    if chunks is None:
+        logger.warning(
+            "💥 Процесс разбора упал на %s: битый файл или больше %d с CPU",
+            file_name,
+            EXTRACT_CPU_LIMIT_SEC,
+        )
+    return chunks
+
+
+def shutdown() -> None:
+    """Останавливает пул разбора (при остановке сервиса)."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def stats() -> dict:
+    return {
+        "in_process": EXTRACT_IN_PROCESS,
+        "workers": EXTRACT_WORKERS or os.cpu_count() or 1,
+        "cpu_limit_sec": EXTRACT_CPU_LIMIT_SEC,
+        "crashes": _crashes,
+    }
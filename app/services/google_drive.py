@@ -1,29 +1,41 @@
 """
 app/services/google_drive.py
 
-Чтение текстовых файлов из Google Drive c поддержкой:
+Доступ к текстовым файлам Google Drive. Поиск файлов поддерживает:
   • all            – все подходящие файлы (до MAX_FILES_PER_RUN)
   • списка файлов  – точное совпадение name
   • списка папок   – все файлы внутри этих папок
   • комбинированного списка (файлы + папки)
 
-Формат возвращаемого списка:
-    (file_id, file_name, extracted_text, user_id)
+Поиск (find_drive_files), скачивание (download_file) и извлечение текста
+с нарезкой на чанки (extract_chunks) — отдельные шаги. Конвейер загрузки
+(app/services/ingest_pipeline.py) прогоняет их по каждому файлу, не
+дожидаясь остальных.
 """
 
 from __future__ import annotations
 
+import asyncio
 import logging
-from typing import Awaitable, Callable, List, Sequence
+import random
+import weakref
+from collections import Counter
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, Iterable, List, Sequence, Tuple
 
 import filetype
 import httpx
 
-from app.services.reader.csv_reader import CsvReader
-from app.services.reader.docx_reader import DocxReader
-from app.services.reader.excel_reader import ExcelReader
-from app.services.reader.pdf_reader import PdfReader
-from app.services.reader.txt_reader import TxtReader
+from app.core.chunking import FileChunks
+from app.core.config import (
+    DRIVE_FILE_TIMEOUT_SEC,
+    DRIVE_GLOBAL_CONCURRENCY,
+    DRIVE_RETRIES,
+    DRIVE_USER_CONCURRENCY,
+    MAX_FILE_SIZE_KB,
+)
+from app.services import extraction
+from app.services.sync_manifest import SyncManifest
 
 logger = logging.getLogger(__name__)
 
@@ -39,43 +51,77 @@ TEXT_MIME_TYPES = {
 FOLDER_MIME = "application/vnd.google-apps.folder"
 
 MAX_FILES_PER_RUN = 10
-MAX_FILE_SIZE = 100 * 1024  # 100 КБ
+MAX_FILE_SIZE = 100 * 1024  # 100 КБ — для форматов без своего лимита
+BUFFER_START = 1024 * 1024  # начальный буфер, если размер в метаданных неизвестен
+
+# поля метаданных файла: modifiedTime/md5Checksum/size — отпечаток для манифеста
+FILE_FIELDS = "files(id,name,mimeType,parents,modifiedTime,md5Checksum,size)"
+
+LIST_PAGE_SIZE = 1000  # максимум Drive API
+MAX_LIST_FILES = 5000  # бюджет листинга за один запуск (все страницы, все папки)
+MAX_FOLDER_DEPTH = 3  # глубина обхода подпапок для «Папка/**»
+NAMES_PER_QUERY = 20  # имён в одном OR-запросе (лимит длины q)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# квоты Drive отвечает 403 с такой причиной в теле — это тоже повод повторить
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+RETRY_BASE_SEC = 0.5  # базовая пауза экспоненциального backoff
+
+# счётчик запросов к API для текущего запуска (см. track_api_calls)
+_api_calls: ContextVar[Counter | None] = ContextVar("drive_api_calls", default=None)
+
+# семафоры скачиваний (глобальный + по пользователям) — свои у каждого loop;
+# запись о loop уходит вместе с ним (слабая ссылка)
+_LoopSlots = Tuple[
+    asyncio.Semaphore, "weakref.WeakValueDictionary[int, asyncio.Semaphore]"
+]
+_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopSlots]" = (
+    weakref.WeakKeyDictionary()
+)
 
 
 # ──────────────────────────────────────────────────────────────
 # ─── public API ───────────────────────────────────────────────
 # ──────────────────────────────────────────────────────────────
-async def read_files_from_drive(
-    access_token: str,
-    user_id: int,
+def auth_headers(access_token: str) -> dict:
+    return {"Authorization": f"Bearer {access_token}"}
+
+
+async def find_drive_files(
+    client: httpx.AsyncClient,
+    headers: dict,
     on_progress: Callable[[str], Awaitable[None]],
     *,
     file_names: Sequence[str] | None = None,
     folder_names: Sequence[str] | None = None,
-) -> List[tuple[str, str, str, int]]:
+    recursive_folders: Sequence[str] | None = None,
+    manifest: SyncManifest | None = None,
+) -> List[dict]:
     """
-    Читает текстовые файлы из Google Drive.
+    Находит файлы Google Drive для загрузки.
 
     Параметры
     ---------
-    access_token : str
-        OAuth-токен пользователя.
-    user_id : int
-        Telegram ID — сохраняется в результате.
+    client, headers
+        HTTP-клиент и заголовок авторизации (см. auth_headers).
     on_progress : coroutine(str) -> None
         Callback для вывода статуса пользователю.
     file_names : list[str] | None
         Точные имена файлов (без пути). Если None, режим «читать всё».
     folder_names : list[str] | None
         Точные имена папок. Если заданы, читаем файлы из этих папок.
+    recursive_folders : list[str] | None
+        Те из folder_names, которые обходим вместе с подпапками (в ширину,
+        до MAX_FOLDER_DEPTH уровней).
+    manifest : SyncManifest | None
+        Манифест синхронизации. Файлы с неизменённым отпечатком
+        (modifiedTime, md5Checksum, size) в результат не попадают.
 
     Возвращает
     ----------
-    list[tuple[file_id, file_name, text, user_id]]
+    list[dict] — метаданные (id, name, mimeType, …) поддерживаемых файлов,
+    не больше MAX_FILES_PER_RUN.
     """
-    tok_short = access_token[:10] + "…" if len(access_token) > 10 else access_token
-    logger.info("🚀 read_files_from_drive started, token=%s", tok_short)
-
     # «all» – это когда не передали file_names и folder_names
     read_all_mode = file_names is None and folder_names is None
     if read_all_mode:
@@ -83,55 +129,45 @@ async def read_files_from_drive(
     else:
         await on_progress("🔄 Ищу указанные файлы/папки в Google Диске…")
 
-    headers = {"Authorization": f"Bearer {access_token}"}
+    meta_list: list[dict] = []
+    budget = _Budget(MAX_LIST_FILES)
 
-    async with httpx.AsyncClient() as client:
-        meta_list: list[dict] = []
-
-        # 1) Режим «читать всё»
-        if read_all_mode:
-            meta_list = await _list_files(
-                client,
-                headers,
-                q="trashed=false",
-                fields="files(id,name,mimeType,parents)",
-            )
+    # 1) Режим «читать всё»: сразу только поддерживаемые типы, все страницы
+    if read_all_mode:
+        meta_list = await _list_files(
+            client,
+            headers,
+            q=f"trashed=false and {_any_of('mimeType', TEXT_MIME_TYPES)}",
+            fields=FILE_FIELDS,
+            budget=budget,
+        )
 
-        # 2) Папки: для каждой находим id, затем вытаскиваем файлы внутри
-        if folder_names:
-            for folder in folder_names:
-                q_folder = (
-                    f"trashed=false and mimeType='{FOLDER_MIME}' and name='{folder}'"
-                )
-                folders = await _list_files(client, headers, q=q_folder, page_size=1)
-                if not folders:
-                    logger.info("📂 Папка «%s» не найдена", folder)
-                    continue
-
-                folder_id = folders[0]["id"]
-                q_inside = f"'{folder_id}' in parents and trashed=false"
-                files_in_folder = await _list_files(
-                    client, headers, q_inside, fields="files(id,name,mimeType,parents)"
-                )
-                meta_list.extend(files_in_folder)
+    # 2) Папки: id всех папок — одним OR-запросом, затем их содержимое
+    if folder_names:
+        recursive = set(recursive_folders or ())
+        found = await _find_by_names(
+            client, headers, folder_names, f"mimeType='{FOLDER_MIME}'"
+        )
+        for folder in folder_names:
+            if folder not in found:
+                logger.info("📂 Папка «%s» не найдена", folder)
+        flat = [m["id"] for n, m in found.items() if n not in recursive]
+        deep = [m["id"] for n, m in found.items() if n in recursive]
+        meta_list.extend(await _walk_folders(client, headers, flat, 0, budget))
+        meta_list.extend(
+            await _walk_folders(client, headers, deep, MAX_FOLDER_DEPTH, budget)
+        )
 
-        # 3) Файлы: для каждого имени находим файл (первое совпадение)
-        if file_names:
-            for name in file_names:
-                q_file = (
-                    f"trashed=false and name='{name}' and mimeType!='{FOLDER_MIME}'"
-                )
-                files = await _list_files(
-                    client,
-                    headers,
-                    q=q_file,
-                    page_size=1,
-                    fields="files(id,name,mimeType,parents)",
-                )
-                if files:
-                    meta_list.append(files[0])
-                else:
-                    logger.info("📄 Файл «%s» не найден", name)
+    # 3) Файлы: все имена — несколькими OR-запросами (первое совпадение)
+    if file_names:
+        found = await _find_by_names(
+            client, headers, file_names, f"mimeType!='{FOLDER_MIME}'", FILE_FIELDS
+        )
+        for name in file_names:
+            if name in found:
+                meta_list.append(found[name])
+            else:
+                logger.info("📄 Файл «%s» не найден", name)
 
     if not meta_list:
         logger.info("❌ Ничего не найдено по запросу.")
@@ -145,120 +181,357 @@ async def read_files_from_drive(
             seen.add(m["id"])
             unique_meta.append(m)
 
-    # ── Оставляем только поддерживаемые MIME и ограничиваем количество
-    candidates = [m for m in unique_meta if m["mimeType"] in TEXT_MIME_TYPES][
-        :MAX_FILES_PER_RUN
+    # ── Оставляем только поддерживаемые MIME
+    supported = [m for m in unique_meta if m["mimeType"] in TEXT_MIME_TYPES]
+
+    # ── Слишком большие отсекаем по size из листинга, не скачивая
+    oversized = [
+        m for m in supported if int(m.get("size") or 0) > max_file_size(m["mimeType"])
     ]
+    if oversized:
+        logger.info(
+            "⏭ Больше лимита формата (по метаданным): %s",
+            ", ".join(m["name"] for m in oversized),
+        )
+        await on_progress(f"⏭ {len(oversized)} больше лимита размера, пропущено")
+        big = {m["id"] for m in oversized}
+        supported = [m for m in supported if m["id"] not in big]
+
+    # ── Пропускаем файлы, которые не менялись с прошлой индексации
+    if manifest is not None:
+        changed = [m for m in supported if not manifest.is_unchanged(m)]
+        unchanged = len(supported) - len(changed)
+        if unchanged:
+            logger.info("♻️ Без изменений, пропущено: %d", unchanged)
+            await on_progress(f"♻️ {unchanged} без изменений, пропущено")
+        supported = changed
+
+    # ── Ограничиваем количество
+    candidates = supported[:MAX_FILES_PER_RUN]
     logger.info("📄 К обработке выбрано %d файлов", len(candidates))
+    return candidates
 
-    result: list[tuple[str, str, str, int]] = []
 
-    for meta in candidates:
-        file_id, file_name, mime_type = meta["id"], meta["name"], meta["mimeType"]
-        await on_progress(f"🔍 Читаю: {file_name}")
+async def download_file(
+    client: httpx.AsyncClient, headers: dict, meta: dict, user_id: int
+) -> bytearray | None:
+    """
+    Скачивает файл. None — больше лимита формата (max_file_size), ошибка сети
+    или таймаут.
+    Одновременных скачиваний не больше DRIVE_USER_CONCURRENCY на пользователя
+    и DRIVE_GLOBAL_CONCURRENCY на процесс.
+    """
+    global_slots, user_slots = _download_slots()
+    user_sem = user_slots.get(user_id)
+    if user_sem is None:
+        user_sem = user_slots[user_id] = asyncio.Semaphore(DRIVE_USER_CONCURRENCY)
 
-        text = await _download_and_extract_text(
-            file_id=file_id,
-            file_name=file_name,
-            mime_type=mime_type,
-            headers=headers,
-        )
+    async with user_sem, global_slots:
+        try:
+            return await asyncio.wait_for(
+                _download(client, headers, meta), DRIVE_FILE_TIMEOUT_SEC
+            )
+        except asyncio.TimeoutError:
+            logger.warning(
+                "⌛ %s не скачан за %.0f с", meta["name"], DRIVE_FILE_TIMEOUT_SEC
+            )
+            return None
 
-        if text:
-            result.append((file_id, file_name, text, user_id))
-            await on_progress(f"✅ Готово: {file_name}")
-        else:
-            await on_progress(f"⚠️ Пропущен: {file_name}")
 
-        if len(result) >= MAX_FILES_PER_RUN:
-            break
+async def _download(
+    client: httpx.AsyncClient, headers: dict, meta: dict
+) -> bytearray | None:
+    """
+    Потоковое скачивание в заранее выделенный буфер (размер — из метаданных
+    листинга): куски пишутся на место без повторного копирования, загрузка
+    обрывается, как только превышен лимит формата. Без размера в метаданных
+    буфер растёт удвоением до лимита.
+    """
+    file_name = meta["name"]
+    export_url = f"https://www.googleapis.com/drive/v3/files/{meta['id']}?alt=media"
+    limit = max_file_size(meta["mimeType"])
+    size = int(meta.get("size") or 0)
+    buf = bytearray(size if 0 < size <= limit else min(limit, BUFFER_START))
+    n = 0
+
+    try:
+        resp = await _drive_get(client, export_url, headers, stream=True)
+        try:
+            async for chunk in resp.aiter_bytes():
+                end = n + len(chunk)
+                if end > len(buf):
+                    if end > limit:
+                        logger.info(
+                            "⏭ %s > %d КБ (прервано на %d байт)",
+                            file_name,
+                            limit // 1024,
+                            end,
+                        )
+                        return None
+                    # размер неизвестен или в метаданных меньше фактического
+                    grow = min(max(end, 2 * len(buf)), limit) - len(buf)
+                    buf.extend(bytes(grow))
+                buf[n:end] = chunk
+                n = end
+        finally:
+            await resp.aclose()
+    except Exception as e:
+        logger.warning("❌ Не скачан %s: %s", file_name, e)
+        return None
+
+    del buf[n:]
+    return buf
+
+
+async def extract_chunks(
+    meta: dict, content: bytes | bytearray, user_id: int
+) -> FileChunks | None:
+    """
+    Извлекает текст из скачанного файла и сразу режет его на чанки: сегменты
+    читателя (страницы, листы, блоки абзацев) уходят в нарезку по одному.
+    Парсер и нарезка работают в пуле процессов (app/services/extraction.py).
+    None — формат не поддерживается, файл не читается или в нём нет текста.
+    """
+    file_name, mime_type = meta["name"], meta["mimeType"]
+
+    # Уточняем MIME, если нестандартный
+    if mime_type not in TEXT_MIME_TYPES:
+        if kind := filetype.guess(content):
+            mime_type = kind.mime
+
+    if mime_type not in extraction.READERS:
+        logger.debug("⏭ %s — неподдерживаемый MIME %s", file_name, mime_type)
+        return None
+
+    try:
+        chunks = await extraction.extract_chunks(
+            mime_type, meta["id"], file_name, user_id, content
+        )
+    except Exception as e:
+        logger.warning("⚠️ Ошибка чтения %s: %s", file_name, e)
+        return None
+    return chunks if chunks and chunks.chunks else None
+
 
-    await on_progress(f"📥 Успешно считано файлов: {len(result)}")
-    logger.info("🏁 read_files_from_drive finished. total=%d", len(result))
-    return result
+def max_file_size(mime_type: str) -> int:
+    """Лимит размера файла в байтах для его формата (MAX_FILE_SIZE_KB)."""
+    fmt = TEXT_MIME_TYPES.get(mime_type)
+    if fmt not in MAX_FILE_SIZE_KB:
+        return MAX_FILE_SIZE
+    return MAX_FILE_SIZE_KB[fmt] * 1024
 
 
 # ──────────────────────────────────────────────────────────────
 # ─── helpers ──────────────────────────────────────────────────
 # ──────────────────────────────────────────────────────────────
+class _Budget:
+    """Сколько ещё файлов можно получить листингом за этот запуск."""
+
+    def __init__(self, left: int) -> None:
+        self.left = left
+
+
+def _q_str(value: str) -> str:
+    """Строковый литерал для q (экранируем \\ и ')."""
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def _any_of(field: str, values: Iterable[str]) -> str:
+    return "(" + " or ".join(f"{field}={_q_str(v)}" for v in values) + ")"
+
+
 async def _list_files(
     client: httpx.AsyncClient,
     headers: dict,
     q: str,
     *,
-    page_size: int = 100,
+    page_size: int = LIST_PAGE_SIZE,
     fields: str = "files(id,name,mimeType)",
+    budget: _Budget | None = None,
 ) -> list[dict]:
-    """Вспомогательная обёртка над Drive list API (одностранично)."""
-    resp = await client.get(
-        "https://www.googleapis.com/drive/v3/files",
-        headers=headers,
-        params={
-            "pageSize": page_size,
-            "fields": fields,
-            "q": q,
-        },
-    )
-    resp.raise_for_status()
-    return resp.json().get("files", [])
+    """Drive list API по всем страницам (nextPageToken), в пределах бюджета."""
+    files: list[dict] = []
+    params = {"pageSize": page_size, "fields": f"nextPageToken,{fields}", "q": q}
+    while True:
+        resp = await _drive_get(
+            client,
+            "https://www.googleapis.com/drive/v3/files",
+            headers,
+            params=params,
+            kind="list",
+        )
+        data = resp.json()
+        page = data.get("files", [])
+        if budget is not None:
+            page = page[: max(budget.left, 0)]
+            budget.left -= len(page)
+        files.extend(page)
+
+        token = data.get("nextPageToken")
+        if not token or (budget is not None and budget.left <= 0):
+            if token:
+                logger.warning(
+                    "⚠️ Листинг Drive остановлен: бюджет %d файлов", MAX_LIST_FILES
+                )
+            return files
+        params = {**params, "pageToken": token}
 
 
-async def _download_and_extract_text(
-    file_id: str,
-    file_name: str,
-    mime_type: str,
+async def _find_by_names(
+    client: httpx.AsyncClient,
     headers: dict,
-) -> str | None:
-    """Скачивает файл и извлекает текст. Возвращает None, если размер >100 КБ или формат не поддерживается."""
-    export_url = f"https://www.googleapis.com/drive/v3/files/{file_id}?alt=media"
+    names: Sequence[str],
+    condition: str,
+    fields: str = "files(id,name,mimeType)",
+) -> Dict[str, dict]:
+    """
+    Ищет объекты по точным именам пачками OR-запросов (параллельно).
+    Возвращает {имя: первое совпадение}.
+    """
+    unique = list(dict.fromkeys(names))
+    groups = [
+        unique[i : i + NAMES_PER_QUERY] for i in range(0, len(unique), NAMES_PER_QUERY)
+    ]
+    pages = await asyncio.gather(
+        *(
+            _list_files(
+                client,
+                headers,
+                q=f"trashed=false and {condition} and {_any_of('name', group)}",
+                fields=fields,
+            )
+            for group in groups
+        )
+    )
+    found: Dict[str, dict] = {}
+    for page in pages:
+        for meta in page:
+            found.setdefault(meta["name"], meta)
+    return found
 
-    async with httpx.AsyncClient() as client:
-        # HEAD для проверки размера
-        try:
-            head = await client.head(export_url, headers=headers, follow_redirects=True)
-            if (cl := head.headers.get("Content-Length")) and int(cl) > MAX_FILE_SIZE:
-                logger.info("⏭ %s > 100 КБ (по Content-Length)", file_name)
-                return None
-        except Exception:
-            pass  # HEAD может не поддерживаться
-
-        # Сам файл
-        try:
-            resp = await client.get(export_url, headers=headers, follow_redirects=True)
-            resp.raise_for_status()
-            content = resp.content
-        except Exception as e:
-            logger.warning("❌ Не скачан %s: %s", file_name, e)
-            return None
 
-    if len(content) > MAX_FILE_SIZE:
-        logger.info("⏭ %s > 100 КБ (факт)", file_name)
-        return None
+async def _walk_folders(
+    client: httpx.AsyncClient,
+    headers: dict,
+    folder_ids: Sequence[str],
+    depth: int,
+    budget: _Budget,
+) -> list[dict]:
+    """
+    Файлы внутри папок; при depth > 0 — и в подпапках, обход в ширину:
+    уровень за уровнем, содержимое папок уровня — параллельными
+    OR-запросами по parents.
+    """
+    files: list[dict] = []
+    seen: set[str] = set()
+    frontier = list(dict.fromkeys(folder_ids))
+    for level in range(depth + 1):
+        frontier = [f for f in frontier if f not in seen]
+        if not frontier or budget.left <= 0:
+            break
+        seen.update(frontier)
+        groups = [
+            frontier[i : i + NAMES_PER_QUERY]
+            for i in range(0, len(frontier), NAMES_PER_QUERY)
+        ]
+        pages = await asyncio.gather(
+            *(
+                _list_files(
+                    client,
+                    headers,
+                    q="trashed=false and ("
+                    + " or ".join(f"{_q_str(fid)} in parents" for fid in group)
+                    + ")",
+                    fields=FILE_FIELDS,
+                    budget=budget,
+                )
+                for group in groups
+            )
+        )
+        frontier = []
+        for page in pages:
+            for meta in page:
+                if meta["mimeType"] == FOLDER_MIME:
+                    frontier.append(meta["id"])
+                else:
+                    files.append(meta)
+        if frontier and level == depth and depth:
+            logger.info("📂 Подпапки глубже %d уровней пропущены", depth)
+    return files
 
-    # Уточняем MIME, если нестандартный
-    if mime_type not in TEXT_MIME_TYPES:
-        if kind := filetype.guess(content):
-            mime_type = kind.mime
 
-    reader = _select_reader(mime_type)
-    if not reader:
-        logger.debug("⏭ %s — неподдерживаемый MIME %s", file_name, mime_type)
-        return None
+def track_api_calls() -> Counter:
+    """
+    Начинает подсчёт запросов к Drive API (list / download) в текущем
+    контексте; задачи, созданные после вызова, пишут в тот же счётчик.
+    """
+    calls: Counter = Counter()
+    _api_calls.set(calls)
+    return calls
 
-    try:
-        return await reader.read(content)
-    except Exception as e:
-        logger.warning("⚠️ Ошибка чтения %s: %s", file_name, e)
-        return None
 
+async def _drive_get(
+    client: httpx.AsyncClient,
+    url: str,
+    headers: dict,
+    *,
+    params: dict | None = None,
+    kind: str = "download",
+    stream: bool = False,
+) -> httpx.Response:
+    """
+    GET к Drive API с повторами на 429/5xx, 403 по квоте и сетевые сбои:
+    экспоненциальная пауза со случайным джиттером (или Retry-After от сервера).
+    stream=True — тело не читается; ответ закрывает вызывающий (aclose).
+    """
+    calls = _api_calls.get()
+    for attempt in range(DRIVE_RETRIES + 1):
+        if calls is not None:
+            calls[kind] += 1
+        try:
+            request = client.build_request("GET", url, headers=headers, params=params)
+            resp = await client.send(request, stream=stream, follow_redirects=True)
+            retry = resp.status_code in RETRY_STATUSES or await _rate_limited(resp)
+            if not retry or attempt == DRIVE_RETRIES:
+                if resp.is_error:
+                    await resp.aclose()
+                resp.raise_for_status()
+                return resp
+            await resp.aclose()
+            reason = str(resp.status_code)
+            retry_after = resp.headers.get("Retry-After", "")
+        except httpx.TransportError as e:
+            if attempt == DRIVE_RETRIES:
+                raise
+            reason, retry_after = type(e).__name__, ""
+
+        delay = (
+            float(retry_after)
+            if retry_after.isdigit()
+            else random.uniform(0, RETRY_BASE_SEC * 2**attempt)
+        )
+        logger.info("🔁 Drive %s: повтор %d через %.2f с", reason, attempt + 1, delay)
+        await asyncio.sleep(delay)
+    raise AssertionError("unreachable")
 
-def _select_reader(mime_type: str):
-    """Подбирает ридер по MIME."""
-    return {
-        "text/plain": TxtReader(),
-        "application/pdf": PdfReader(),
-        "application/vnd.openxmlformats-officedocument.wordprocessingml.document": DocxReader(),
-        "text/csv": CsvReader(),
-        "application/vnd.ms-excel": CsvReader(),
-        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": ExcelReader(),
-    }.get(mime_type)
+
+async def _rate_limited(resp: httpx.Response) -> bool:
+    """403 из-за квоты (userRateLimitExceeded / rateLimitExceeded)?"""
+    if resp.status_code != 403:
+        return False
+    await resp.aread()  # у stream-ответа тело ещё не прочитано
+    try:
+        errors = resp.json()["error"]["errors"]
+        return any(e.get("reason") in RATE_LIMIT_REASONS for e in errors)
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return False
+
+
+def _download_slots() -> _LoopSlots:
+    loop = asyncio.get_running_loop()
+    if loop not in _slots:
+        _slots[loop] = (
+            asyncio.Semaphore(DRIVE_GLOBAL_CONCURRENCY),
+            weakref.WeakValueDictionary(),
+        )
+    return _slots[loop]
@@ -0,0 +1,191 @@
+"""
+app/services/ingest_pipeline.py
+
+Конвейер загрузки файлов Google Drive в базу знаний.
+
+    поиск → скачивание (несколько параллельно) → извлечение текста и нарезка
+          → запись (эмбеддинг, upsert — store_documents_async)
+
+Стадии связаны очередями ограниченного размера: файл уходит на следующую
+стадию, как только готов, а быстрые стадии ждут медленные (backpressure).
+Поэтому первый файл попадает в базу, пока остальные ещё качаются.
+
+В памяти одновременно лежит лишь несколько файлов, сколько бы их ни было
+в запросе. Текст файла режется на чанки по страницам и листам, не
+собираясь в одну строку.
+
+CPU-работа идёт вне event loop: парсинг и нарезка — в пуле процессов,
+модель и запись в базу — в пуле потоков.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Sequence, Tuple
+
+from app.core.chunking import FileChunks
+from app.core.config import DRIVE_USER_CONCURRENCY
+from app.core.http_client import get_http_client
+from app.core.logging_config import get_logger
+from app.core.vector_store import store_documents_async
+from app.services.google_drive import (
+    auth_headers,
+    download_file,
+    extract_chunks,
+    find_drive_files,
+    track_api_calls,
+)
+from app.services.sync_manifest import SyncManifest
+
+logger = get_logger(__name__)
+
+QUEUE_SIZE = 4  # файлов в очереди между стадиями
+INDEX_BATCH = 4  # сколько готовых файлов записывать одним вызовом store
+
+_DONE = object()  # маркер конца очереди
+
+
+@dataclass
+class IngestReport:
+    found: int = 0  # файлов к загрузке после фильтров
+    read: int = 0  # скачано и извлечён текст
+    stored: int = 0  # актуальны в базе знаний
+    first_stored_sec: float | None = None  # от старта до первого файла в базе
+    total_sec: float = 0.0
+
+
+async def ingest_drive_files(
+    access_token: str,
+    user_id: int,
+    on_progress: Callable[[str], Awaitable[None]],
+    *,
+    file_names: Sequence[str] | None = None,
+    folder_names: Sequence[str] | None = None,
+    recursive_folders: Sequence[str] | None = None,
+    manifest: SyncManifest | None = None,
+) -> IngestReport:
+    """
+    Находит файлы (см. find_drive_files) и прогоняет каждый через конвейер.
+    Отпечатки записанных файлов фиксируются в манифесте сразу после записи.
+    """
+    started = time.perf_counter()
+    report = IngestReport()
+    headers = auth_headers(access_token)
+    api_calls = track_api_calls()
+
+    client = get_http_client()  # общий keep-alive HTTP/2 клиент
+    metas = await find_drive_files(
+        client,
+        headers,
+        on_progress,
+        file_names=file_names,
+        folder_names=folder_names,
+        recursive_folders=recursive_folders,
+        manifest=manifest,
+    )
+    report.found = len(metas)
+    if not metas:
+        logger.info("📊 Drive API: листинг %d запросов", api_calls["list"])
+        return report
+
+    todo: asyncio.Queue[dict] = asyncio.Queue()
+    for meta in metas:
+        todo.put_nowait(meta)
+    downloaded: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    extracted: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    # ── стадия 1: скачивание ──────────────────────────────────────────────
+    async def download() -> None:
+        while not todo.empty():
+            meta = todo.get_nowait()
+            await on_progress(f"🔍 Читаю: {meta['name']}")
+            content = await download_file(client, headers, meta, user_id)
+            if content is None:
+                await on_progress(f"⚠️ Пропущен: {meta['name']}")
+                continue
+            await downloaded.put((meta, content))
+
+    async def download_all() -> None:
+        # общие лимиты процесса держат семафоры внутри download_file
+        workers = min(DRIVE_USER_CONCURRENCY, len(metas))
+        await asyncio.gather(*(download() for _ in range(workers)))
+        await downloaded.put(_DONE)
+
+    # ── стадия 2: извлечение текста и нарезка ─────────────────────────────
+    async def extract() -> None:
+        while (item := await downloaded.get()) is not _DONE:
+            meta, content = item
+            chunks = await extract_chunks(meta, content, user_id)
+            del item, content  # байты файла больше не нужны
+            if chunks is None:
+                await on_progress(f"⚠️ Пропущен: {meta['name']}")
+                continue
+            report.read += 1
+            if manifest is not None:
+                manifest.stage(meta)
+            await extracted.put((meta, chunks))
+        await extracted.put(_DONE)
+
+    # ── стадия 3: эмбеддинг и запись ─────────────────────────────
+    async def index() -> None:
+        finished = False
+        while not finished:
+            batch = [await extracted.get()]
+            while len(batch) < INDEX_BATCH and not extracted.empty():
+                batch.append(extracted.get_nowait())
+            if batch[-1] is _DONE:  # маркер всегда последний
+                finished = True
+                batch.pop()
+            if batch:
+                await _store(batch)
+
+    async def _store(batch: List[Tuple[dict, FileChunks]]) -> None:
+        try:
+            stored = await store_documents_async([chunks for _, chunks in batch])
+            if manifest is not None:
+                await manifest.commit(stored)
+        except Exception as e:
+            logger.error("❌ Ошибка записи в базу знаний: %s", e)
+            for meta, _ in batch:
+                await on_progress(f"❌ Не сохранён: {meta['name']}")
+            return
+
+        if stored and report.first_stored_sec is None:
+            report.first_stored_sec = time.perf_counter() - started
+        report.stored += len(stored)
+        for meta, _ in batch:
+            if meta["id"] in stored:
+                await on_progress(f"✅ В базе: {meta['name']}")
+            else:
+                await on_progress(f"⏭ Лимит файлов, пропущен: {meta['name']}")
+
+    tasks = [asyncio.create_task(c) for c in (download_all(), extract(), index())]
+    try:
+        await asyncio.gather(*tasks)
+    finally:  # ошибка в одной стадии не должна оставить другие висеть
+        for task in tasks:
+            task.cancel()
+
+    report.total_sec = time.perf_counter() - started
+    logger.info(
+        "📊 Drive API: листинг %d, скачивание %d запросов",
+        api_calls["list"],
+        api_calls["download"],
+    )
+    logger.info(
+        "🏁 user %s: найдено %d, прочитано %d, в базе %d; первый файл через %s, "
+        "всего %.1f с",
+        user_id,
+        report.found,
+        report.read,
+        report.stored,
+        (
+            f"{report.first_stored_sec:.1f} с"
+            if report.first_stored_sec is not None
+            else "—"
+        ),
+        report.total_sec,
+    )
+    return report
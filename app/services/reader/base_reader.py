@@ -1,10 +1,32 @@
+import asyncio
 from abc import ABC, abstractmethod
+from typing import Iterator, NamedTuple
+
+
+class Segment(NamedTuple):
+    """Кусок текста файла и откуда он (страница, лист, диапазон абзацев)."""
+
+    text: str
+    source: str = ""
 
 
 class BaseReader(ABC):
     @abstractmethod
+    def segments(self, file_bytes: bytes) -> Iterator[Segment]:
+        """
+        Лениво отдаёт текст файла сегментами (по страницам, листам, блокам
+        абзацев) — файл целиком в одну строку не собирается.
+        """
+
+    def extract(self, file_bytes: bytes) -> str:
+        """
+        Синхронно извлекает весь текст файла одной строкой.
+        """
+        return "\n".join(s.text for s in self.segments(file_bytes))
+
     async def read(self, file_bytes: bytes) -> str:
         """
         Асинхронно читает содержимое файла и возвращает его как текст.
+        Парсинг идёт в пуле потоков, чтобы не блокировать event loop.
         """
-        pass
+        return await asyncio.to_thread(self.extract, file_bytes)
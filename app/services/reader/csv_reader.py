@@ -1,15 +1,29 @@
-from io import BytesIO
+import csv
+import io
+from typing import Iterator
 
-import pandas as pd
+from .base_reader import BaseReader, Segment
+from .row_blocks import RowBudget, row_blocks
 
-from .base_reader import BaseReader
+SNIFF_BYTES = 16 * 1024  # по началу файла определяем разделитель
 
 
 class CsvReader(BaseReader):
-    async def read(self, file_bytes: bytes) -> str:
+    def segments(self, file_bytes: bytes) -> Iterator[Segment]:
         """
-        Читает CSV-файл из байтов, возвращает его как текст
-        (разделитель автоматически определяется pandas).
+        Потоково читает CSV (stdlib csv, разделитель определяется по началу
+        файла) и отдаёт блоками строк с повторённым заголовком, не больше
+        MAX_TABLE_ROWS строк.
         """
-        df = pd.read_csv(BytesIO(file_bytes), nrows=2000)  # safety-лимит
-        return df.to_csv(index=False)
+        sample = bytes(file_bytes[:SNIFF_BYTES]).decode("utf-8-sig", errors="ignore")
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+
+        # лимит поля по умолчанию — 128 КБ, длинная ячейка валила весь файл
+        csv.field_size_limit(max(csv.field_size_limit(), len(file_bytes)))
+        text = io.TextIOWrapper(
+            io.BytesIO(file_bytes), encoding="utf-8-sig", errors="replace", newline=""
+        )
+        yield from row_blocks(RowBudget().take(csv.reader(text, dialect)))
@@ -1,12 +1,30 @@
 import io
+from typing import Iterator
 
 from docx import Document
 
-from .base_reader import BaseReader
+from .base_reader import BaseReader, Segment
+
+BLOCK_CHARS = 8000  # примерный размер сегмента из подряд идущих абзацев
 
 
 class DocxReader(BaseReader):
-    async def read(self, file_bytes: bytes) -> str:
+    def segments(self, file_bytes: bytes) -> Iterator[Segment]:
+        """Блоки подряд идущих абзацев, в source — их номера."""
         file_stream = io.BytesIO(file_bytes)
         doc = Document(file_stream)
-        return "\n".join(p.text for p in doc.paragraphs if p.text)
+
+        block: list[str] = []
+        size = first = 0
+        for n, p in enumerate(doc.paragraphs, start=1):
+            if not p.text:
+                continue
+            if not block:
+                first = n
+            block.append(p.text)
+            size += len(p.text)
+            if size >= BLOCK_CHARS:
+                yield Segment("\n".join(block), f"абз. {first}–{n}")
+                block, size = [], 0
+        if block:
+            yield Segment("\n".join(block), f"абз. {first}–{n}")
@@ -1,23 +1,28 @@
-from io import BytesIO
+import io
+from typing import Iterator
 
-import pandas as pd
+from openpyxl import load_workbook
 
-from .base_reader import BaseReader
+from .base_reader import BaseReader, Segment
+from .row_blocks import RowBudget, row_blocks
 
 
 class ExcelReader(BaseReader):
-    async def read(self, file_bytes: bytes) -> str:
+    def segments(self, file_bytes: bytes) -> Iterator[Segment]:
         """
-        Читает Excel-файл, собирая ВСЕ листы.
-        Каждый лист помечается заголовком === Лист: <имя> ===,
-        а данные выводятся в CSV-формате (с заголовками колонок).
+        Читает Excel-файл построчно (openpyxl read-only), собирая ВСЕ листы.
+        Каждый блок строк помечается заголовком === Лист: <имя> === и
+        строкой заголовков колонок, данные — в CSV-формате. Строк на все
+        листы вместе — не больше MAX_TABLE_ROWS.
         """
-        # sheet_name=None => получаем словарь {имя_листа: DataFrame}
-        sheets = pd.read_excel(BytesIO(file_bytes), sheet_name=None, nrows=1000)
-
-        parts: list[str] = []
-        for sheet_name, df in sheets.items():
-            parts.append(f"=== Лист: {sheet_name} ===")
-            parts.append(df.to_csv(index=False))  # сохраняем заголовки колонок
-
-        return "\n".join(parts)
+        wb = load_workbook(io.BytesIO(file_bytes), read_only=True, data_only=True)
+        budget = RowBudget()
+        try:
+            for ws in wb.worksheets:
+                yield from row_blocks(
+                    budget.take(ws.iter_rows(values_only=True), f"лист {ws.title}"),
+                    title=f"=== Лист: {ws.title} ===\n",
+                    where=f"лист {ws.title}",
+                )
+        finally:
+            wb.close()
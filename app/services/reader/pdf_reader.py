@@ -1,12 +1,14 @@
+from typing import Iterator
+
 import fitz  # PyMuPDF
 
-from .base_reader import BaseReader
+from .base_reader import BaseReader, Segment
 
 
 class PdfReader(BaseReader):
-    async def read(self, file_bytes: bytes) -> str:
-        text = ""
+    def segments(self, file_bytes: bytes) -> Iterator[Segment]:
+        """Одна страница — один сегмент."""
         with fitz.open(stream=file_bytes, filetype="pdf") as doc:
             for page in doc:
-                text += page.get_text()
-        return text
+                if text := page.get_text():
+                    yield Segment(text, f"стр. {page.number + 1}")
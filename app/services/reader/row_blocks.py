@@ -0,0 +1,92 @@
+"""
+Нарезка таблиц на блоки строк для CSV- и Excel-читателей.
+
+Каждый блок — заголовок таблицы плюс целые строки, всего не длиннее
+BLOCK_CHARS (но хотя бы одна строка),
+поэтому после нарезки (chunk_size=1000) блок становится одним чанком:
+строки не рвутся посередине, а в каждом чанке видно, что значат колонки.
+
+Число строк на файл ограничено MAX_TABLE_ROWS (RowBudget): иначе 5 МБ
+xlsx разворачивается в десятки тысяч блоков, и все они ложатся в память
+и в эмбеддинг.
+"""
+
+import csv
+import io
+from typing import Iterable, Iterator, Optional, Sequence
+
+from app.core.config import MAX_TABLE_ROWS
+from app.core.logging_config import get_logger
+
+from .base_reader import Segment
+
+logger = get_logger(__name__)
+
+BLOCK_CHARS = 900  # меньше chunk_size, с запасом на заголовок файла
+
+
+class RowBudget:
+    """Общий на файл лимит строк таблиц; обрезку пишет в лог один раз."""
+
+    def __init__(self, limit: int = MAX_TABLE_ROWS) -> None:
+        self.limit = limit
+        self.left = limit
+        self.truncated = False
+
+    def take(self, rows: Iterable[Sequence], where: str = "") -> Iterator[Sequence]:
+        for row in rows:
+            if self.limit and self.left <= 0:
+                if not self.truncated:
+                    self.truncated = True
+                    logger.warning(
+                        "✂️ Таблица обрезана: больше %d строк (%s)",
+                        self.limit,
+                        where or "CSV",
+                    )
+                return
+            self.left -= 1
+            yield row
+
+
+def _line(row: Sequence) -> str:
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerow("" if v is None else v for v in row)
+    return buf.getvalue()
+
+
+def row_blocks(
+    rows: Iterable[Sequence], title: str = "", where: str = ""
+) -> Iterator[Segment]:
+    """
+    Отдаёт таблицу блоками строк в CSV-виде; первая непустая строка —
+    заголовок, он повторяется в начале каждого блока (после title).
+    Источник сегмента — «<where>, строки a–b» (номера строк таблицы).
+    """
+    head: Optional[str] = None
+    block: list[str] = []
+    size = first = last = 0
+
+    def flush() -> Segment:
+        source = f"строки {first}–{last}"
+        return Segment(title + head + "".join(block), f"{where}, {source}".lstrip(", "))
+
+    for n, row in enumerate(rows, start=1):
+        if not any(v not in (None, "") for v in row):
+            continue
+        line = _line(row)
+        if head is None:
+            head = line
+            continue
+        if block and size + len(line) > BLOCK_CHARS:
+            yield flush()
+            block = []
+        if not block:
+            first = n
+            size = len(title) + len(head)
+        block.append(line)
+        size += len(line)
+        last = n
+    if block:
+        yield flush()
+    elif head is not None:  # таблица из одного заголовка
+        yield Segment(title + head, where)
@@ -1,6 +1,26 @@
-from .base_reader import BaseReader
+import codecs
+from typing import Iterator
+
+from .base_reader import BaseReader, Segment
+
+BLOCK_BYTES = 64 * 1024  # декодируем и отдаём файл блоками по границам строк
 
 
 class TxtReader(BaseReader):
-    async def read(self, file_bytes: bytes) -> str:
-        return file_bytes.decode("utf-8", errors="ignore")
+    def segments(self, file_bytes: bytes) -> Iterator[Segment]:
+        """Блоки целых строк, в source — их номера."""
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        tail = ""
+        line = 1
+        view = memoryview(file_bytes)
+        for lo in range(0, len(view), BLOCK_BYTES):
+            final = lo + BLOCK_BYTES >= len(view)
+            text = tail + decoder.decode(view[lo : lo + BLOCK_BYTES], final=final)
+            cut = len(text) if final else text.rfind("\n") + 1
+            if cut <= 0:  # строка длиннее блока — копим дальше
+                tail = text
+                continue
+            block, tail = text[:cut], text[cut:]
+            lines = block.count("\n")
+            yield Segment(block, f"строки {line}–{line + max(lines - 1, 0)}")
+            line += lines
@@ -0,0 +1,101 @@
+"""
+app/services/sync_manifest.py
+
+Манифест синхронизации Google Drive для каждого пользователя.
+
+Для каждого уже проиндексированного файла хранится его отпечаток из
+метаданных Drive (modifiedTime, md5Checksum, size). Повторный /load_drive
+скачивает и индексирует только файлы, чей отпечаток изменился.
+
+Отпечатки лежат в каталоге файлов (колонка indexed_file.fingerprint);
+старые JSON-манифесты (SYNC_MANIFEST_DIR/<user_id>.json) переносятся
+туда при первой загрузке.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Dict, Iterable
+
+from app.core import file_catalog
+from app.core.config import SYNC_MANIFEST_DIR
+from app.core.logging_config import get_logger
+from app.core.vector_store import known_files
+
+logger = get_logger(__name__)
+
+FINGERPRINT_FIELDS = ("modifiedTime", "md5Checksum", "size")
+
+
+def fingerprint(meta: dict) -> Dict[str, str]:
+    """Отпечаток файла из метаданных Drive (отсутствующие поля — пустые строки)."""
+    return {f: str(meta.get(f, "")) for f in FINGERPRINT_FIELDS}
+
+
+class SyncManifest:
+    """
+    Манифест одного пользователя.
+
+    find_drive_files спрашивает is_unchanged(), конвейер загрузки помечает
+    прочитанные файлы через stage() и после записи в базу знаний
+    фиксирует их через commit().
+    """
+
+    def __init__(self, user_id: int, entries: Dict[str, Dict[str, str]]) -> None:
+        self.user_id = user_id
+        self.entries = entries
+        self._staged: Dict[str, Dict[str, str]] = {}
+
+    @classmethod
+    async def load(cls, user_id: int) -> "SyncManifest":
+        entries = {
+            f.file_id: json.loads(f.fingerprint)
+            for f in await known_files(user_id)
+            if f.fingerprint
+        }
+        manifest = cls(user_id, entries)
+        await manifest._migrate_json()
+        return manifest
+
+    async def _migrate_json(self) -> None:
+        """Переносит отпечатки из старого JSON-манифеста в каталог и удаляет файл."""
+        path = SYNC_MANIFEST_DIR / f"{self.user_id}.json"
+        if not path.exists():
+            return
+        try:
+            legacy = json.loads(path.read_text(encoding="utf-8"))
+        except Exception as e:
+            logger.warning("⚠️ Манифест %s повреждён, пропускаю: %s", path, e)
+            legacy = {}
+        moved = {fid: fp for fid, fp in legacy.items() if fid not in self.entries}
+        await file_catalog.set_fingerprints(
+            self.user_id, {fid: json.dumps(fp) for fid, fp in moved.items()}
+        )
+        self.entries.update(moved)
+        path.unlink(missing_ok=True)
+        logger.info(
+            "🗂 user %s: манифест перенесён в каталог (%d файлов)",
+            self.user_id,
+            len(moved),
+        )
+
+    def is_unchanged(self, meta: dict) -> bool:
+        fp = fingerprint(meta)
+        # без md5 и времени изменения сравнивать нечего — считаем изменённым
+        if not fp["md5Checksum"] and not fp["modifiedTime"]:
+            return False
+        return self.entries.get(meta["id"]) == fp
+
+    def stage(self, meta: dict) -> None:
+        self._staged[meta["id"]] = fingerprint(meta)
+
+    async def commit(self, file_ids: Iterable[str]) -> None:
+        """Переносит отпечатки сохранённых файлов в манифест и в каталог."""
+        done: Dict[str, Dict[str, str]] = {}
+        for file_id in file_ids:
+            if fp := self._staged.pop(file_id, None):
+                done[file_id] = fp
+        self.entries.update(done)
+        await file_catalog.set_fingerprints(
+            self.user_id, {fid: json.dumps(fp) for fid, fp in done.items()}
+        )
@@ -1,31 +1,47 @@
+import asyncio
+import html
 import re
-from typing import List
-
-import tiktoken
-
-from app.ai.groq_config import chat_completion
+import time
+from contextlib import aclosing
+from typing import AsyncIterator, List, NamedTuple, Sequence
+
+from langchain_core.documents import Document
+
+from app.ai.groq_config import chat_completion, chat_completion_stream
+from app.ai.prompt_budget import Candidate, plan_prompt
+from app.core.answer_cache import answer_cache, context_fingerprint
+from app.core.cache import TTLCache
+from app.core.config import (
+    QUERY_TRANSLATION,
+    TRANSLATION_CACHE_SIZE,
+    TRANSLATION_CACHE_TTL_SEC,
+    TRANSLATION_WAIT_MS,
+)
 from app.core.logging_config import get_logger
-from app.core.vector_store import load_vector_db
+from app.core.tokenizer import count_tokens
+from app.core.vector_store import (
+    embed_query,
+    lexical_search,
+    match_files,
+    normalize_query,
+    similarity_search_many,
+)
 
 LLAMA_MODEL = "llama-3.3-70b-versatile"
 MAX_CTX_TOKENS = 131_072  # полное окно модели
 MAX_OUTPUT_TOKENS = 32_768  # лимит Groq на «completion»
-
-try:
-    _enc = tiktoken.encoding_for_model(LLAMA_MODEL)
-except KeyError:  # fallback для новых моделей
-    _enc = tiktoken.get_encoding("cl100k_base")
-
-
-def _count_tokens(text: str) -> int:
-    return len(_enc.encode(text))
+RESERVED_OUT = 1024  # хотим ≤1024 токенов на ответ
 
 
 def convert_md_to_html(text: str) -> str:
     """
     Преобразует **жирный** и *курсив* из Markdown в HTML,
-    чтобы Telegram правильно отобразил.
+    чтобы Telegram правильно отобразил. Символы <, >, & экранируются —
+    иначе Telegram отклонит сообщение с parse_mode=HTML.
+    Пары маркеров не переходят через перевод строки, поэтому текст,
+    разрезанный по строкам, даёт корректный HTML в каждой части.
     """
+    text = html.escape(text, quote=False)
     # сначала жирный, потом курсив, чтобы не пересекались
     text = re.sub(r"\*\*(.+?)\*\*", r"<b>\1</b>", text)
     text = re.sub(r"\*(.+?)\*", r"<i>\1</i>", text)
@@ -35,13 +51,38 @@ def convert_md_to_html(text: str) -> str:
 logger = get_logger(__name__)
 
 
-def _translate_ru_to_en(text: str) -> str:
+translation_cache: TTLCache[str] = TTLCache(
+    TRANSLATION_CACHE_SIZE, TRANSLATION_CACHE_TTL_SEC, name="translations"
+)
+_translations: set[asyncio.Task] = set()  # опоздавшие переводы дописывают кэш
+
+
+def detect_lang(text: str) -> str:
+    """
+    Язык запроса по алфавиту букв, локально и без моделей:
+    "ru" — почти всё кириллица, "en" — латиница, иначе "mixed".
+    Цифры, коды и знаки не учитываются.
+    """
+    cyr = sum(1 for ch in text if "а" <= ch.lower() <= "я" or ch in "ёЁ")
+    lat = sum(1 for ch in text if "a" <= ch.lower() <= "z")
+    letters = cyr + lat
+    if not letters:
+        return "mixed"
+    if cyr / letters >= 0.9:
+        return "ru"
+    if lat / letters >= 0.9:
+        return "en"
+    return "mixed"
+
+
+async def _translate_ru_to_en(text: str) -> str:
     """
     Одноразовый перевод запроса на английский.
-    Используем Groq — бесплатно и 1-2 токена.
+    Используем Groq — бесплатно и 1-2 токена. Удачный перевод кладётся
+    в translation_cache (его проверяет search_knowledge).
     """
     try:
-        resp = chat_completion(
+        resp = await chat_completion(
             [
                 {"role": "system", "content": "Translate the text to English."},
                 {"role": "user", "content": text},
@@ -49,17 +90,34 @@ def _translate_ru_to_en(text: str) -> str:
             max_tokens=60,
             temperature=0.0,
         )
+        translation_cache.put(normalize_query(text), resp.strip())
         return resp.strip()
     except Exception as e:
         logger.warning("Translation failed: %s", e)
         return ""
 
 
-def search_knowledge(query: str, user_id: int, k: int = 8) -> List[str]:
+# ── гибридный поиск: BM25 + векторы, слияние через reciprocal-rank fusion ──
+RRF_K = 60  # сглаживание рангов в RRF
+LEXICAL_MIN_SCORE = 1.5  # слабее — лексическое совпадение не учитываем
+LEXICAL_STRONG_SCORE = 6.0  # сильнее — хватает без перевода и второго прохода
+
+
+async def search_knowledge(query: str, user_id: int, k: int = 8) -> List[Candidate]:
     """
-    Возвращает релевантные текстовые чанки из базы пользователя.
-    * Если пользователь явно упоминает «файл(ы) по …» — фильтруем по имени.
-    * Если запрос целиком на кириллице, ищем ещё и английскую версию.
+    Возвращает релевантные чанки из базы пользователя (текст, RRF-оценка,
+    токены из метаданных) — лучшие первыми.
+    * Если пользователь явно упоминает «файл(ы) по …» — находим эти файлы
+      по индексу имён и ищем только в них (фильтр по file_id в базе).
+    * Точные совпадения (артикулы, коды, имена) ищем через BM25.
+    * Если запрос на русском (detect_lang) и сильных BM25-совпадений нет,
+      ищем ещё и английскую версию — по QUERY_TRANSLATION: без перевода,
+      перевод с коротким ожиданием (TRANSLATION_WAIT_MS; не успел — ищем
+      без него, а перевод ляжет в кэш) или (для сравнения) сначала перевод.
+      Переведённый ранее запрос берётся из кэша.
+    * Списки объединяются через reciprocal-rank fusion.
+    Поиск по базе (модель, Chroma, BM25) идёт в пуле потоков; все готовые
+    варианты запроса ищутся одним вызовом similarity_search_many.
     """
     q = query.strip()
     words = q.split()
@@ -68,52 +126,119 @@ def search_knowledge(query: str, user_id: int, k: int = 8) -> List[str]:
 
     # ── детектируем подсказку имени файла ───────────────────────────────
     m = re.search(r"(?:файл(?:ы)? по|files? (?:about|on))\s+([\w\-\.\s]+)", q, re.I)
-    filename_hint = m.group(1).strip().lower() if m else None
+    filename_hint = m.group(1).strip() if m else None
+    file_ids = (
+        await asyncio.to_thread(match_files, user_id, filename_hint)
+        if filename_hint
+        else None
+    )
+    if filename_hint and not file_ids:
+        logger.info("📁 Файл по «%s» не найден, ищем по всем", filename_hint)
+
+    # ── лексический поиск (доли миллисекунды) ───────────────────────────
+    lexical = [
+        (doc, score)
+        for doc, score in await asyncio.to_thread(
+            lexical_search, q, user_id, k=k, file_ids=file_ids
+        )
+        if score >= LEXICAL_MIN_SCORE
+    ]
+    strong_lexical = bool(lexical) and lexical[0][1] >= LEXICAL_STRONG_SCORE
 
     # ── готовим список запросов (ru + en) ───────────────────────────────
-    queries = [q]
-    if not re.search(r"[A-Za-z]", q):  # только кириллица
-        en = _translate_ru_to_en(q)
-        if en:
-            queries.append(en)
-
-    db = load_vector_db()
-    results = []
-
-    # ── делаем семантический поиск по каждому запросу ───────────────────
-    for q_ in queries:
-        docs_scores = db.similarity_search_with_relevance_scores(
-            q_,
-            k=k,
-            filter={"user_id": user_id},
-        )
-        results.extend(docs_scores)
-
-    # ── объединяем, фильтруем по имени файла (если был хинт) ─────────────
-    uniq: dict[str, float] = {}  # id -> best_score
-    docs: dict[str, str] = {}  # id -> text
-
-    for doc, score in results:
-        fname = doc.metadata.get("file_name", "").lower()
-        if filename_hint and filename_hint not in fname:
-            continue  # не тот файл
-        doc_id = doc.metadata["file_id"] + doc.page_content[:20]
-        best = uniq.get(doc_id, 0)
-        if score > best:
-            uniq[doc_id] = score
-            docs[doc_id] = doc.page_content
-
-    # ── динамический порог ──────────────────────────────────────────────
+    lang = detect_lang(q)
+    want_en = QUERY_TRANSLATION != "off" and lang == "ru" and not strong_lexical
+    en = translation_cache.get(normalize_query(q)) if want_en else None
+    if want_en and en is None:
+        pending = asyncio.create_task(_translate_ru_to_en(q))
+        if QUERY_TRANSLATION == "blocking":
+            en = await pending
+        else:
+            # пока ждём перевод, эмбеддинг оригинала уже считается (query_cache)
+            warm = asyncio.create_task(asyncio.to_thread(embed_query, q))
+            done, _ = await asyncio.wait({pending}, timeout=TRANSLATION_WAIT_MS / 1000)
+            if done:
+                en = pending.result()
+            else:
+                logger.info(
+                    "🌐 Перевод не успел за %d мс — ищем без него", TRANSLATION_WAIT_MS
+                )
+                _translations.add(pending)
+                pending.add_done_callback(_translations.discard)
+            await warm
+    queries = [q, en] if en else [q]
+
+    # ── динамический порог для векторного поиска ────────────────────────
     min_score = 0.65 if len(words) == 3 else 0.55 if len(words) == 4 else 0.35
 
-    # оставляем только те, что выше порога
-    return [docs[d] for d, s in uniq.items() if s >= min_score][:k]
+    # ── семантический поиск: все варианты запроса одним вызовом ─────────
+    started = time.perf_counter()
+    found = await asyncio.to_thread(
+        similarity_search_many, queries, user_id, k=k, file_ids=file_ids
+    )
+    vector_ms = (time.perf_counter() - started) * 1000
+
+    ranked_lists = [lexical]
+    for results in found:
+        ranked_lists.append(
+            [(doc, score) for doc, score in results if score >= min_score]
+        )
+
+    # ── reciprocal-rank fusion ──────────────────────────────────────────
+    # ключ — id чанка в базе: начала текста совпадают, например, у всех
+    # блоков одной таблицы (заголовок листа и строка шапки)
+    fused: dict[str, float] = {}  # id -> rrf
+    docs: dict[str, Document] = {}  # id -> чанк
+    for ranked in ranked_lists:
+        for rank, (doc, _) in enumerate(ranked):
+            fused[doc.id] = fused.get(doc.id, 0.0) + 1 / (RRF_K + rank + 1)
+            docs[doc.id] = doc
+
+    logger.info(
+        "🔎 Поиск: bm25 %d%s, векторных запросов %d (язык %s, перевод %s) за %.0f мс, "
+        "файлов в фильтре %s, итог %d",
+        len(lexical),
+        " (сильное совпадение)" if strong_lexical else "",
+        len(queries),
+        lang,
+        QUERY_TRANSLATION,
+        vector_ms,
+        len(file_ids) if file_ids else "все",
+        len(fused),
+    )
+    best = sorted(fused, key=fused.__getitem__, reverse=True)[:k]
+    return [
+        Candidate(docs[d].page_content, fused[d], docs[d].metadata.get("tokens"), d)
+        for d in best
+    ]
 
 
 MAX_MSGS = 6
 
+SYSTEM_WITH_CONTEXT = (
+    "Ты полезный AI-ассистент. Используй контекст из файлов Google Диска "
+    "для точных, кратких и понятных ответов. Если необходимо задавай уточняющие вопросы"
+    "для выдачи более точных ответов. Пиши пошаговые стратегии, идеи и решения для поставленных вопросов."
+)
+SYSTEM_PLAIN = (
+    "Ты полезный AI-ассистент. Отвечай кратко и понятно на основе истории диалога."
+)
+
+
+class _Prompt(NamedTuple):
+    messages: list[dict]
+    max_tokens: int
+    prompt_tokens: int
+    cache_key: tuple[str, Sequence[float]] | None  # (контекст, вектор вопроса)
+    cached: str | None  # ответ из кэша — модель не вызываем
+
 
-def generate_reply(history: list[dict], user_id: int) -> str:
+async def _build_messages(history: list[dict], user_id: int) -> _Prompt:
+    """
+    Собирает промпт (RAG-контекст + история) и лимит токенов ответа.
+    Если в кэше ответов есть тот же (почти) вопрос к тому же найденному
+    контексту и той же истории в промпте — возвращает ответ оттуда.
+    """
     latest_user_input = (
         next((m["text"] for m in reversed(history) if m["role"] == "user"), "...")
         .strip()
@@ -123,78 +248,82 @@ def generate_reply(history: list[dict], user_id: int) -> str:
     logger.info("Пользовательский ввод: %s", latest_user_input)
 
     # ── RAG-контекст ───────────────────────────────────────────────
-    context_chunks = search_knowledge(latest_user_input, user_id)
-    if context_chunks:
-        context_block = "Контекст:\n" + "\n\n".join(context_chunks)
-        system_prompt = (
-            "Ты полезный AI-ассистент. Используй контекст из файлов Google Диска "
-            "для точных, кратких и понятных ответов. Если необходимо задавай уточняющие вопросы"
-            "для выдачи более точных ответов. Пиши пошаговые стратегии, идеи и решения для поставленных вопросов.\n\n"
-            + context_block
-        )
-    else:
-        system_prompt = "Ты полезный AI-ассистент. Отвечай кратко и понятно на основе истории диалога."
+    context_chunks = await search_knowledge(latest_user_input, user_id)
+
+    # ── бюджет токенов: какие чанки и сообщения влезают в окно ────────
+    base_prompt = SYSTEM_WITH_CONTEXT if context_chunks else SYSTEM_PLAIN
+    plan = await asyncio.to_thread(
+        plan_prompt,
+        base_prompt,
+        context_chunks,
+        history[-MAX_MSGS:],
+        window=MAX_CTX_TOKENS,
+        reserved_out=RESERVED_OUT,
+        max_output=MAX_OUTPUT_TOKENS,
+    )
+    logger.info("📐 Бюджет: %s", plan.describe(MAX_CTX_TOKENS))
+
+    # ── кэш ответов: только для вопросов с найденным контекстом ───────
+    # история входит в ключ: «а подробнее?» зависит от предыдущих сообщений
+    cache_key = None
+    if context_chunks and answer_cache.enabled:
+        vector = await asyncio.to_thread(embed_query, latest_user_input)
+        context = context_fingerprint((c.id for c in context_chunks), plan.history[:-1])
+        cache_key = (context, vector)
+        cached = answer_cache.get(user_id, *cache_key)
+        if cached is not None:
+            logger.info("💾 Ответ из кэша (user %s)", user_id)
+            return _Prompt([], 0, 0, cache_key, cached)
 
     # ── messages ──────────────────────────────────────────────────
+    system_prompt = base_prompt
+    if plan.chunks:
+        system_prompt += "\n\nКонтекст:\n" + "\n\n".join(plan.chunks)
     messages = [{"role": "system", "content": system_prompt}]
-    for msg in history[-MAX_MSGS:]:
-        messages.append({"role": msg["role"], "content": msg["text"].strip()})
+    for msg in plan.history:
+        messages.append({"role": msg["role"], "content": msg["text"]})
 
     logger.info("Сообщения для Groq: %s", messages)
 
-    # ── вызов Groq ────────────────────────────────────────────────
-    RESERVED_OUT = 1024  # хотим ≤1024 токенов на ответ
-    MAX_PROMPT = MAX_CTX_TOKENS - RESERVED_OUT
+    return _Prompt(messages, plan.max_tokens, plan.prompt_tokens, cache_key, None)
 
-    def _messages_tokens(msgs: list[dict]) -> int:
-        return sum(_count_tokens(m["content"]) + 4 for m in msgs) + 2
 
-    # — динамическая усадка промпта —
-    while True:
-        prompt_tokens = _messages_tokens(messages)
-        if prompt_tokens <= MAX_PROMPT:
-            break
+def _remember(prompt: _Prompt, user_id: int, answer: str) -> None:
+    """Кладёт полученный от модели ответ в кэш ответов."""
+    answer = answer.strip()
+    if prompt.cache_key is None or not answer:
+        return
+    tokens = prompt.prompt_tokens + count_tokens(answer)
+    answer_cache.put(user_id, *prompt.cache_key, answer, tokens)
 
-        # 1) убираем самое старое сообщение истории
-        if len(messages) > 2:
-            messages.pop(1)  # messages[0] — system
-            continue
 
-        # 2) режем последний чанк контекста
-        if "Контекст:" in messages[0]["content"]:
-            parts = messages[0]["content"].split("\n\n")
-            if len(parts) > 2:  # «Контекст:\n» + ≥1 чанка
-                parts.pop()
-                messages[0]["content"] = "\n\n".join(parts)
-                continue
+GENERATION = dict(
+    temperature=0.7,
+    top_p=0.9,
+    frequency_penalty=0.25,  # мягко подавляем повторы
+)
 
-        # 3) край: грубо обрезаем строку
-        messages[0]["content"] = messages[0]["content"][:8000] + "…"
-        break
 
-    # свободные токены и лимит вывода
-    free_tokens = MAX_CTX_TOKENS - _messages_tokens(messages)
-    max_tokens = min(RESERVED_OUT, free_tokens - 1, MAX_OUTPUT_TOKENS)
-
-    logger.info(
-        "prompt %d токенов, свободно %d, запрашиваю %d",
-        MAX_CTX_TOKENS - free_tokens,
-        free_tokens,
-        max_tokens,
-    )
-
-    try:
-        answer = chat_completion(
-            messages,
-            max_tokens=max_tokens,
-            temperature=0.7,
-            top_p=0.9,
-            frequency_penalty=0.25,  # мягко подавляем повторы
+async def generate_reply_stream(
+    history: list[dict], user_id: int
+) -> AsyncIterator[str]:
+    """
+    Ответ модели по мере генерации — сырой Markdown-текст кусками
+    (ответ из кэша — одним куском). Ошибки Groq пробрасываются вызывающему.
+    """
+    prompt = await _build_messages(history, user_id)
+    if prompt.cached is not None:
+        yield prompt.cached
+        return
+
+    parts = []
+    # aclosing: если нас закроют раньше, поток Groq и его слот закрываются сразу
+    async with aclosing(
+        chat_completion_stream(
+            prompt.messages, max_tokens=prompt.max_tokens, **GENERATION
         )
-    except Exception as e:
-        logger.exception("Groq error: %s", e)
-        return "⚠️ Не удалось получить ответ модели. Попробуйте ещё раз."
-
-    answer = convert_md_to_html(answer.strip())
-    logger.info("Ответ от Groq: %s", answer)
-    return answer or "🤖 Пока не знаю, как ответить."
+    ) as stream:
+        async for delta in stream:
+            parts.append(delta)
+            yield delta
+    _remember(prompt, user_id, "".join(parts))  # только полностью полученный
@@ -1,9 +1,12 @@
+import asyncio
+
 from telegram import Update
 from telegram.ext import ContextTypes
 
+from app.core import file_catalog
 from app.core.logging_config import get_logger
 from app.core.state import clear_history
-from app.core.vector_store import load_vector_db
+from app.core.vector_store import delete_user_documents
 
 logger = get_logger(__name__)
 
@@ -17,12 +20,14 @@ async def cmd_clear_knowledge(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     logger.info("📛 Пользователь %s вызвал очистку своих данных", telegram_id)
 
     try:
-        db = load_vector_db()
-        logger.info("🔍 Загружено документов: %d", len(db._collection.get()["ids"]))
-
         # Удаляем документы из векторной базы
-        db._collection.delete(where={"user_id": telegram_id})
-        logger.info("🧹 Удалены документы с telegram_id=%s", telegram_id)
+        await asyncio.to_thread(delete_user_documents, telegram_id)
+        # вместе с каталогом уходят и отпечатки Drive — иначе /load_drive
+        # посчитает файлы неизменёнными
+        files = await file_catalog.clear_user(telegram_id)
+        logger.info(
+            "🧹 Удалены документы с telegram_id=%s (файлов: %d)", telegram_id, files
+        )
 
         # Удаляем историю из Redis
         await clear_history(telegram_id)
@@ -1,23 +1,14 @@
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from app.core.vector_store import load_vector_db
+from app.core.vector_store import list_user_file_names
 
 
 async def cmd_list_files(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    db = load_vector_db()
-    if db is None:
-        await update.message.reply_text("❌ Векторная база данных не найдена.")
-        return
 
     try:
-        results = db._collection.get(include=["metadatas"], where={"user_id": user_id})
-        metadatas = results.get("metadatas", [])
-
-        file_names = sorted(
-            {meta.get("file_name") or meta["file_id"] for meta in metadatas}
-        )
+        file_names = await list_user_file_names(user_id)
 
         if not file_names:
             await update.message.reply_text("ℹ️ Вы ещё не загружали файлы.")
@@ -5,8 +5,8 @@ from telegram import Update
 from telegram.ext import ContextTypes
 
 from app.core.logging_config import get_logger
-from app.core.vector_store import store_documents_async
-from app.services.google_drive import read_files_from_drive
+from app.services.ingest_pipeline import ingest_drive_files
+from app.services.sync_manifest import SyncManifest
 
 logger = get_logger(__name__)
 
@@ -29,6 +29,7 @@ async def cmd_load_drive(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     • all                → считываем все поддерживаемые файлы
     • имена файлов       → считываем только их
     • имена папок (slash)→ считываем файлы из этих папок
+    • Папка/**           → то же, вместе с подпапками
     • можно комбинировать (файлы + папки)
     """
     telegram_id = update.effective_user.id
@@ -42,17 +43,22 @@ async def cmd_load_drive(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
             "  /load_drive all — считать все файлы\n"
             "  /load_drive file1.pdf, file2.docx — конкретные файлы\n"
             "  /load_drive Папка1/, Папка2/ — все файлы из папок\n"
+            "  /load_drive Папка/** — файлы из папки и её подпапок\n"
             "Можно комбинировать: Папка/, отчет.docx"
         )
         return
 
     arg_str = raw_parts[1].strip()
+    recursive_folders: list[str] = []
     if arg_str.lower() == "all":
         file_names = folder_names = None
     else:
         items = [i.strip() for i in arg_str.split(",") if i.strip()]
+        recursive_folders = [i[:-3] for i in items if i.endswith("/**")]
+        items = [i for i in items if not i.endswith("/**")]
         file_names = [i for i in items if not i.endswith("/")]
         folder_names = [i.rstrip("/") for i in items if i.endswith("/")]
+        folder_names += recursive_folders
         if not file_names and not folder_names:
             await update.message.reply_text(
                 "⚠️ Не удалось распознать ни файлов, ни папок."
@@ -84,31 +90,31 @@ async def cmd_load_drive(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     await update.message.reply_text("🔄 Начинаю чтение файлов…")
 
-    # 3️⃣  Читаем файлы
+    # 3️⃣  Читаем и сохраняем файлы конвейером: каждый файл попадает в базу,
+    #     не дожидаясь остальных
+    manifest = await SyncManifest.load(telegram_id)  # неизменённые файлы пропустим
     try:
-        files = await read_files_from_drive(
+        report = await ingest_drive_files(
             access_token=access_token,
             user_id=telegram_id,
             on_progress=progress,
             file_names=file_names,
             folder_names=folder_names,
+            recursive_folders=recursive_folders,
+            manifest=manifest,
         )
     except Exception as e:
-        logger.error("❌ Ошибка чтения: %s", e)
+        logger.error("❌ Ошибка загрузки: %s", e)
         await update.message.reply_text("❌ Произошла ошибка при чтении файлов.")
         return
 
-    if not files:
-        await update.message.reply_text("⚠️ Файлы не найдены.")
+    if not report.found:
+        await update.message.reply_text("⚠️ Новых или изменённых файлов не найдено.")
         return
 
-    await update.message.reply_text(f"📚 Считано файлов: {len(files)}")
-    await update.message.reply_text("💾 Сохраняю данные в базу знаний…")
-
-    # 4️⃣  Сохраняем в векторное хранилище
-    try:
-        await store_documents_async(files)
-        await update.message.reply_text("✅ Файлы успешно сохранены в базу знаний!")
-    except Exception as e:
-        logger.error("❌ Ошибка при сохранении: %s", e)
-        await update.message.reply_text("❌ Ошибка при сохранении в базу знаний.")
+    if report.stored:
+        await update.message.reply_text(
+            f"✅ Сохранено в базу знаний: {report.stored} из {report.found}"
+        )
+    else:
+        await update.message.reply_text("⚠️ Ни один файл не удалось сохранить.")
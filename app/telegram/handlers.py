@@ -1,13 +1,13 @@
-import asyncio
 import traceback
+from contextlib import aclosing
 
 from telegram import Update
-from telegram.constants import ParseMode
+from telegram.error import TelegramError
 from telegram.ext import CommandHandler, ContextTypes, MessageHandler, filters
 
 from app.core.logging_config import get_logger
 from app.core.state import get_history, push_history
-from app.telegram.ai_reply import generate_reply
+from app.telegram.ai_reply import generate_reply_stream
 from app.telegram.bot import app_tg
 from app.telegram.commands import (
     cmd_clear_knowledge,
@@ -19,6 +19,7 @@ from app.telegram.commands import (
     cmd_show_email,
     cmd_start,
 )
+from app.telegram.stream_reply import StreamingReply
 
 logger = get_logger(__name__)
 
@@ -35,9 +36,6 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
     )
 
 
-MAX_TG_CHARS = 4096  # лимит Telegram
-
-
 async def msg_ai(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     user_text = update.message.text
     user_id = update.effective_user.id
@@ -48,16 +46,28 @@ async def msg_ai(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     await push_history(user_id, "user", user_text)
     history = await get_history(user_id)
 
-    loop = asyncio.get_running_loop()
-    answer = await loop.run_in_executor(None, generate_reply, history, user_id)
-    await push_history(user_id, "assistant", answer)
-
-    # ── отправка длинного текста без ошибки 400 ──
-    for i in range(0, len(answer), MAX_TG_CHARS):
+    # ── ответ по мере генерации: одно сообщение, правки на месте ──
+    reply = StreamingReply(update.message)
+    await reply.start()
+    try:
+        # aclosing: при выходе из цикла по ошибке поток Groq закрывается сразу
+        async with aclosing(generate_reply_stream(history, user_id)) as stream:
+            async for delta in stream:
+                await reply.push(delta)
+        answer = await reply.finish()
+    except TelegramError as e:
+        # модель отвечает, но Telegram не принял правку сообщения
+        logger.exception("Telegram error: %s", e)
         await update.message.reply_text(
-            answer[i : i + MAX_TG_CHARS],
-            parse_mode=ParseMode.HTML,  # ← важно!
+            "⚠️ Не удалось показать ответ. Попробуйте ещё раз."
         )
+        return
+    except Exception as e:
+        logger.exception("Groq error: %s", e)
+        await reply.fail("⚠️ Не удалось получить ответ модели. Попробуйте ещё раз.")
+        return
+
+    await push_history(user_id, "assistant", answer)
 
 
 def register_handlers():
@@ -0,0 +1,155 @@
+"""
+app/telegram/stream_reply.py
+
+Потоковый ответ в Telegram: плейсхолдер сразу, затем тот же message
+правится по мере генерации.
+
+  • правки не чаще TG_EDIT_INTERVAL_SEC (лимиты Telegram на редактирование),
+    первая — сразу с первым текстом: это и есть задержка, которую видит
+    пользователь; на RetryAfter правки откладываются, текст копится;
+  • у каждой части свой сырой Markdown, в HTML (convert_md_to_html) она
+    переводится целиком при каждой правке — теги всегда закрыты;
+  • когда часть подходит к MAX_TG_CHARS, она режется по переводу строки
+    (пары ** и * строку не пересекают), остаток уходит в новое сообщение;
+  • если Telegram не принял HTML (перекрёстные теги из «**a *b** c*»),
+    правка повторяется простым текстом — ответ не обрывается;
+  • сбой промежуточной правки (таймаут, сеть) только пишется в лог —
+    текст покажет следующая; ошибку пробрасывает лишь финальная правка.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import html
+import re
+import time
+
+from telegram import Message
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from app.core.config import TG_EDIT_INTERVAL_SEC
+from app.core.logging_config import get_logger
+from app.telegram.ai_reply import convert_md_to_html
+
+logger = get_logger(__name__)
+
+MAX_TG_CHARS = 4096  # лимит Telegram
+SPLIT_AT = MAX_TG_CHARS - 256  # запас на HTML-теги и экранирование
+PLACEHOLDER = "…"
+EMPTY_ANSWER = "🤖 Пока не знаю, как ответить."
+_TAG = re.compile(r"<[^>]+>")
+
+
+def _plain(html_text: str) -> str:
+    """HTML → простой текст: теги убираем, сущности раскрываем."""
+    return html.unescape(_TAG.sub("", html_text))
+
+
+class StreamingReply:
+    """Собирает ответ из кусков и показывает его правками сообщений."""
+
+    def __init__(self, reply_to: Message) -> None:
+        self._reply_to = reply_to
+        self._msg: Message | None = None
+        self._part = ""  # сырой текст текущего сообщения
+        self._shown = ""  # что в нём сейчас видно (HTML)
+        self._done: list[str] = []  # сырой текст закрытых сообщений
+        self._next_edit = 0.0  # monotonic, раньше не правим
+        self._started = time.perf_counter()
+        self.first_token_ms: float | None = None
+
+    @property
+    def text(self) -> str:
+        """Весь ответ (сырой Markdown)."""
+        return "".join(self._done) + self._part
+
+    async def start(self) -> None:
+        self._started = time.perf_counter()
+        self._msg = await self._reply_to.reply_text(PLACEHOLDER)
+
+    async def push(self, delta: str) -> None:
+        self._part += delta
+        while len(convert_md_to_html(self._part)) > SPLIT_AT:
+            await self._split()
+        if time.monotonic() >= self._next_edit:
+            await self._show()
+
+    async def finish(self) -> str:
+        """Дописывает последнюю часть без троттлинга, возвращает весь ответ."""
+        if not self.text.strip():
+            self._part = EMPTY_ANSWER
+        await self._show(force=True)
+        logger.info(
+            "💬 Ответ: %d символов, %d сообщ., первый текст через %s",
+            len(self.text),
+            len(self._done) + 1,
+            f"{self.first_token_ms:.0f} мс" if self.first_token_ms else "—",
+        )
+        return self.text
+
+    async def fail(self, text: str) -> None:
+        """Ошибка генерации: что успели показать — оставляем, плюс сообщение."""
+        self._part = (self._part + "\n\n" if self._part.strip() else "") + text
+        await self._show(force=True)
+
+    # ── внутреннее ───────────────────────────────────────────────────────
+    async def _split(self) -> None:
+        """Закрывает текущее сообщение по границе строки, остаток — в новое."""
+        cut = self._part.rfind("\n", 0, SPLIT_AT) + 1  # перевод строки — в head
+        while cut > 0 and len(convert_md_to_html(self._part[:cut])) > SPLIT_AT:
+            cut = self._part.rfind("\n", 0, cut - 1) + 1
+        limit = SPLIT_AT
+        while cut <= 0:  # одна длинная строка — режем по пробелу или жёстко
+            cut = self._part.rfind(" ", 0, limit) + 1 or limit
+            # после экранирования (&, <, >) HTML бывает намного длиннее текста
+            html_len = len(convert_md_to_html(self._part[:cut]))
+            if html_len > SPLIT_AT and cut > 1:
+                limit = max(1, min(cut - 1, cut * SPLIT_AT // html_len))
+                cut = 0
+        head, self._part = self._part[:cut], self._part[cut:]
+        self._done.append(head)
+        await self._edit(convert_md_to_html(head.rstrip()), force=True)
+        self._shown = ""
+        self._msg = await self._reply_to.reply_text(PLACEHOLDER)
+
+    async def _show(self, force: bool = False) -> None:
+        html_text = convert_md_to_html(self._part.rstrip()) or PLACEHOLDER
+        if html_text == self._shown:
+            return
+        await self._edit(html_text, force=force)
+
+    async def _send(self, html_text: str) -> None:
+        """Правка в HTML; если разметку не разобрали — тот же текст без неё."""
+        try:
+            await self._msg.edit_text(html_text, parse_mode=ParseMode.HTML)
+        except BadRequest as e:
+            if "can't parse entities" not in str(e).lower():
+                raise
+            logger.info("⚠️ Telegram не принял разметку (%s) — шлю текстом", e)
+            await self._msg.edit_text(_plain(html_text))
+
+    async def _edit(self, html_text: str, force: bool) -> None:
+        try:
+            await self._send(html_text)
+        except RetryAfter as e:
+            logger.info("⏳ Telegram просит паузу %s с", e.retry_after)
+            self._next_edit = time.monotonic() + float(e.retry_after)
+            if not force:
+                return
+            # финальный текст не теряем: ждём и пробуем ещё раз
+            await asyncio.sleep(float(e.retry_after))
+            await self._send(html_text)
+        except TelegramError as e:
+            if isinstance(e, BadRequest) and "not modified" in str(e).lower():
+                pass
+            elif force:
+                raise
+            else:  # промежуточная правка: покажем текст следующей
+                logger.warning("⚠️ Правка сообщения не удалась: %s", e)
+                self._next_edit = time.monotonic() + TG_EDIT_INTERVAL_SEC
+                return
+        self._shown = html_text
+        self._next_edit = time.monotonic() + TG_EDIT_INTERVAL_SEC
+        if self.first_token_ms is None and html_text != PLACEHOLDER:
+            self.first_token_ms = (time.perf_counter() - self._started) * 1000
@@ -1,7 +1,8 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 
 from app.core.lifespan import lifespan
 from app.core.logging_config import setup_logging
+from app.core.readiness import note_request
 from app.routes import setup_routes
 
 # Настройка логирования (до всех импортов, где используется logger)
@@ -10,6 +11,13 @@ setup_logging()
 # Создание FastAPI-приложения с поддержкой lifespan
 api = FastAPI(title="AI Telegram Bot", lifespan=lifespan)
 
+
+@api.middleware("http")
+async def log_first_request(request: Request, call_next):
+    note_request(request.url.path)
+    return await call_next(request)
+
+
 # Подключение маршрутов
 setup_routes(api)
 
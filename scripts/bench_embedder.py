@@ -0,0 +1,104 @@
+"""
+scripts/bench_embedder.py
+
+Бенчмарк бэкендов эмбеддера (torch / int8 / onnx) на CPU.
+
+Для каждого бэкенда в отдельном процессе:
+  1) загружаем модель (время загрузки);
+  2) индексация: N чанков ≈1000 символов батчами EMBED_BATCH_SIZE —
+     пропускная способность, чанков/с;
+  3) Q одиночных запросов — задержка p50/p99, как у search_knowledge.
+
+Запуск (из корня проекта):
+    python -m scripts.bench_embedder --docs 512 --queries 100 --threads 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import random
+import time
+
+import numpy as np
+
+WORDS = (
+    "договор поставка срок оплата отчёт склад заявка регламент сотрудник "
+    "клиент проект бюджет счёт акт услуга report delivery invoice order"
+).split()
+
+
+def _text(rng: random.Random, chars: int) -> str:
+    words = []
+    while sum(len(w) + 1 for w in words) < chars:
+        words.append(rng.choice(WORDS))
+    return " ".join(words)
+
+
+def _run(backend: str, docs: int, queries: int, threads: int, out) -> None:
+    from app.core.config import EMBED_BATCH_SIZE, EMBEDDING_DIR, EMBEDDING_MODEL
+    from app.core.embedder import build_embedder
+
+    rng = random.Random(42)
+    chunks = [_text(rng, 1000) for _ in range(docs)]
+    qs = [_text(rng, 60) for _ in range(queries)]
+
+    started = time.perf_counter()
+    emb = build_embedder(
+        backend,
+        EMBEDDING_MODEL,
+        EMBEDDING_DIR,
+        batch_size=EMBED_BATCH_SIZE,
+        threads=threads,
+    )
+    load_s = time.perf_counter() - started
+
+    emb.embed_query("прогрев")
+    started = time.perf_counter()
+    emb.embed_documents(chunks)
+    docs_per_s = docs / (time.perf_counter() - started)
+
+    lat = []
+    for q in qs:
+        t0 = time.perf_counter()
+        emb.embed_query(q)
+        lat.append((time.perf_counter() - t0) * 1000)
+
+    out.send(
+        {
+            "backend": backend,
+            "load_s": load_s,
+            "docs_per_s": docs_per_s,
+            "p50_ms": float(np.percentile(lat, 50)),
+            "p99_ms": float(np.percentile(lat, 99)),
+        }
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк бэкендов эмбеддера")
+    parser.add_argument("--docs", type=int, default=256, help="чанков для индексации")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--threads", type=int, default=0, help="0 — по умолчанию")
+    parser.add_argument("--backends", default="torch,int8,onnx")
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")  # у каждого бэкенда свои потоки
+    print(f"{'backend':<10}{'load s':>10}{'docs/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for backend in args.backends.split(","):
+        parent, child = ctx.Pipe()
+        proc = ctx.Process(
+            target=_run,
+            args=(backend, args.docs, args.queries, args.threads, child),
+        )
+        proc.start()
+        r = parent.recv()
+        proc.join()
+        print(
+            f"{r['backend']:<10}{r['load_s']:>10.1f}{r['docs_per_s']:>10.1f}"
+            f"{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
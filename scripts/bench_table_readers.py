@@ -0,0 +1,138 @@
+"""
+scripts/bench_table_readers.py
+
+Сравнение читателей таблиц: прежний путь через pandas (DataFrame целиком →
+to_csv одной строкой) и потоковые CsvReader/ExcelReader (stdlib csv,
+openpyxl read-only, блоки строк с повторённым заголовком).
+
+Генерирует большие CSV и XLSX, затем каждый вариант в отдельном процессе:
+время разбора и пиковая память процесса (вместе с импортом библиотек).
+pandas нужен только для сравнения — в зависимостях бота его больше нет.
+
+Запуск (из корня проекта):
+    python -m scripts.bench_table_readers --csv-rows 200000 --xlsx-rows 50000
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import random
+import resource
+import tempfile
+import time
+from pathlib import Path
+
+COLUMNS = ["Артикул", "Наименование", "Склад", "Остаток", "Цена", "Комментарий"]
+WORDS = "кабель медный провод розетка щиток автомат лампа короб муфта".split()
+
+
+def _rows(n: int, rng: random.Random):
+    for i in range(n):
+        yield [
+            f"AB-{i:06d}",
+            " ".join(rng.choices(WORDS, k=3)),
+            rng.choice(["Москва", "Казань", "Пермь"]),
+            rng.randint(0, 500),
+            round(rng.uniform(10, 5000), 2),
+            rng.choice(["", "под заказ", "новинка", "снят с производства"]),
+        ]
+
+
+def _make_csv(path: Path, n: int) -> None:
+    import csv
+
+    with path.open("w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(COLUMNS)
+        w.writerows(_rows(n, random.Random(1)))
+
+
+def _make_xlsx(path: Path, n: int) -> None:
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Остатки")
+    ws.append(COLUMNS)
+    for row in _rows(n, random.Random(2)):
+        ws.append(row)
+    wb.save(path)
+
+
+# ─── варианты разбора (каждый — в своём процессе) ───────────────────────────
+def _pandas(path: str) -> tuple[int, int]:
+    from io import BytesIO
+
+    import pandas as pd
+
+    data = Path(path).read_bytes()
+    if path.endswith(".csv"):
+        text = pd.read_csv(BytesIO(data)).to_csv(index=False)
+    else:
+        sheets = pd.read_excel(BytesIO(data), sheet_name=None)
+        text = "\n".join(
+            f"=== Лист: {name} ===\n" + df.to_csv(index=False)
+            for name, df in sheets.items()
+        )
+    return 1, len(text)
+
+
+def _stream(path: str) -> tuple[int, int]:
+    from app.services.reader.csv_reader import CsvReader
+    from app.services.reader.excel_reader import ExcelReader
+
+    data = Path(path).read_bytes()
+    reader = CsvReader() if path.endswith(".csv") else ExcelReader()
+    segments = chars = 0
+    for seg in reader.segments(data):  # как split_segments: по одному сегменту
+        segments += 1
+        chars += len(seg.text)
+    return segments, chars
+
+
+def _run(kind: str, path: str, out) -> None:
+    started = time.perf_counter()
+    segments, chars = (_pandas if kind == "pandas" else _stream)(path)
+    out.send(
+        {
+            "sec": time.perf_counter() - started,
+            "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "segments": segments,
+            "chars": chars,
+        }
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк читателей CSV/XLSX")
+    parser.add_argument("--csv-rows", type=int, default=200_000)
+    parser.add_argument("--xlsx-rows", type=int, default=50_000)
+    parser.add_argument("--readers", default="pandas,stream")
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")  # чистый процесс на замер
+    with tempfile.TemporaryDirectory() as tmp:
+        files = [Path(tmp) / "sample.csv", Path(tmp) / "sample.xlsx"]
+        _make_csv(files[0], args.csv_rows)
+        _make_xlsx(files[1], args.xlsx_rows)
+
+        print(
+            f"{'file':<8}{'MB':>7}{'reader':>9}{'sec':>8}"
+            f"{'peak RSS MB':>13}{'segments':>10}{'chars':>12}"
+        )
+        for path in files:
+            size_mb = path.stat().st_size / 2**20
+            for kind in args.readers.split(","):
+                parent, child = ctx.Pipe()
+                proc = ctx.Process(target=_run, args=(kind, str(path), child))
+                proc.start()
+                r = parent.recv()
+                proc.join()
+                print(
+                    f"{path.suffix[1:]:<8}{size_mb:>7.1f}{kind:>9}{r['sec']:>8.2f}"
+                    f"{r['rss_mb']:>13.0f}{r['segments']:>10}{r['chars']:>12}"
+                )
+
+
+if __name__ == "__main__":
+    main()
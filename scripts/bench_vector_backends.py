@@ -0,0 +1,145 @@
+"""
+scripts/bench_vector_backends.py
+
+Сравнение бэкендов векторной базы: Chroma и mmap (int8 / float16).
+
+Для каждого бэкенда в отдельном процессе:
+  1) пишем N нормированных векторов размерности 768 (как у e5-base),
+     раскиданных по USERS пользователям;
+  2) заново открываем хранилище и делаем Q запросов top-k с фильтром
+     по user_id (как search_knowledge);
+  3) печатаем размер на диске, прирост RSS после открытия + запросов
+     и задержку запроса p50/p99.
+
+Запуск (из корня проекта):
+    python -m scripts.bench_vector_backends --n 50000 --users 100 --queries 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+DIM = 768
+
+
+def _rss_mb() -> float:
+    """Текущий RSS процесса (Linux, /proc/self/statm)."""
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def _dir_mb(path: Path) -> float:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file()) / 2**20
+
+
+def _open(backend: str, path: Path):
+    if backend == "chroma":
+        import chromadb
+
+        return chromadb.PersistentClient(path=str(path))
+
+    from app.core.mmap_store import MmapClient
+
+    dtype, _, search = backend.removeprefix("mmap-").partition("-")
+    return MmapClient(path, dtype=dtype, search=search or "exact")
+
+
+def _run(backend: str, n: int, users: int, queries: int, k: int, out) -> None:
+    rng = np.random.default_rng(42)
+    vecs = rng.standard_normal((n, DIM), dtype=np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    user_ids = rng.integers(0, users, n)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / backend
+
+        # 1) запись
+        col = _open(backend, path).get_or_create_collection("bench")
+        started = time.perf_counter()
+        for lo in range(0, n, 1000):
+            hi = min(lo + 1000, n)
+            col.upsert(
+                ids=[f"c{i}" for i in range(lo, hi)],
+                embeddings=vecs[lo:hi].tolist(),
+                documents=[f"chunk {i}" for i in range(lo, hi)],
+                metadatas=[
+                    {"user_id": int(u), "file_id": f"f{i % 10}"}
+                    for i, u in zip(range(lo, hi), user_ids[lo:hi])
+                ],
+            )
+        write_s = time.perf_counter() - started
+        if hasattr(col, "close"):
+            col.close()
+        del col
+
+        # 2) открытие + запросы
+        rss_before = _rss_mb()
+        col = _open(backend, path).get_collection("bench")
+        q_vecs = rng.standard_normal((queries, DIM), dtype=np.float32)
+        q_vecs /= np.linalg.norm(q_vecs, axis=1, keepdims=True)
+        lat = []
+        for q, u in zip(q_vecs, rng.integers(0, users, queries)):
+            t0 = time.perf_counter()
+            col.query(
+                query_embeddings=[q.tolist()],
+                n_results=k,
+                where={"user_id": int(u)},
+                include=["documents", "metadatas", "distances"],
+            )
+            lat.append((time.perf_counter() - t0) * 1000)
+
+        out.send(
+            {
+                "backend": backend,
+                "disk_mb": _dir_mb(path),
+                "rss_mb": _rss_mb() - rss_before,
+                "write_s": write_s,
+                "p50_ms": float(np.percentile(lat, 50)),
+                "p99_ms": float(np.percentile(lat, 99)),
+            }
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк бэкендов векторной базы")
+    parser.add_argument("--n", type=int, default=20000, help="число векторов")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument(
+        "--backends",
+        default="chroma,mmap-int8,mmap-float16,mmap-int8-coarse",
+        help="через запятую: chroma, mmap-<int8|float16>[-coarse]",
+    )
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")  # чистый процесс — честный RSS
+    print(
+        f"{'backend':<18}{'disk MB':>10}{'RSS MB':>10}{'write s':>10}"
+        f"{'p50 ms':>10}{'p99 ms':>10}"
+    )
+    for backend in args.backends.split(","):
+        parent, child = ctx.Pipe()
+        proc = ctx.Process(
+            target=_run,
+            args=(backend, args.n, args.users, args.queries, args.k, child),
+        )
+        proc.start()
+        r = parent.recv()
+        proc.join()
+        print(
+            f"{r['backend']:<18}{r['disk_mb']:>10.1f}{r['rss_mb']:>10.1f}"
+            f"{r['write_s']:>10.2f}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
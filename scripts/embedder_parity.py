@@ -0,0 +1,96 @@
+"""
+scripts/embedder_parity.py
+
+Проверка совпадения векторов оптимизированных бэкендов эмбеддера
+(int8, onnx) с эталонным PyTorch.
+
+Для набора русских и английских текстов (короткие запросы и чанки
+размером с реальные) считается косинус между вектором бэкенда и
+эталонным; дополнительно сверяется top-1 поиска запросов по чанкам.
+Код возврата 1, если минимальный косинус ниже порога или top-1 разошёлся.
+
+Запуск (из корня проекта):
+    python -m scripts.embedder_parity --backends int8,onnx
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+
+import numpy as np
+
+from app.core.config import EMBED_BATCH_SIZE, EMBEDDING_DIR, EMBEDDING_MODEL
+from app.core.embedder import build_embedder
+
+# минимально допустимый косинус с эталоном
+THRESHOLDS = {"onnx": 0.999, "int8": 0.97}
+
+QUERIES = [
+    "какие сроки поставки по договору",
+    "сколько стоит подписка на год",
+    "кто отвечает за отчёт за март",
+    "how do I reset my password",
+    "артикул AB-1234 наличие на складе",
+]
+
+PASSAGES = [
+    "Сроки поставки по договору составляют 30 календарных дней с момента "
+    "оплаты. При задержке поставщик выплачивает неустойку 0,1 % в день.",
+    "Годовая подписка стоит 12 000 рублей, ежемесячная — 1 200 рублей. "
+    "Скидка для образовательных организаций — 20 %.",
+    "Ответственный за ежемесячную отчётность — финансовый отдел. Отчёт за "
+    "март сдаёт Иванова А. С. до 10 апреля.",
+    "To reset your password open Settings → Security and press "
+    "“Reset password”. A confirmation link will be sent to your e-mail.",
+    "Артикул AB-1234: кабель медный, остаток на складе 120 шт., "
+    "следующая поставка ожидается в конце месяца.",
+    # длинный чанк, как после splitter (≈1000 символов)
+    " ".join(["Раздел регламента описывает порядок согласования заявок."] * 18),
+]
+
+
+def _matrix(vectors) -> np.ndarray:
+    m = np.asarray(vectors, dtype=np.float32)
+    return m / np.linalg.norm(m, axis=1, keepdims=True)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Сверка эмбеддеров с PyTorch")
+    parser.add_argument("--backends", default="int8,onnx")
+    parser.add_argument("--threads", type=int, default=0)
+    args = parser.parse_args()
+
+    def build(backend: str):
+        return build_embedder(
+            backend,
+            EMBEDDING_MODEL,
+            EMBEDDING_DIR,
+            batch_size=EMBED_BATCH_SIZE,
+            threads=args.threads,
+        )
+
+    ref = build("torch")
+    ref_q = _matrix([ref.embed_query(q) for q in QUERIES])
+    ref_p = _matrix(ref.embed_documents(PASSAGES))
+    ref_top = (ref_q @ ref_p.T).argmax(axis=1)
+
+    failed = False
+    for backend in args.backends.split(","):
+        emb = build(backend)
+        q = _matrix([emb.embed_query(t) for t in QUERIES])
+        p = _matrix(emb.embed_documents(PASSAGES))
+        cos = np.concatenate([(q * ref_q).sum(axis=1), (p * ref_p).sum(axis=1)])
+        top_ok = bool(((q @ p.T).argmax(axis=1) == ref_top).all())
+        ok = cos.min() >= THRESHOLDS[backend] and top_ok
+        failed |= not ok
+        print(
+            f"{backend:<6} cos min {cos.min():.5f} mean {cos.mean():.5f}"
+            f" (порог {THRESHOLDS[backend]}), top-1 {'совпал' if top_ok else 'РАЗОШЁЛСЯ'}"
+            f" → {'OK' if ok else 'FAIL'}"
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
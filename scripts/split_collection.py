@@ -0,0 +1,92 @@
+"""
+scripts/split_collection.py
+
+Переносит чанки из общей коллекции Chroma в коллекции по пользователям
+(или по группам пользователей) согласно VECTOR_PARTITION.
+
+Запуск (из корня проекта, с тем же .env, что и у бота):
+    VECTOR_PARTITION=user python -m scripts.split_collection [--drop-source]
+"""
+
+from __future__ import annotations
+
+import argparse
+from collections import defaultdict
+
+from app.core.config import VECTOR_PARTITION
+from app.core.logging_config import get_logger, setup_logging
+from app.core.vector_store import (
+    SHARED_COLLECTION,
+    UPSERT_BATCH_SIZE,
+    load_vector_db,
+    user_collection,
+)
+
+logger = get_logger(__name__)
+
+
+def split_collection(drop_source: bool = False, page_size: int = 1000) -> int:
+    """Копирует чанки постранично; возвращает число перенесённых чанков."""
+    if VECTOR_PARTITION == "shared":
+        raise SystemExit("VECTOR_PARTITION=shared — переносить некуда")
+
+    client = load_vector_db()
+    try:
+        source = client.get_collection(SHARED_COLLECTION)
+    except Exception:
+        logger.info("Общей коллекции «%s» нет — нечего переносить", SHARED_COLLECTION)
+        return 0
+
+    total = source.count()
+    logger.info("🚚 Переношу %d чанков (%s)", total, VECTOR_PARTITION)
+
+    moved = 0
+    for offset in range(0, total, page_size):
+        page = source.get(
+            limit=page_size,
+            offset=offset,
+            include=["documents", "metadatas", "embeddings"],
+        )
+        per_user: dict[int, list[tuple]] = defaultdict(list)
+        for row in zip(
+            page["ids"], page["documents"], page["embeddings"], page["metadatas"]
+        ):
+            per_user[row[3]["user_id"]].append(row)
+
+        for user_id, rows in per_user.items():
+            col = user_collection(user_id)
+            for lo in range(0, len(rows), UPSERT_BATCH_SIZE):
+                ids, docs, vecs, metas = zip(*rows[lo : lo + UPSERT_BATCH_SIZE])
+                col.upsert(
+                    ids=list(ids),
+                    documents=list(docs),
+                    embeddings=[list(v) for v in vecs],
+                    metadatas=list(metas),
+                )
+            moved += len(rows)
+        logger.info("… перенесено %d / %d", moved, total)
+
+    if drop_source:
+        client.delete_collection(SHARED_COLLECTION)
+        logger.info("🗑 Общая коллекция «%s» удалена", SHARED_COLLECTION)
+    return moved
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Разбить общую коллекцию Chroma по пользователям"
+    )
+    parser.add_argument(
+        "--drop-source",
+        action="store_true",
+        help="удалить общую коллекцию после переноса",
+    )
+    args = parser.parse_args()
+
+    setup_logging()
+    moved = split_collection(drop_source=args.drop_source)
+    logger.info("✅ Готово: перенесено %d чанков", moved)
+
+
+if __name__ == "__main__":
+    main()